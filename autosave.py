@@ -0,0 +1,214 @@
+'''
+Autosave of the edited config on a worker thread.
+
+Snapshots are handed over to a single worker thread that writes them to the autosave file of the process
+(autosave_<pid>.yaml in AUTOSAVE_DIR, so that several GUI instances do not overwrite each other), so the caller never waits on the
+disk. Only the latest snapshot is kept: snapshots submitted while the worker is busy replace each other, and a snapshot
+equal to the last written one (same HashTree digest) is not written again.
+The file holds the config and the file it was loaded from, and is removed once the config is saved.
+The autosaves of processes that are no longer running (see stale_autosaves) are offered at the next start.
+'''
+import glob
+import os
+import threading
+from time import time
+
+import yaml
+
+from constants import CACHE_DIR
+from config_diff import hash_tree
+from yaml_io import load_yaml, write_yaml_file
+
+
+
+
+AUTOSAVE_DIR = os.path.join(CACHE_DIR, 'autosave')
+# NB the single autosave file of earlier versions, still offered if it exists
+LEGACY_AUTOSAVE_FILE = os.path.join(CACHE_DIR, 'autosave.yaml')
+
+
+
+
+def autosave_path(pid=None):
+    # the autosave file of a process, this process by default
+    return os.path.join(AUTOSAVE_DIR, 'autosave_%d.yaml' % (os.getpid() if pid is None else pid))
+
+
+def process_running(pid):
+    if pid == os.getpid():
+        # NB an autosave with the PID of this process was left by an earlier process with the same PID
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError: # running, but of another user
+        return True
+    except OSError: # e.g. signals are not supported
+        return False
+    return True
+
+
+def stale_autosaves():
+    '''
+    [Returns]
+        paths of the autosaves of processes that are no longer running, the newest first
+    '''
+    paths = [LEGACY_AUTOSAVE_FILE] if os.path.exists(LEGACY_AUTOSAVE_FILE) else []
+    for path in glob.glob(os.path.join(AUTOSAVE_DIR, 'autosave_*.yaml')):
+        try:
+            pid = int(os.path.basename(path)[len('autosave_'):-len('.yaml')])
+        except ValueError:
+            continue
+        if not process_running(pid):
+            paths.append(path)
+    def modification_time(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError: # removed in the meantime
+            return 0.
+    return sorted(paths, key=modification_time, reverse=True)
+
+
+def remove_autosave(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+
+
+def read_autosave(path):
+    '''
+    [Returns]
+        dictionary with the config, the source file (None if it was never saved) and the time of the autosave,
+        None if there is no (readable) autosave
+    '''
+    try:
+        with open(path, 'r') as autosave_file:
+            autosave = load_yaml(autosave_file)
+    except (OSError, yaml.YAMLError) as error:
+        if os.path.exists(path):
+            print('[read_autosave] Could not read %s: %s' % (path, error))
+        return None
+    if not isinstance(autosave, dict) or not isinstance(autosave.get('config'), dict):
+        return None
+    return autosave
+
+
+
+
+class Autosaver:
+    # marker of a pending removal
+    DISCARD = object()
+
+    def __init__(self, path=None):
+        '''
+        [Args]
+            path: file the snapshots are written to, the autosave file of this process by default
+        '''
+        self.path = autosave_path() if path is None else path
+        self.condition = threading.Condition()
+        # latest snapshot (config, source) not yet taken by the worker, or DISCARD
+        self.pending = None
+        self.closed = False
+        # digest of the last written snapshot, None if there is no autosave
+        self.written_digest = None
+        # whether the worker is writing or removing the file
+        self.busy = False
+        # NB the worker is only started by the first submit or discard
+        self.thread = None
+
+
+    def start(self):
+        # NB called with the condition held
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='autosave', daemon=True)
+            self.thread.start()
+
+
+    def submit(self, config, source=None):
+        '''
+        Write a snapshot in the background.
+
+        [Args]
+            config: config dictionary, NB it must not be modified afterwards (pass a copy)
+            source: file the config was loaded from or saved to
+        '''
+        with self.condition:
+            self.start()
+            self.pending = (config, source)
+            self.condition.notify_all()
+
+
+    def discard(self):
+        # remove the autosave in the background, e.g. after the config was saved
+        with self.condition:
+            self.start()
+            self.pending = Autosaver.DISCARD
+            self.condition.notify_all()
+
+
+    def flush(self, timeout=5):
+        '''
+        Wait until the pending snapshot is written.
+
+        [Returns]
+            whether it was written within timeout seconds
+        '''
+        with self.condition:
+            return self.condition.wait_for(lambda: self.pending is None and not self.busy, timeout)
+
+
+    def close(self, timeout=5):
+        '''
+        Write the pending snapshot and stop the worker.
+
+        [Returns]
+            whether the worker finished within timeout seconds
+        '''
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is None:
+            return True
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.pending is None: # closed
+                    return
+                pending, self.pending = self.pending, None
+                self.busy = True
+            # NB errors are only reported, the next snapshot is tried again
+            try:
+                if pending is Autosaver.DISCARD:
+                    self.remove()
+                else:
+                    self.write(*pending)
+            except OSError as error:
+                print('[Autosaver.run] Autosave to %s failed: %s' % (self.path, error))
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+
+
+    def write(self, config, source):
+        digest = hash_tree(config).digest
+        if digest == self.written_digest:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # NB no fsync, the autosave is only a fallback and should not stall the disk
+        write_yaml_file({'source': source, 'time': time(), 'config': config}, self.path, sync=False)
+        self.written_digest = digest
+
+
+    def remove(self):
+        remove_autosave(self.path)
+        self.written_digest = None
@@ -0,0 +1,48 @@
+'''
+Throughput of the batched prior sampling of prior_sampling.py, for all free parameters of the default config.
+
+Run from the repository root:
+    python benchmarks/bench_prior_sampling.py [--repeat N]
+'''
+import argparse
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config_handler import ConfigHandler
+from prior_sampling import config_priors, sample_priors
+
+
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help='number of repetitions, the best time is reported')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000], help='numbers of samples per parameter')
+    args = parser.parse_args()
+
+    _, priors = config_priors(ConfigHandler().config)
+    rng = np.random.default_rng(0)
+    print('%d free parameters' % len(priors))
+    print('%10s | %10s %14s' % ('samples', 'time [ms]', 'M samples/s'))
+    for n_samples in args.sizes:
+        elapsed = best_time(lambda: sample_priors(priors, n_samples, rng), args.repeat)
+        print('%10d | %10.2f %14.1f' % (n_samples, elapsed * 1000, len(priors) * n_samples / elapsed / 1e6))
+
+
+
+
+if __name__ == '__main__':
+    main()
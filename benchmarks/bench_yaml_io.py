@@ -0,0 +1,78 @@
+'''
+Read/write throughput of config files for the pure Python and the LibYAML code paths of yaml_io.
+
+Configs of growing size are built by adding species to the default config.
+Run from the repository root:
+    python benchmarks/bench_yaml_io.py [--repeat N]
+'''
+import argparse
+import io
+import os
+import sys
+from time import perf_counter
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config_handler import ConfigHandler, param_dict
+import yaml_io
+
+
+
+
+def build_config(n_species):
+    config = ConfigHandler()
+    composition = config['CHEMICAL COMPOSITION PARAMETERS']
+    for i in range(n_species):
+        formula = 'X%d' % i
+        composition[formula] = param_dict('log-uniform', [-15, 0], 1e-6 * (i + 1), [formula + '_main_HN20_air_C25_R_200', formula + '_UV'])
+    return config.config
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def reference_dump(data):
+    # what ConfigHandler.write_yaml wrote before yaml_io existed
+    return yaml_io.YAML_HEADER + yaml.dump(data, sort_keys=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help='number of repetitions, the best time is reported')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[0, 10, 100, 1000, 5000], help='numbers of added species')
+    args = parser.parse_args()
+
+    print('LibYAML loader: %s, LibYAML dumper: %s' % (yaml_io.SafeLoader is not yaml.SafeLoader, yaml_io.FastDumper is not None))
+    print('%8s %10s | %12s %12s %8s | %13s %12s %8s | %s' % (
+        'species', 'size [kB]', 'read py MB/s', 'read fast', 'speedup', 'write py MB/s', 'write fast', 'speedup', 'identical'))
+
+    for n_species in args.sizes:
+        data = build_config(n_species)
+        reference = reference_dump(data)
+        n_mb = len(reference.encode()) / 1e6
+
+        read_py = best_time(lambda: yaml.safe_load(io.StringIO(reference)), args.repeat)
+        read_fast = best_time(lambda: yaml_io.load_yaml(io.StringIO(reference)), args.repeat)
+        write_py = best_time(lambda: reference_dump(data), args.repeat)
+        write_fast = best_time(lambda: yaml_io.dump_yaml(data, header=True), args.repeat)
+        identical = yaml_io.dump_yaml(data, header=True) == reference
+
+        print('%8d %10.1f | %12.2f %12.2f %7.1fx | %13.2f %12.2f %7.1fx | %s' % (
+            n_species, n_mb * 1e3,
+            n_mb / read_py, n_mb / read_fast, read_py / read_fast,
+            n_mb / write_py, n_mb / write_fast, write_py / write_fast,
+            identical
+        ))
+
+
+
+
+if __name__ == '__main__':
+    main()
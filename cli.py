@@ -0,0 +1,215 @@
+'''
+Command line interface for generating retrieval configs without the GUI.
+NB nothing in here (or in the modules imported here) may import PySide6, the CLI is meant to start fast in job scripts.
+The modules of the heavier subcommands (numpy, multiprocessing, subprocesses) are only imported by their subcommand.
+
+Examples:
+    python cli.py generate -o config.yaml
+    python cli.py generate -i base.yaml -o run_1/ "RUN SETTINGS.live_points=800" "PHYSICAL PARAMETERS.R_pl.truth=1.2"
+    python cli.py get -i config.yaml "RUN SETTINGS.wavelength_range"
+    python cli.py sweep -i base.yaml -s sweep.yaml -o campaign/
+    python cli.py diff -r base.yaml campaign/*.yaml
+    python cli.py validate campaign/
+    python cli.py estimate -i config.yaml
+    python cli.py run -c 4 --max-cores 16 campaign/*.yaml
+'''
+import argparse
+import sys
+
+import yaml
+
+from config_handler import ConfigHandler
+from config_diff import diff, format_path
+from yaml_io import dump_yaml
+
+
+
+
+def parse_override(override):
+    '''
+    Split an override of the form 'section.key=value' into the path and the value.
+    The value is parsed as YAML, so e.g. '800' becomes an int and '[3, 20]' a list.
+    '''
+    path, sep, value = override.partition('=')
+    if sep == '' or path.strip() == '':
+        raise ValueError('[parse_override] Override must have the form section.key=value, got %s.' % override)
+    value = yaml.safe_load(value)
+    if isinstance(value, str):
+        # YAML 1.1 reads e.g. 1e-5 as a string
+        try:
+            value = float(value)
+        except ValueError:
+            pass
+    return path.strip(), value
+
+
+def load_config(path=None):
+    # None means the default config, same as in the GUI
+    return ConfigHandler(path)
+
+
+def generate(args):
+    config = load_config(args.input)
+    for override in args.overrides:
+        config.set_value(*parse_override(override))
+    config.write_yaml(args.output)
+
+
+def get(args):
+    config = load_config(args.input)
+    for path in args.paths:
+        value = config.get_value(path)
+        if isinstance(value, (dict, list)):
+            dump_yaml(value, sys.stdout)
+        else:
+            print(value)
+
+
+def sweep(args):
+    from sweep import run_sweep
+    n_written = run_sweep(load_config(args.input), args.spec, args.output, args.processes, args.chunksize)
+    print('%d configs written to %s' % (n_written, args.output))
+
+
+def compare(args):
+    # the reference tree is hashed once, configs equal to it are recognized by their root digest alone
+    reference = load_config(args.reference).hash_tree()
+    n_different = 0
+    for path in args.configs:
+        changes = diff(reference, load_config(path))
+        if len(changes) == 0:
+            continue
+        n_different += 1
+        print(path)
+        if not args.quiet:
+            for change in changes:
+                print('    %s: %r -> %r' % (format_path(change.path), change.old, change.new))
+    print('%d of %d configs differ from %s' % (n_different, len(args.configs), args.reference), file=sys.stderr)
+
+
+def validate(args):
+    from config_validator import validate_files
+    n_invalid = n_files = 0
+    for path, problems in validate_files(args.configs, args.processes):
+        n_files += 1
+        if len(problems) == 0:
+            continue
+        n_invalid += 1
+        print(path)
+        for problem in problems:
+            print('    %s: %s' % problem)
+    print('%d of %d configs are invalid' % (n_invalid, n_files), file=sys.stderr)
+    if n_invalid != 0:
+        raise ValueError('invalid configs found')
+
+
+def estimate(args):
+    from cost_model import estimate_cost, record_benchmark, get_calibration, summarize, format_seconds
+    from runtime_model import free_parameters, estimate_runtime
+    config = load_config(args.input)
+    if args.measured_memory is not None or args.measured_call_time is not None:
+        if args.measured_memory is None or args.measured_call_time is None:
+            raise ValueError('both --measured-memory and --measured-call-time are needed to record a run')
+        record_benchmark(config.config, args.measured_memory, args.measured_call_time, note=args.note)
+    estimate = estimate_cost(config.config)
+    print(summarize(estimate))
+    runtime = estimate_runtime(config['RUN SETTINGS']['live_points'], len(free_parameters(config.config)), estimate.call_seconds, args.processes)
+    print('%d free parameters, ~%.2g likelihood evaluations, ~%s on %d process%s' % (
+        runtime.n_free, runtime.evaluations, format_seconds(runtime.seconds), args.processes, '' if args.processes == 1 else 'es'))
+    n_runs = get_calibration().n_runs
+    if n_runs == 0:
+        print('uncalibrated: no measured runs, the estimate uses default constants (record runs with --measured-memory and --measured-call-time)', file=sys.stderr)
+    else:
+        print('calibrated with %d measured run%s' % (n_runs, '' if n_runs == 1 else 's'), file=sys.stderr)
+
+
+def run(args):
+    from run_queue import RunQueue, FAILED
+    queue = RunQueue(args.max_cores, None if args.max_memory is None else args.max_memory * 2**20, args.retrieval_command)
+    def report(job):
+        print('%s: %s' % (job.folder, job.state))
+    for path in args.configs:
+        report(queue.submit(path, args.cores))
+    try:
+        queue.run_all(report=report)
+    except KeyboardInterrupt:
+        # NB the jobs run in their own sessions, so they do not get the interrupt themselves
+        queued = queue.queued
+        queue.cancel_all()
+        for job in queued:
+            report(job)
+        queue.run_all(report=report)
+        raise ValueError('runs cancelled')
+    n_failed = sum(job.state == FAILED for job in queue.jobs)
+    print('%d of %d runs failed' % (n_failed, len(queue.jobs)), file=sys.stderr)
+    if n_failed != 0:
+        raise ValueError('failed runs found, see the run_<attempt>.log files in their folders')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Generate and edit retrieval configs without the GUI.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = subparsers.add_parser('generate', help='write a config, optionally with overridden values')
+    generate_parser.add_argument('-i', '--input', help='base config (default: built-in default config)')
+    generate_parser.add_argument('-o', '--output', help='output file or folder (default: ./config.yaml)')
+    generate_parser.add_argument('overrides', nargs='*', help='overrides of the form "section.key=value"')
+    generate_parser.set_defaults(func=generate)
+
+    get_parser = subparsers.add_parser('get', help='print values of a config')
+    get_parser.add_argument('-i', '--input', help='config to read (default: built-in default config)')
+    get_parser.add_argument('paths', nargs='+', help='paths of the form "section.key"')
+    get_parser.set_defaults(func=get)
+
+    sweep_parser = subparsers.add_parser('sweep', help='write one config per point of a parameter sweep')
+    sweep_parser.add_argument('-i', '--input', help='base config (default: built-in default config)')
+    sweep_parser.add_argument('-s', '--spec', required=True, help='sweep spec (YAML), see sweep.py')
+    sweep_parser.add_argument('-o', '--output', required=True, help='output folder for the configs and manifest.csv')
+    sweep_parser.add_argument('-j', '--processes', type=int, help='number of worker processes (default: all cores)')
+    sweep_parser.add_argument('--chunksize', type=int, default=64, help='configs sent to a worker at once')
+    sweep_parser.set_defaults(func=sweep)
+
+    diff_parser = subparsers.add_parser('diff', help='list the values that differ from a reference config')
+    diff_parser.add_argument('-r', '--reference', required=True, help='reference config')
+    diff_parser.add_argument('-q', '--quiet', action='store_true', help='only list the configs that differ')
+    diff_parser.add_argument('configs', nargs='+', help='configs to compare')
+    diff_parser.set_defaults(func=compare)
+
+    validate_parser = subparsers.add_parser('validate', help='check configs and report all problems')
+    validate_parser.add_argument('-j', '--processes', type=int, help='number of worker processes (default: all cores)')
+    validate_parser.add_argument('configs', nargs='+', help='config files or folders of config files')
+    validate_parser.set_defaults(func=validate)
+
+    estimate_parser = subparsers.add_parser('estimate', help='estimate the memory footprint and the runtime of a run')
+    estimate_parser.add_argument('-i', '--input', help='config to estimate (default: built-in default config)')
+    estimate_parser.add_argument('--measured-memory', type=float, help='record a measured run: peak memory in MB')
+    estimate_parser.add_argument('--measured-call-time', type=float, help='record a measured run: time per likelihood call in ms')
+    estimate_parser.add_argument('-j', '--processes', type=int, default=1, help='processes evaluating the likelihood (default: 1)')
+    estimate_parser.add_argument('--note', default='', help='note for the recorded run, e.g. the machine')
+    estimate_parser.set_defaults(func=estimate)
+
+    run_parser = subparsers.add_parser('run', help='run retrievals of configs on this machine, each in its own folder under its output_folder')
+    run_parser.add_argument('-c', '--cores', type=int, default=1, help='cores of every run (default: 1)')
+    run_parser.add_argument('--max-cores', type=int, help='cores of all running runs together (default: all cores)')
+    run_parser.add_argument('--max-memory', type=float, help='estimated memory of all running runs together in MB (default: the available memory)')
+    run_parser.add_argument('--retrieval-command', help='command of a retrieval, the config is appended (default: PYRETLIFE_RETRIEVAL_COMMAND or pyretlife_retrieval)')
+    run_parser.add_argument('configs', nargs='+', help='config files')
+    run_parser.set_defaults(func=run)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except (KeyError, ValueError, TypeError, IndexError, OSError) as error:
+        print('Error: %s' % error, file=sys.stderr)
+        return 1
+    return 0
+
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,178 @@
+'''
+Structural diff of configs.
+
+Every dictionary, list and value of a config gets a digest computed bottom-up (a Merkle tree),
+so two configs (or subtrees) are equal exactly when their digests are, without comparing their contents.
+diff only descends into subtrees whose digests differ, its cost is proportional to the size of the change once the trees exist.
+ConfigHandler caches the tree of each section, see ConfigHandler.hash_tree.
+A tree is a snapshot: it keeps (copies of) the scalars, and the values of dictionaries and lists are rebuilt from them,
+so the values reported by diff are the ones the tree was built from, even if the config was modified in place since.
+'''
+import copy
+import hashlib
+from collections import namedtuple
+
+
+
+
+# scalars of the config that cannot be modified in place, other scalars are copied into the trees
+IMMUTABLE_TYPES = (str, int, float, bool, type(None), bytes)
+
+# a changed value, path is a tuple of keys (list entries by index), old or new is MISSING for added and removed values
+# NB old and new are not shared with the config
+Change = namedtuple('Change', ['path', 'old', 'new'])
+
+
+class Missing:
+    def __repr__(self):
+        return '<missing>'
+
+
+    def __deepcopy__(self, memo):
+        # NB a single instance, changes are checked with "is MISSING"
+        return self
+
+
+MISSING = Missing()
+
+
+
+
+class HashTree:
+    '''
+    Digest of a value of the config, with the trees of its entries if it is a dictionary or a list.
+    '''
+    __slots__ = ['digest', 'scalar', 'children']
+
+    def __init__(self, digest, value, children=None):
+        '''
+        [Args]
+            value: the value, only kept if it is a scalar (children is None)
+        '''
+        self.digest = digest
+        self.scalar = None
+        if children is None:
+            self.scalar = value if isinstance(value, IMMUTABLE_TYPES) else copy.deepcopy(value)
+        self.children = children
+
+
+    @property
+    def value(self):
+        # a new copy of the value the tree was built from
+        if isinstance(self.children, dict):
+            return {key: child.value for key, child in self.children.items()}
+        if isinstance(self.children, list):
+            return [child.value for child in self.children]
+        return self.scalar
+
+
+    def __eq__(self, other):
+        return isinstance(other, HashTree) and self.digest == other.digest
+
+
+    def __hash__(self):
+        return hash(self.digest)
+
+
+
+
+def new_hash():
+    return hashlib.blake2b(digest_size=16)
+
+
+def hash_tree(value):
+    '''
+    Build the HashTree of a value of the config (dictionary, list or scalar).
+    NB the tree is a snapshot, it does not follow later modifications of value
+    '''
+    if isinstance(value, dict):
+        children = {key: hash_tree(child) for key, child in value.items()}
+        return HashTree(combine_dict(children), value, children)
+    if isinstance(value, list):
+        children = [hash_tree(child) for child in value]
+        digest = new_hash()
+        digest.update(b'list')
+        for child in children:
+            digest.update(child.digest)
+        return HashTree(digest.digest(), value, children)
+    return HashTree(hash_scalar(value), value)
+
+
+def hash_scalar(value):
+    # NB numbers are compared exactly like with ==, e.g. an int truth read from YAML equals the float 1.0 written by the GUI,
+    # so integral floats are hashed as ints, while ints are never rounded to floats and distinct ints above 2**53 stay distinct
+    if isinstance(value, bool):
+        text = 'bool:%r' % value
+    elif isinstance(value, int):
+        text = 'int:%d' % value
+    elif isinstance(value, float):
+        text = 'int:%d' % value if value.is_integer() else 'float:%r' % value
+    else:
+        text = '%s:%r' % (type(value).__name__, value)
+    digest = new_hash()
+    digest.update(text.encode())
+    return digest.digest()
+
+
+def combine_dict(children):
+    # dictionaries compare equal regardless of their order, so the entries are sorted by key
+    digest = new_hash()
+    digest.update(b'dict')
+    for key, child in sorted(children.items(), key=lambda item: repr(item[0])):
+        digest.update(hash_scalar(key))
+        digest.update(child.digest)
+    return digest.digest()
+
+
+def diff(old, new, path=()):
+    '''
+    Changes from old to new.
+
+    [Args]
+        old, new: ConfigHandler, HashTree, or plain config values
+        path: prefix of the reported paths
+
+    [Returns]
+        list of Change, in the order of the config
+    '''
+    changes = []
+    diff_trees(as_tree(old), as_tree(new), tuple(path), changes)
+    return changes
+
+
+def as_tree(value):
+    if isinstance(value, HashTree):
+        return value
+    if hasattr(value, 'hash_tree'): # ConfigHandler
+        return value.hash_tree()
+    return hash_tree(value)
+
+
+def diff_trees(old, new, path, changes):
+    if old.digest == new.digest:
+        return
+
+    if isinstance(old.children, dict) and isinstance(new.children, dict):
+        for key, new_child in new.children.items():
+            old_child = old.children.get(key)
+            if old_child is None:
+                changes.append(Change(path + (key,), MISSING, new_child.value))
+            else:
+                diff_trees(old_child, new_child, path + (key,), changes)
+        for key, old_child in old.children.items():
+            if key not in new.children:
+                changes.append(Change(path + (key,), old_child.value, MISSING))
+        return
+
+    if isinstance(old.children, list) and isinstance(new.children, list) and len(old.children) == len(new.children):
+        for i, (old_child, new_child) in enumerate(zip(old.children, new.children)):
+            diff_trees(old_child, new_child, path + (i,), changes)
+        return
+
+    # different types, lists of different length or different values
+    changes.append(Change(path, old.value, new.value))
+
+
+def format_path(path):
+    # same format as ConfigHandler.get_value
+    return '.'.join(str(key) for key in path)
\ No newline at end of file
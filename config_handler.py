@@ -1,8 +1,10 @@
+import copy
 #import pandas as pd
-import yaml
 import os
 
-from constants import PRIOR_PARAM_NAMES
+from constants import PRIOR_PARAM_NAMES, UNITS
+from yaml_io import load_yaml, write_yaml_file
+from config_diff import HashTree, MISSING, hash_tree, combine_dict, diff, format_path
 
 
 
@@ -39,6 +41,131 @@ class ConfigHandler:
 
     def __setitem__(self, key, value):
         self.config[key] = value
+        self.invalidate([key])
+
+
+    @property
+    def config(self):
+        return self._config
+    
+
+    @config.setter
+    def config(self, config):
+        self._config = config
+        # HashTree of each section, built on demand by hash_tree
+        self.section_trees = {}
+
+
+    def invalidate(self, sections=None):
+        '''
+        Drop the cached HashTrees of sections (all by default).
+        Has to be called after modifying a section in place, e.g. config['RUN SETTINGS']['n_layers'] = 50
+        '''
+        if sections is None:
+            self.section_trees.clear()
+            return
+        for section in sections:
+            self.section_trees.pop(section, None)
+
+
+    def hash_tree(self):
+        '''
+        HashTree of the whole config (see config_diff), the trees of the sections are cached until they are invalidated.
+        '''
+        for section, value in self.config.items():
+            if section not in self.section_trees:
+                self.section_trees[section] = hash_tree(value)
+        children = {section: self.section_trees[section] for section in self.config}
+        return HashTree(combine_dict(children), self.config, children)
+
+
+    def get_value(self, path):
+        '''
+        Get a (possibly nested) value of the config.
+
+        [Args]
+            path: keys joined by '.', e.g. 'RUN SETTINGS.live_points'; list entries are addressed by their index
+        '''
+        value = self.config
+        for key in split_path(path):
+            if isinstance(value, list):
+                key = int(key)
+            value = value[key]
+        return value
+    
+
+    def set_value(self, path, value):
+        '''
+        Set a (possibly nested) value of the config, missing dictionaries along the path are created.
+
+        [Args]
+            path: keys joined by '.', see get_value
+            value: new value
+        '''
+        keys = split_path(path)
+        if keys[0] not in ConfigHandler.SECTIONS:
+            raise KeyError('[ConfigHandler.set_value] Unknown section %s.' % keys[0])
+        
+        parent = self.config
+        for key in keys[:-1]:
+            if isinstance(parent, list):
+                parent = parent[int(key)]
+            else:
+                parent = parent.setdefault(key, {})
+        
+        if isinstance(parent, list):
+            parent[int(keys[-1])] = value
+        else:
+            parent[keys[-1]] = value
+        self.invalidate(keys[:1])
+
+
+    def apply_changes(self, changes, reverse=False):
+        '''
+        Apply changes found by config_diff.diff, e.g. to undo or redo edits.
+
+        [Args]
+            changes: list of Change
+            reverse: write the old values instead of the new ones (in reverse order)
+
+        [Returns]
+            set of the sections that were changed
+        '''
+        sections = set()
+        for change in (reversed(changes) if reverse else changes):
+            value = change.old if reverse else change.new
+            parent = self.config
+            for key in change.path[:-1]:
+                parent = parent[key]
+            if value is MISSING:
+                del parent[change.path[-1]]
+            else:
+                # NB copies, the changes may be applied again later
+                parent[change.path[-1]] = copy.deepcopy(value)
+            sections.add(change.path[0])
+        self.invalidate(sections)
+        return sections
+
+
+    def data_file_paths(self):
+        '''
+        Paths of the input spectra as a dictionary name -> path.
+        NB the GUI writes data_files as a dictionary name -> {'path', 'unit'}, the built-in default is a plain list of paths
+        '''
+        data_files = self['GROUND TRUTH DATA']['data_files']
+        if isinstance(data_files, dict):
+            return {name: info['path'] for name, info in data_files.items()}
+        return {os.path.basename(path): path for path in data_files}
+
+
+    def data_file_units(self):
+        '''
+        Units of the input spectra as a dictionary name -> '<wavelength unit>, <flux unit>', the default units for a plain list of paths.
+        '''
+        data_files = self['GROUND TRUTH DATA']['data_files']
+        if isinstance(data_files, dict):
+            return {name: info['unit'] for name, info in data_files.items()}
+        return {os.path.basename(path): '%s, %s' % (UNITS['wavelength']['default'], UNITS['flux']['default']) for path in data_files}
 
 
     def verify_sections(self):
@@ -49,19 +176,28 @@ class ConfigHandler:
 
     def read_yaml(self, yaml_path):
         with open(yaml_path, 'r') as yaml_file:
-            self.config = yaml.safe_load(yaml_file)
+            self.config = load_yaml(yaml_file)
     
 
-    def write_yaml(self, yaml_path=None):
+    def write_yaml(self, yaml_path=None, sync=True):
+        '''
+        Write the config atomically (to a temporary file that is then renamed).
+
+        [Args]
+            yaml_path: file or folder, ./config.yaml by default
+            sync: whether to flush the file to disk before renaming it, can be skipped for files that are easily regenerated
+
+        [Returns]
+            path of the written file
+        '''
         if yaml_path is None:
             yaml_path = os.path.join('./config.yaml')
         elif os.path.isdir(yaml_path):
             yaml_path = os.path.join(yaml_path, 'config.yaml')
         #print(yaml_path)
         
-        with open(yaml_path, 'w') as yaml_file:
-            yaml_file.write('# This config file is generated by a GUI.\n# Editting is discouraged unless you know what you are doing.\n')
-            yaml.dump(self.config, yaml_file, sort_keys=False)
+        write_yaml_file(self.config, yaml_path, header=True, sync=sync)
+        return yaml_path
 
     
     def use_default_config(self):
@@ -121,7 +257,25 @@ class ConfigHandler:
 
 
     def verify_config_integrity(self):
-        pass
+        '''
+        Check types, priors, lines, units and ranges of the config (see config_validator), raises ValueError listing all problems.
+        '''
+        # NB imported here since config_validator imports this module
+        from config_validator import validate_config
+
+        problems = validate_config(self.config)
+        if len(problems) != 0:
+            raise ValueError('[ConfigHandler.verify_config_integrity] Invalid config:\n' + '\n'.join('%s: %s' % problem for problem in problems))
+
+
+
+
+def split_path(path):
+    # NB section names contain spaces but no dots, so '.' can safely separate the keys
+    keys = path.split('.')
+    if '' in keys:
+        raise KeyError('[split_path] Invalid config path %s.' % path)
+    return keys
 
 
 
@@ -164,6 +318,5 @@ if __name__ == '__main__':
     handler.write_yaml()
     ref_handler = ConfigHandler('./reference.yaml')
 
-    for key in handler.config.keys():
-        if handler[key] != ref_handler[key]:
-            print(key)
\ No newline at end of file
+    for change in diff(ref_handler, handler):
+        print('%s: %r -> %r' % (format_path(change.path), change.old, change.new))
\ No newline at end of file
@@ -0,0 +1,326 @@
+'''
+Validation of configs against the options in constants.py.
+
+The schema (prior parameter names, P-T parameterizations, the line name pattern, units, ...) is compiled once,
+lines are looked up in the catalog of the available line data (see line_catalog.py),
+validation then reports every problem of a config rather than stopping at the first one.
+validate_files checks many configs in parallel.
+'''
+import glob
+import math
+import os
+from collections import namedtuple
+from functools import lru_cache
+from multiprocessing import Pool
+
+from constants import SPECIES_NAMES, PRIOR_PARAM_NAMES, PT_PARAMETERIZATIONS, UNITS, WAVELENGTH_LIMITS
+from yaml_io import load_yaml
+from config_handler import ConfigHandler
+from line_catalog import parse_line_name, get_catalog
+
+
+
+
+# path in the format of ConfigHandler.get_value, '' for the config as a whole
+ConfigProblem = namedtuple('ConfigProblem', ['path', 'message'])
+
+# prior kinds whose two parameters are a lower and an upper bound
+BOUNDED_PRIORS = ['uniform', 'fourth-uniform', 'log-uniform']
+# prior kinds whose second parameter is a width
+GAUSSIAN_PRIORS = ['gaussian', 'log-gaussian']
+
+SCATTERING_TYPES = ['Rayleigh', 'thermal', 'direct_light', 'clouds']
+
+
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+
+
+class ConfigValidator:
+    def __init__(self, catalog=None):
+        '''
+        [Args]
+            catalog: LineCatalog of the line data that is available, see line_catalog.py
+        '''
+        self.prior_params = {kind: list(names) for kind, names in PRIOR_PARAM_NAMES.items()}
+        self.parameterizations = {name: list(params) for name, params in PT_PARAMETERIZATIONS.items()}
+        self.wavelength_units = set(UNITS['wavelength']['options'])
+        self.flux_units = set(UNITS['flux']['options'])
+
+        # NB without a catalog, line names are only checked for their format
+        self.catalog = catalog
+
+
+    def validate(self, config):
+        '''
+        [Args]
+            config: config dictionary (e.g. ConfigHandler.config)
+
+        [Returns]
+            list of ConfigProblem, empty if the config is valid
+        '''
+        problems = []
+        if not isinstance(config, dict):
+            return [ConfigProblem('', 'config must be a dictionary')]
+        missing = [section for section in ConfigHandler.SECTIONS if not isinstance(config.get(section), dict)]
+        for section in missing:
+            problems.append(ConfigProblem(section, 'section is missing or not a dictionary'))
+
+        checks = {
+            'GROUND TRUTH DATA': self.check_ground_truth,
+            'RUN SETTINGS': self.check_run_settings,
+            'TEMPERATURE PARAMETERS': self.check_temperature,
+            'PHYSICAL PARAMETERS': self.check_params,
+            'CHEMICAL COMPOSITION PARAMETERS': self.check_composition,
+            'SCATTERING PARAMETERS': self.check_params
+        }
+        for section, check in checks.items():
+            if section not in missing:
+                check(config, section, problems)
+        return problems
+
+
+    def check_ground_truth(self, config, section, problems):
+        data = config[section]
+        if not isinstance(data.get('input_profile'), str):
+            problems.append(ConfigProblem(section + '.input_profile', 'must be a path'))
+
+        data_files = data.get('data_files')
+        if isinstance(data_files, list):
+            for i, path in enumerate(data_files):
+                if not isinstance(path, str):
+                    problems.append(ConfigProblem('%s.data_files.%d' % (section, i), 'must be a path'))
+        elif isinstance(data_files, dict):
+            for name, info in data_files.items():
+                path = '%s.data_files.%s' % (section, name)
+                if not isinstance(info, dict):
+                    problems.append(ConfigProblem(path, 'must have a path and a unit'))
+                    continue
+                if not isinstance(info.get('path'), str):
+                    problems.append(ConfigProblem(path + '.path', 'must be a path'))
+                self.check_data_unit(info.get('unit'), path + '.unit', problems)
+        else:
+            problems.append(ConfigProblem(section + '.data_files', 'must be a list of paths or a dictionary of data files'))
+
+
+    def check_data_unit(self, unit, path, problems):
+        units = unit.split(', ') if isinstance(unit, str) else []
+        if len(units) != 2:
+            problems.append(ConfigProblem(path, 'must be "<wavelength unit>, <flux unit>"'))
+            return
+        if units[0] not in self.wavelength_units:
+            problems.append(ConfigProblem(path, 'unknown wavelength unit %s' % units[0]))
+        if units[1] not in self.flux_units:
+            problems.append(ConfigProblem(path, 'unknown flux unit %s' % units[1]))
+
+
+    def check_run_settings(self, config, section, problems):
+        settings = config[section]
+
+        wl_range = settings.get('wavelength_range')
+        if not (isinstance(wl_range, list) and len(wl_range) == 2 and all(is_number(wl) for wl in wl_range)):
+            problems.append(ConfigProblem(section + '.wavelength_range', 'must be [lower, upper]'))
+        else:
+            if wl_range[0] >= wl_range[1]:
+                problems.append(ConfigProblem(section + '.wavelength_range', 'lower bound must be less than upper bound'))
+            if wl_range[0] < WAVELENGTH_LIMITS[0] or wl_range[1] > WAVELENGTH_LIMITS[1]:
+                problems.append(ConfigProblem(section + '.wavelength_range', 'must be within %g-%g micron' % tuple(WAVELENGTH_LIMITS)))
+
+        for key in ['live_points', 'n_layers']:
+            if not (is_int(settings.get(key)) and settings[key] > 0):
+                problems.append(ConfigProblem('%s.%s' % (section, key), 'must be a positive integer'))
+        for key in ['include_CIA', 'include_moon']:
+            if not isinstance(settings.get(key), bool):
+                problems.append(ConfigProblem('%s.%s' % (section, key), 'must be true or false'))
+        if not isinstance(settings.get('output_folder'), str):
+            problems.append(ConfigProblem(section + '.output_folder', 'must be a path'))
+        if 'top_log_pressure' in settings and not is_number(settings['top_log_pressure']):
+            problems.append(ConfigProblem(section + '.top_log_pressure', 'must be a number'))
+
+        scattering = settings.get('include_scattering')
+        if not isinstance(scattering, dict):
+            problems.append(ConfigProblem(section + '.include_scattering', 'must be a dictionary'))
+        else:
+            for sctype in SCATTERING_TYPES:
+                if not isinstance(scattering.get(sctype), bool):
+                    problems.append(ConfigProblem('%s.include_scattering.%s' % (section, sctype), 'must be true or false'))
+
+        if 'parameterization' in settings and settings['parameterization'] not in self.parameterizations:
+            problems.append(ConfigProblem(section + '.parameterization', 'unknown parameterization %s' % settings['parameterization']))
+
+
+    def check_temperature(self, config, section, problems):
+        params = config[section]
+        # NB the GUI writes the parameterization to this section, the default config has it in the run settings
+        parameterization = params.get('parameterization', config.get('RUN SETTINGS', {}).get('parameterization'))
+        if parameterization not in self.parameterizations:
+            problems.append(ConfigProblem(section + '.parameterization', 'unknown parameterization %s' % parameterization))
+            return
+
+        expected = self.parameterizations[parameterization]
+        for name in expected:
+            if name not in params:
+                problems.append(ConfigProblem('%s.%s' % (section, name), 'missing for parameterization %s' % parameterization))
+        for name, param in params.items():
+            if name == 'parameterization':
+                continue
+            if name not in expected:
+                problems.append(ConfigProblem('%s.%s' % (section, name), 'not a parameter of parameterization %s' % parameterization))
+                continue
+            self.check_param(param, '%s.%s' % (section, name), problems)
+
+
+    def check_params(self, config, section, problems):
+        for name, param in config[section].items():
+            self.check_param(param, '%s.%s' % (section, name), problems)
+
+
+    def check_composition(self, config, section, problems):
+        for formula, param in config[section].items():
+            path = '%s.%s' % (section, formula)
+            if formula == 'mmw_inert':
+                if not is_number(param) or param <= 0:
+                    problems.append(ConfigProblem(path, 'must be a positive number'))
+                continue
+            if formula not in SPECIES_NAMES:
+                problems.append(ConfigProblem(path, 'unknown species %s' % formula))
+            if self.check_param(param, path, problems) and 'lines' in param:
+                self.check_lines(formula, param['lines'], path + '.lines', problems)
+
+
+    def check_param(self, param, path, problems):
+        '''
+        Check a dictionary as written by param_dict, returns whether it is a dictionary at all.
+        '''
+        if not isinstance(param, dict):
+            problems.append(ConfigProblem(path, 'must be a dictionary with truth and/or prior'))
+            return False
+
+        if 'truth' in param and not is_number(param['truth']):
+            problems.append(ConfigProblem(path + '.truth', 'must be a number'))
+
+        prior = param.get('prior')
+        if prior is None:
+            if 'truth' not in param:
+                problems.append(ConfigProblem(path, 'known parameters need a truth'))
+            return True
+        if not isinstance(prior, dict):
+            problems.append(ConfigProblem(path + '.prior', 'must have kind and prior_specs'))
+            return True
+
+        kind = prior.get('kind')
+        if kind not in self.prior_params or kind == '(known)':
+            problems.append(ConfigProblem(path + '.prior.kind', 'unknown prior kind %s' % kind))
+            return True
+
+        specs = prior.get('prior_specs')
+        expected = self.prior_params[kind]
+        if not isinstance(specs, dict):
+            problems.append(ConfigProblem(path + '.prior.prior_specs', 'must be a dictionary'))
+            return True
+        if list(specs.keys()) != expected:
+            problems.append(ConfigProblem(path + '.prior.prior_specs', '%s prior needs exactly %s, got %s' % (kind, ', '.join(expected), ', '.join(map(str, specs.keys())))))
+            return True
+
+        values = [specs[name] for name in expected]
+        for name, value in zip(expected, values):
+            if not is_number(value):
+                problems.append(ConfigProblem('%s.prior.prior_specs.%s' % (path, name), 'must be a number'))
+        if not all(is_number(value) for value in values):
+            return True
+
+        if kind in BOUNDED_PRIORS and values[0] >= values[1]:
+            problems.append(ConfigProblem(path + '.prior.prior_specs', '%s must be less than %s' % tuple(expected)))
+        if kind in GAUSSIAN_PRIORS and values[1] <= 0:
+            problems.append(ConfigProblem(path + '.prior.prior_specs', '%s must be positive' % expected[1]))
+        return True
+
+
+    def check_lines(self, formula, lines, path, problems):
+        if not isinstance(lines, list):
+            problems.append(ConfigProblem(path, 'must be a list of line names'))
+            return
+        for i, line in enumerate(lines):
+            line_path = '%s.%d' % (path, i)
+            parsed = parse_line_name(line) if isinstance(line, str) else None
+            if parsed is None:
+                problems.append(ConfigProblem(line_path, 'invalid line name %s' % line))
+            elif parsed[0] != formula:
+                problems.append(ConfigProblem(line_path, 'line %s does not belong to %s' % (line, formula)))
+            elif self.catalog is not None and line not in self.catalog:
+                problems.append(ConfigProblem(line_path, 'no line data for %s in %s' % (line, self.catalog.root)))
+
+
+
+
+@lru_cache(maxsize=None)
+def get_validator():
+    # compiled once per process
+    # NB the catalog is refreshed by validate_files before starting the workers, which then only read its index
+    return ConfigValidator(get_catalog(refresh=False))
+
+
+def validate_config(config):
+    return get_validator().validate(config)
+
+
+def validate_file(path):
+    '''
+    [Returns]
+        path, list of ConfigProblem (a file that cannot be read has a single problem)
+    '''
+    try:
+        with open(path, 'r') as yaml_file:
+            config = load_yaml(yaml_file)
+    except Exception as error: # anything the YAML parser raises
+        return path, [ConfigProblem('', 'could not read config: %s' % error)]
+    return path, validate_config(config)
+
+
+def collect_config_files(paths):
+    # folders are replaced by the YAML files they contain
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, '*.yaml')) + glob.glob(os.path.join(path, '*.yml')))
+        else:
+            files.append(path)
+    return files
+
+
+def validate_files(paths, processes=None, chunksize=32):
+    '''
+    Validate many configs in parallel.
+
+    [Args]
+        paths: config files and/or folders of config files
+        processes: number of worker processes, None uses all cores, 1 validates in this process
+
+    [Returns]
+        generator of (path, list of ConfigProblem), in the order of the files
+    '''
+    files = collect_config_files(paths)
+    get_catalog()
+    if processes == 1 or len(files) <= 1:
+        yield from map(validate_file, files)
+        return
+    with Pool(processes) as pool:
+        yield from pool.imap(validate_file, files, chunksize)
+
+
+
+if __name__ == '__main__':
+    # the built-in default config has to pass the schema (the line data available locally is not checked)
+    default_problems = ConfigValidator().validate(ConfigHandler().config)
+    for problem in default_problems:
+        print('%s: %s' % problem)
+    print('default config: %d problems' % len(default_problems))
+    raise SystemExit(len(default_problems) != 0)
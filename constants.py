@@ -1,3 +1,5 @@
+import os
+
 # TODO?: use a yaml file instead
 # Options that are used in the combo boxes
 
@@ -40,13 +42,48 @@ LINE_SPECS = {
     # NB Resolution must the last one and a default resolution has to be specified
     # For all other specs, the default is not required
     'Isotope': {'options': ['all', 'main'], 'default': 'main'},
-    'Database': {'options': ['EX21', 'HP10', 'HN20', 'PK95'], 'default': 'HN20'},
+    'Database': {'options': ['EX21', 'HP10', 'HN16', 'HN20', 'PK95'], 'default': 'HN20'},
     'Broadening': {'options': ['air', 'CO2', 'HH', 'H2O'], 'default': 'air'},
     'Cutoff': {'options': ['C25', 'C100', 'Chubb', 'BG69', 'HB02', 'nocut'], 'default': 'C25'},
     'Resolution': {'options': ['50', '100', '200', '1000'], 'default': '50'}
 }
 
+# Limits of the wavelength range of a retrieval, in micron
+WAVELENGTH_LIMITS = [1.0, 20.0]
+
+# NB the conversions are defined in units.py
 UNITS = {
-    'wavelength': {'options': ['micron'], 'default': 'micron'},
-    'flux': {'options': ['erg s-1 Hz-1 m-2'], 'default': 'erg s-1 Hz-1 m-2'},
-}
\ No newline at end of file
+    'wavelength': {'options': ['micron', 'nm', 'angstrom', 'cm', 'm'], 'default': 'micron'},
+    'flux': {
+        'options': [
+            'erg s-1 Hz-1 m-2',
+            'erg s-1 Hz-1 cm-2',
+            'W m-2 Hz-1',
+            'Jy',
+            'mJy',
+            'W m-2 micron-1',
+            'erg s-1 cm-2 micron-1',
+            'erg s-1 cm-2 angstrom-1',
+            'photon s-1 m-2 micron-1',
+            'photon s-1 cm-2 angstrom-1',
+            'photon s-1 m-2 Hz-1'
+        ],
+        'default': 'erg s-1 Hz-1 m-2'
+    },
+}
+
+# Folder for data cached between sessions, e.g. parsed spectra
+CACHE_DIR = os.environ.get('PYRETLIFE_GUI_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'pyretlife_gui'))
+
+# Folder of the opacity line data, one folder per line (e.g. CO2_main_HN20_air_C25), see line_catalog.py
+# NB if it is not set, all line specifications are offered and line names are only checked for their format
+OPACITY_DIR = os.environ.get('PYRETLIFE_OPACITY_DIR', '')
+
+# Measured runs the cost model is calibrated with, see cost_model.py
+# NB runs recorded by the user go to USER_BENCHMARKS, the table shipped with the GUI is not modified
+COST_BENCHMARKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'cost_benchmarks.yaml')
+USER_BENCHMARKS = os.path.join(CACHE_DIR, 'cost_benchmarks.yaml')
+
+# Command that runs a retrieval, the path of the config is appended, see run_queue.py
+# NB stub_retrieval.py stands in for the retrieval, e.g. PYRETLIFE_RETRIEVAL_COMMAND="python stub_retrieval.py"
+RETRIEVAL_COMMAND = os.environ.get('PYRETLIFE_RETRIEVAL_COMMAND', 'pyretlife_retrieval')
@@ -0,0 +1,309 @@
+'''
+Estimate of the memory, disk and time footprint of a retrieval before it is launched.
+
+The model counts what a correlated-k forward model has to hold and compute:
+- every line entry of a species is an opacity table of n_bins x N_G points for each point of the pressure-temperature grid of the table,
+  where n_bins = R ln(upper / lower) is the number of spectral bins at resolution R in the wavelength range
+- the tables are interpolated onto the n_layers layers of the atmosphere at every likelihood call,
+  the layer opacities of all species are then combined and the radiative transfer is solved on the finest grid
+- CIA and the scattering options add layer arrays and work on top of that (see CIA_PAIRS and SCATTERING_COSTS)
+
+These counts (bytes and operations) are turned into a memory footprint and a time per likelihood call
+by a linear fit to measured runs in the benchmark table COST_BENCHMARKS and in the table of the user USER_BENCHMARKS,
+which is extended with
+    python cli.py estimate -i config.yaml --measured-memory <peak MB> --measured-call-time <ms>
+Without measurements, one byte per counted byte and DEFAULT_SECONDS_PER_OPERATION are assumed,
+such estimates are labelled uncalibrated (see summarize).
+'''
+import math
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from constants import COST_BENCHMARKS, USER_BENCHMARKS
+from line_catalog import parse_line_name, DEFAULT_RESOLUTION
+from yaml_io import load_yaml, dump_yaml
+
+
+
+
+# g points of the correlated-k tables
+N_G = 16
+# points of the pressure-temperature grid of an opacity table
+N_TABLE_PT = 130
+# spectral bins of a UV cross section table, independent of the resolution
+N_UV_BINS = 1000
+# spectral bins and temperatures of a CIA table
+N_CIA_BINS = 10000
+N_CIA_TEMPERATURES = 20
+BYTES_PER_VALUE = 8
+
+# operations per value for interpolating a table onto the layers, combining the species and solving the radiative transfer
+INTERPOLATION_OPERATIONS = 4
+COMBINATION_OPERATIONS = 2
+TRANSFER_OPERATIONS = 10
+
+# collision induced absorption, included if both partners are in the composition
+CIA_PAIRS = [('H2', 'H2'), ('N2', 'N2'), ('O2', 'O2'), ('CO2', 'CO2'), ('N2', 'O2'), ('H2O', 'H2O'), ('H2O', 'N2')]
+
+# extra layer arrays (memory) and extra radiative transfer passes (work) of each scattering option
+SCATTERING_COSTS = {
+    'Rayleigh': {'arrays': 1, 'transfer': 0.1},
+    'thermal': {'arrays': 2, 'transfer': 4.0},
+    'direct_light': {'arrays': 1, 'transfer': 1.0},
+    'clouds': {'arrays': 2, 'transfer': 0.5}
+}
+
+DEFAULT_SECONDS_PER_OPERATION = 1e-9
+# memory of the interpreter and the libraries, if there are no measurements
+DEFAULT_OVERHEAD_BYTES = 500 * 2**20
+
+
+BENCHMARK_TABLE_HEADER = '''# Measured runs for the calibration of cost_model.py, one entry per run:
+# the values of the config the footprint depends on (see cost_model.run_inputs),
+# the peak resident memory of the run in MB and the mean wall-clock time of a likelihood call in ms.
+# Add runs with:
+#     python cli.py estimate -i config.yaml --measured-memory <peak MB> --measured-call-time <ms> --note <machine>
+'''
+
+
+# counts of the model, independent of the machine
+# NB disk_bytes is the line data read for the wavelength range, the files themselves cover a wider range
+CostCounts = namedtuple('CostCounts', ['n_bins', 'table_bytes', 'layer_bytes', 'disk_bytes', 'call_operations'])
+# estimate of a run, counts and the calibrated memory (bytes) and time per likelihood call (seconds),
+# n_runs: measured runs of the calibration (0 if the defaults are used)
+CostEstimate = namedtuple('CostEstimate', ['counts', 'memory_bytes', 'disk_bytes', 'call_seconds', 'n_runs'])
+# y = slope * x + offset for the memory and the call time
+Calibration = namedtuple('Calibration', ['memory_slope', 'memory_offset', 'time_slope', 'time_offset', 'n_runs'])
+
+
+
+
+def n_bins(wavelength_range, resolution):
+    # bins of constant resolution lambda / delta lambda
+    lower, upper = wavelength_range
+    return max(int(math.ceil(float(resolution) * math.log(upper / lower))), 1)
+
+
+def run_inputs(config):
+    '''
+    The values of a config the footprint depends on, this is also what the benchmark table records per run.
+    '''
+    settings = config['RUN SETTINGS']
+    composition = config['CHEMICAL COMPOSITION PARAMETERS']
+    lines = []
+    for formula, param in composition.items():
+        if isinstance(param, dict):
+            lines += param.get('lines') or []
+    return {
+        'species': [formula for formula, param in composition.items() if isinstance(param, dict)],
+        'lines': lines,
+        'wavelength_range': list(settings['wavelength_range']),
+        'n_layers': settings['n_layers'],
+        'include_CIA': settings['include_CIA'],
+        'include_scattering': dict(settings['include_scattering'])
+    }
+
+
+def count_costs(inputs):
+    '''
+    [Args]
+        inputs: dictionary as returned by run_inputs
+
+    [Returns]
+        CostCounts
+    '''
+    n_layers = int(inputs['n_layers'])
+    line_bins = []
+    for line in inputs['lines']:
+        parsed = parse_line_name(line)
+        if parsed is None: # NB reported by the validator, counted like a line at the default resolution
+            line_bins.append(n_bins(inputs['wavelength_range'], DEFAULT_RESOLUTION))
+        elif parsed[1] == 'UV':
+            line_bins.append(N_UV_BINS)
+        else:
+            line_bins.append(n_bins(inputs['wavelength_range'], parsed[1][-1]))
+    # the radiative transfer is solved on the finest grid
+    max_bins = max(line_bins, default=n_bins(inputs['wavelength_range'], DEFAULT_RESOLUTION))
+
+    table_values = sum(bins * N_G * N_TABLE_PT for bins in line_bins)
+    layer_arrays = len(line_bins) + 1
+    transfer_passes = 1.
+    for sctype, included in inputs['include_scattering'].items():
+        if included and sctype in SCATTERING_COSTS:
+            layer_arrays += SCATTERING_COSTS[sctype]['arrays']
+            transfer_passes += SCATTERING_COSTS[sctype]['transfer']
+
+    n_cia = 0
+    if inputs['include_CIA']:
+        species = set(inputs['species'])
+        n_cia = sum(1 for pair in CIA_PAIRS if species.issuperset(pair))
+    table_values += n_cia * N_CIA_BINS * N_CIA_TEMPERATURES
+    layer_values = layer_arrays * max_bins * N_G * n_layers + n_cia * max_bins * n_layers
+
+    call_operations = (
+        sum(bins * N_G * n_layers * (INTERPOLATION_OPERATIONS + COMBINATION_OPERATIONS) for bins in line_bins)
+        + n_cia * max_bins * n_layers * INTERPOLATION_OPERATIONS
+        + transfer_passes * max_bins * N_G * n_layers * TRANSFER_OPERATIONS
+    )
+
+    return CostCounts(
+        n_bins=max_bins,
+        table_bytes=table_values * BYTES_PER_VALUE,
+        layer_bytes=layer_values * BYTES_PER_VALUE,
+        disk_bytes=table_values * BYTES_PER_VALUE,
+        call_operations=call_operations
+    )
+
+
+
+
+def benchmark_tables():
+    # the shipped table and the one of the user
+    return [COST_BENCHMARKS, USER_BENCHMARKS]
+
+
+def load_benchmarks(path=None):
+    '''
+    [Args]
+        path: benchmark table, by default the runs of all benchmark_tables are merged
+
+    [Returns]
+        list of the runs in the benchmark table, each a dictionary of run_inputs plus peak_memory_mb and call_time_ms
+    '''
+    if path is None:
+        return [run for table_path in benchmark_tables() for run in load_benchmarks(table_path)]
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as table_file:
+        table = load_yaml(table_file)
+    return (table or {}).get('runs') or []
+
+
+def record_benchmark(config, peak_memory_mb, call_time_ms, path=None, note=''):
+    '''
+    Add a measured run to a benchmark table, USER_BENCHMARKS by default.
+
+    [Args]
+        config: config dictionary of the run
+        peak_memory_mb: peak resident memory of the run
+        call_time_ms: mean wall-clock time of a likelihood call
+        note: e.g. the machine the run was measured on
+    '''
+    if path is None:
+        path = USER_BENCHMARKS
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    runs = load_benchmarks(path)
+    run = run_inputs(config)
+    run['peak_memory_mb'] = float(peak_memory_mb)
+    run['call_time_ms'] = float(call_time_ms)
+    if note:
+        run['note'] = note
+    runs.append(run)
+    with open(path, 'w') as table_file:
+        table_file.write(BENCHMARK_TABLE_HEADER)
+        dump_yaml({'runs': runs}, table_file)
+
+
+def fit_line(x, y):
+    '''
+    Least-squares fit of y = slope * x + offset with a non-negative offset.
+
+    [Returns]
+        slope, offset, None if there are no points
+    '''
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if len(x) == 0:
+        return None
+    if len(x) == 1 or np.ptp(x) == 0:
+        return float(np.sum(y) / max(np.sum(x), 1.)), 0.
+    slope, offset = np.linalg.lstsq(np.stack([x, np.ones(len(x))], axis=1), y, rcond=None)[0]
+    if offset < 0: # fit through the origin instead
+        return float(np.dot(x, y) / np.dot(x, x)), 0.
+    return float(slope), float(offset)
+
+
+def calibrate(runs):
+    '''
+    [Args]
+        runs: list of dictionaries as returned by load_benchmarks
+
+    [Returns]
+        Calibration
+    '''
+    counts = [count_costs(run) for run in runs]
+    memory_fit = fit_line([count.table_bytes + count.layer_bytes for count in counts], [run['peak_memory_mb'] * 2**20 for run in runs])
+    time_fit = fit_line([count.call_operations for count in counts], [run['call_time_ms'] / 1000 for run in runs])
+    if memory_fit is None:
+        memory_fit = (1., DEFAULT_OVERHEAD_BYTES)
+    if time_fit is None:
+        time_fit = (DEFAULT_SECONDS_PER_OPERATION, 0.)
+    return Calibration(*memory_fit, *time_fit, len(runs))
+
+
+@lru_cache(maxsize=8)
+def cached_calibration(paths, mtimes_ns):
+    return calibrate([run for path in paths for run in load_benchmarks(path)])
+
+
+def get_calibration(path=None):
+    # refitted only when a benchmark table changes
+    paths = tuple(benchmark_tables()) if path is None else (path,)
+    mtimes_ns = []
+    for table_path in paths:
+        try:
+            mtimes_ns.append(os.stat(table_path).st_mtime_ns)
+        except OSError:
+            mtimes_ns.append(None)
+    return cached_calibration(paths, tuple(mtimes_ns))
+
+
+def estimate_cost(config, calibration=None):
+    '''
+    [Args]
+        config: config dictionary (e.g. ConfigHandler.config)
+        calibration: Calibration, by default fitted to the benchmark table
+
+    [Returns]
+        CostEstimate
+    '''
+    if calibration is None:
+        calibration = get_calibration()
+    counts = count_costs(run_inputs(config))
+    return CostEstimate(
+        counts=counts,
+        memory_bytes=calibration.memory_slope * (counts.table_bytes + counts.layer_bytes) + calibration.memory_offset,
+        disk_bytes=counts.disk_bytes,
+        call_seconds=calibration.time_slope * counts.call_operations + calibration.time_offset,
+        n_runs=calibration.n_runs
+    )
+
+
+def format_bytes(n_bytes):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n_bytes < 1024:
+            return '%.1f %s' % (n_bytes, unit)
+        n_bytes /= 1024
+    return '%.1f TB' % n_bytes
+
+
+def format_seconds(seconds):
+    if seconds < 1:
+        return '%.1f ms' % (seconds * 1000)
+    if seconds < 120:
+        return '%.1f s' % seconds
+    if seconds < 7200:
+        return '%.1f min' % (seconds / 60)
+    if seconds < 2 * 86400:
+        return '%.1f h' % (seconds / 3600)
+    return '%.1f d' % (seconds / 86400)
+
+
+def summarize(estimate):
+    summary = 'memory %s, line data %s, %s per likelihood call (%d spectral bins)' % (
+        format_bytes(estimate.memory_bytes), format_bytes(estimate.disk_bytes), format_seconds(estimate.call_seconds), estimate.counts.n_bins)
+    if estimate.n_runs == 0:
+        summary += ', uncalibrated (no measured runs)'
+    return summary
@@ -0,0 +1,117 @@
+'''
+Health checks of the input spectra of a config.
+
+A data file is read in blocks (the whole file at once if it is small enough to be loaded, see spectrum.STREAM_SIZE),
+and every block is checked with array operations for
+- wavelengths or fluxes that are not finite,
+- wavelengths that are not strictly monotonic (in either order, also across blocks),
+- the points and the coverage of the wavelength range of the retrieval.
+The signal-to-noise ratio is estimated from the flux alone with the DER_SNR estimator (Stoehr et al. 2008),
+    noise = 1.482602 / sqrt(6) * median(|2 f[i] - f[i-2] - f[i+2]|), SNR = median(f) / noise
+evaluated in the wavelength range, per block, and combined as the median over the blocks.
+'''
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from spectrum import STREAM_SIZE, load_spectrum, iter_blocks
+from units import DEFAULT_UNIT, parse_unit, convert_wavelength
+
+
+
+
+# n_points: points in the wavelength range, coverage: fraction of the range between the first and last wavelength,
+# snr: DER_SNR estimate in the range (None if there are too few points), problems: list of str
+DataFileCheck = namedtuple('DataFileCheck', ['n_points', 'coverage', 'snr', 'problems'])
+
+# fewer points than this in the range are reported
+MIN_POINTS = 10
+
+
+
+
+def der_snr(flux):
+    '''
+    [Returns]
+        median signal, median absolute second difference (scaled to the noise), None if there are fewer than 5 points
+    '''
+    flux = flux[np.isfinite(flux)]
+    if len(flux) < 5:
+        return None
+    noise = 1.482602 / np.sqrt(6) * np.median(np.abs(2 * flux[2:-2] - flux[:-4] - flux[4:]))
+    return float(np.median(flux)), float(noise)
+
+
+def check_data_file(path, wavelength_range, unit=DEFAULT_UNIT):
+    '''
+    [Args]
+        path: spectrum file
+        wavelength_range: [lower, upper] of the retrieval, in the wavelength unit of DEFAULT_UNIT
+        unit: unit of the file
+
+    [Returns]
+        DataFileCheck
+    '''
+    problems = []
+    try:
+        file_range = convert_wavelength(np.array(wavelength_range, dtype=float), parse_unit(DEFAULT_UNIT)[0], parse_unit(unit)[0])
+    except ValueError:
+        file_range = np.array(wavelength_range, dtype=float)
+        problems.append('unknown unit %s' % unit)
+    lower, upper = min(file_range), max(file_range)
+
+    try:
+        if os.path.getsize(path) > STREAM_SIZE:
+            blocks = iter_blocks(path)
+        else:
+            spectrum = load_spectrum(path)
+            blocks = [(spectrum.wavelength, spectrum.flux)]
+        n_points, n_not_finite, n_lines = 0, 0, 0
+        first = last = previous = None
+        direction = 0
+        monotonic = True
+        snr_blocks = []
+        for wavelength, flux in blocks:
+            if len(wavelength) == 0:
+                continue
+            n_lines += len(wavelength)
+            finite = np.isfinite(wavelength) & np.isfinite(flux)
+            n_not_finite += int(np.count_nonzero(~finite))
+
+            # NB the last wavelength of the previous block is prepended, so the order is checked across blocks
+            steps = np.diff(wavelength if previous is None else np.concatenate([[previous], wavelength]))
+            if direction == 0 and len(steps) != 0:
+                direction = 1 if steps[0] > 0 else -1
+            if monotonic and not np.all(steps * direction > 0):
+                monotonic = False
+            if first is None:
+                first = wavelength[0]
+            previous = last = wavelength[-1]
+
+            inside = finite & (wavelength >= lower) & (wavelength <= upper)
+            n_points += int(np.count_nonzero(inside))
+            estimate = der_snr(flux[inside])
+            if estimate is not None and estimate[1] > 0:
+                snr_blocks.append(estimate[0] / estimate[1])
+    except FileNotFoundError:
+        return DataFileCheck(0, 0., None, problems + ['file not found'])
+    except (OSError, ValueError) as error:
+        return DataFileCheck(0, 0., None, problems + ['unreadable: %s' % error])
+
+    if n_lines == 0:
+        return DataFileCheck(0, 0., None, problems + ['no data'])
+    if n_not_finite != 0:
+        problems.append('%d lines with NaN or inf' % n_not_finite)
+    if not monotonic:
+        problems.append('wavelengths not monotonic')
+
+    data_lower, data_upper = min(first, last), max(first, last)
+    coverage = max(min(data_upper, upper) - max(data_lower, lower), 0.) / (upper - lower) if upper > lower else 0.
+    if coverage < 1:
+        problems.append('covers %.1f%% of the wavelength range' % (100 * coverage))
+    if n_points < MIN_POINTS:
+        problems.append('%d points in the wavelength range' % n_points)
+
+    snr = float(np.median(snr_blocks)) if len(snr_blocks) != 0 else None
+    return DataFileCheck(n_points, coverage, snr, problems)
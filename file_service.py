@@ -0,0 +1,187 @@
+'''
+Filesystem access off the UI thread.
+
+Calls on the paths of a slow or unreachable network mount (e.g. the /net/... paths of the default config) can block
+for a long time. FileService runs stat calls, existence checks, directory listings and reads in a pool of worker
+threads and returns concurrent.futures.Future objects, so callers decide how long they wait (FS_TIMEOUT by default).
+Stat results, failures included, are cached for STAT_TTL seconds, and a path that is being stat'ed is not stat'ed
+again, so a hung mount ties up at most one worker per path. When all workers are busy, more are started (up to
+FS_MAX_WORKERS), so calls on other paths still go through while some hang.
+NB the workers are daemon threads: a call that never returns does not keep the application from exiting.
+'''
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
+from time import monotonic
+
+
+
+
+STAT_TTL = 10.
+FS_TIMEOUT = 5.
+FS_WORKERS = 4
+FS_MAX_WORKERS = 32
+
+
+
+
+class FileService:
+    def __init__(self, workers=FS_WORKERS, ttl=STAT_TTL, max_workers=FS_MAX_WORKERS):
+        '''
+        [Args]
+            workers: number of worker threads started right away
+            ttl: seconds a stat result is reused
+            max_workers: maximum number of worker threads
+        '''
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        # path -> (time of the stat, os.stat_result or OSError)
+        self.stat_cache = {}
+        # path -> Future of a running stat
+        self.running_stats = {}
+
+        self.tasks = queue.SimpleQueue()
+        self.max_workers = max_workers
+        self.n_workers = 0
+        self.n_idle = 0
+        for _ in range(workers):
+            self.start_worker()
+
+
+    def start_worker(self):
+        # NB called with the lock held, or before the service is used
+        self.n_workers += 1
+        self.n_idle += 1
+        threading.Thread(target=self.work, name='file-service-%d' % self.n_workers, daemon=True).start()
+
+
+    def work(self):
+        while True:
+            future, func, args = self.tasks.get()
+            with self.lock:
+                self.n_idle -= 1
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(func(*args))
+                except BaseException as error:
+                    future.set_exception(error)
+            with self.lock:
+                self.n_idle += 1
+
+
+    def submit(self, func, *args):
+        future = Future()
+        with self.lock:
+            if self.n_idle <= self.tasks.qsize() and self.n_workers < self.max_workers:
+                self.start_worker()
+        self.tasks.put((future, func, args))
+        return future
+
+
+    def cached_stat(self, path):
+        '''
+        [Returns]
+            os.stat_result, OSError if the stat failed, None if there is no recent result
+        '''
+        with self.lock:
+            cached = self.stat_cache.get(path)
+        if cached is None or monotonic() - cached[0] > self.ttl:
+            return None
+        return cached[1]
+
+
+    def invalidate(self, path=None):
+        # drop cached stat results (all by default), e.g. after writing a file
+        with self.lock:
+            if path is None:
+                self.stat_cache.clear()
+            else:
+                self.stat_cache.pop(path, None)
+
+
+    def stat(self, path):
+        '''
+        [Returns]
+            Future of the os.stat_result, raising OSError if the stat fails
+        '''
+        cached = self.cached_stat(path)
+        if cached is not None:
+            future = Future()
+            if isinstance(cached, OSError):
+                future.set_exception(cached)
+            else:
+                future.set_result(cached)
+            return future
+        with self.lock:
+            future = self.running_stats.get(path)
+            if future is None:
+                future = self.submit(self.run_stat, path)
+                self.running_stats[path] = future
+        return future
+
+
+    def run_stat(self, path):
+        try:
+            result = os.stat(path)
+        except OSError as error:
+            result = error
+        with self.lock:
+            self.stat_cache[path] = (monotonic(), result)
+            self.running_stats.pop(path, None)
+        if isinstance(result, OSError):
+            raise result
+        return result
+
+
+    def exists(self, path):
+        '''
+        [Returns]
+            Future of whether path exists (it still fails if the stat fails for another reason, e.g. a dead mount)
+        '''
+        exists = Future()
+        def forward(stat):
+            error = stat.exception()
+            if error is None:
+                exists.set_result(True)
+            elif isinstance(error, FileNotFoundError):
+                exists.set_result(False)
+            else:
+                exists.set_exception(error)
+        self.stat(path).add_done_callback(forward)
+        return exists
+
+
+    def listdir(self, path):
+        '''
+        [Returns]
+            Future of the sorted list of (name, whether it is a folder) of the entries of a folder
+        '''
+        return self.submit(list_folder, path)
+
+
+    def read(self, path, size=-1):
+        '''
+        [Returns]
+            Future of the first size bytes of a file (all by default)
+        '''
+        return self.submit(read_file, path, size)
+
+
+
+
+def list_folder(path):
+    with os.scandir(path) as entries:
+        return sorted((entry.name, entry.is_dir()) for entry in entries)
+
+
+def read_file(path, size=-1):
+    with open(path, 'rb') as opened_file:
+        return opened_file.read(size)
+
+
+@lru_cache(maxsize=None)
+def get_file_service():
+    # the service shared by the GUI
+    return FileService()
@@ -11,6 +11,7 @@ app = QApplication(sys.argv) # application handler, sys.argv is list of command
 
 window = MainWindow()
 window.show() # top level widgets must be shown manually
+window.offer_restore()
 
 print('Running event loop...')
 app.exec()
@@ -0,0 +1,249 @@
+'''
+Catalog of the opacity line data that is available locally.
+
+Line data lives in OPACITY_DIR as one folder per line, named like the entries of the lines of a species
+(e.g. CO2_main_HN20_air_C25_R_200 or CO2_UV), either directly in OPACITY_DIR or in grouping folders (e.g. one per species).
+The catalog records the modification time of every grouping folder, refreshing it only lists the folders whose
+modification time changed (a folder's modification time changes when entries are added or removed).
+The index is persisted in CATALOG_CACHE_DIR, so a new session costs one stat per grouping folder instead of a full scan.
+'''
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+
+from constants import LINE_SPECS, CACHE_DIR, OPACITY_DIR
+
+
+
+
+CATALOG_CACHE_DIR = os.path.join(CACHE_DIR, 'line_catalogs')
+# increase when the format of the persisted index changes
+CATALOG_VERSION = 1
+
+# all specs except the resolution, which is the last one
+SPEC_NAMES = [spec_name for spec_name in LINE_SPECS if spec_name != 'Resolution']
+DEFAULT_RESOLUTION = LINE_SPECS['Resolution']['default']
+
+# e.g. CO2_main_HN20_air_C25_R_200, the resolution is omitted for the default resolution
+LINE_PATTERN = re.compile(
+    r'^(?P<formula>[A-Za-z0-9]+)_'
+    + '_'.join('(?P<%s>%s)' % (spec_name, '|'.join(re.escape(option) for option in LINE_SPECS[spec_name]['options'])) for spec_name in SPEC_NAMES)
+    + '(?:_R_(?P<Resolution>%s))?$' % '|'.join(re.escape(option) for option in LINE_SPECS['Resolution']['options'])
+)
+UV_PATTERN = re.compile(r'^(?P<formula>[A-Za-z0-9]+)_UV$')
+
+
+
+
+def line_name(formula, specs):
+    '''
+    [Args]
+        formula: chemical formula of the species
+        specs: values of LINE_SPECS, in the same order
+
+    [Returns]
+        name of the line, e.g. CO2_main_HN20_air_C25_R_200
+    '''
+    name = '_'.join([formula] + list(specs[:-1]))
+    if specs[-1] != DEFAULT_RESOLUTION:
+        # the resolution token is omitted if it's the default one
+        name += '_R_%s' % specs[-1]
+    return name
+
+
+def parse_line_name(name):
+    '''
+    [Returns]
+        formula, tuple of the values of LINE_SPECS (the resolution is filled in if omitted), or None if name is not a valid line name
+        formula, 'UV' for UV lines
+    '''
+    match = LINE_PATTERN.match(name)
+    if match is not None:
+        specs = [match[spec_name] for spec_name in SPEC_NAMES] + [match['Resolution'] or DEFAULT_RESOLUTION]
+        return match['formula'], tuple(specs)
+    match = UV_PATTERN.match(name)
+    if match is not None:
+        return match['formula'], 'UV'
+    return None
+
+
+
+
+class LineCatalog:
+    def __init__(self, root, cache_dir=None):
+        '''
+        [Args]
+            root: folder of the line data (OPACITY_DIR)
+            cache_dir: folder of the persisted index, CATALOG_CACHE_DIR by default
+        '''
+        self.root = os.path.abspath(root)
+        if cache_dir is None:
+            cache_dir = CATALOG_CACHE_DIR
+        self.index_path = os.path.join(cache_dir, hashlib.sha1(self.root.encode()).hexdigest() + '.json')
+
+        # grouping folder (relative to root) -> (mtime_ns, line names in it, grouping folders in it)
+        self.folders = {}
+        self.lines = set()
+        # formula -> set of spec tuples
+        self.specs = {}
+        self.uv_lines = set()
+        self.modified = False
+
+
+    def __contains__(self, name):
+        return name in self.lines
+
+
+    def __len__(self):
+        return len(self.lines)
+
+
+    def load(self):
+        # NB a missing or outdated index is not an error, the catalog is then built by refresh
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as index_file:
+                index = json.load(index_file)
+            if index['version'] != CATALOG_VERSION or index['root'] != self.root:
+                return
+            self.folders = {folder: (mtime, lines, subfolders) for folder, (mtime, lines, subfolders) in index['folders'].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        self.update_lookup()
+
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_path = self.index_path + '.%d.tmp' % os.getpid()
+        with open(tmp_path, 'w', encoding='utf-8') as index_file:
+            json.dump({'version': CATALOG_VERSION, 'root': self.root, 'folders': self.folders}, index_file)
+        os.replace(tmp_path, self.index_path)
+        self.modified = False
+
+
+    def refresh(self):
+        '''
+        Bring the catalog up to date with the files, only folders whose modification time changed are listed again.
+
+        [Returns]
+            whether anything changed
+        '''
+        folders = {}
+        changed = self.scan_folder('', folders)
+        # folders that were removed, or are no longer reachable
+        changed = changed or len(folders) != len(self.folders)
+        self.folders = folders
+        if changed:
+            self.modified = True
+            self.update_lookup()
+        return changed
+
+
+    def scan_folder(self, folder, folders):
+        path = os.path.join(self.root, folder)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError: # removed in the meantime
+            return True
+
+        changed = False
+        cached = self.folders.get(folder)
+        if cached is not None and cached[0] == mtime:
+            _, lines, subfolders = cached
+        else:
+            lines, subfolders = self.list_folder(path)
+            changed = True
+        folders[folder] = (mtime, lines, subfolders)
+
+        for subfolder in subfolders:
+            changed = self.scan_folder(os.path.join(folder, subfolder), folders) or changed
+        return changed
+
+
+    def list_folder(self, path):
+        lines, subfolders = [], []
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return lines, subfolders
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            if parse_line_name(entry.name) is not None:
+                lines.append(entry.name)
+            else:
+                subfolders.append(entry.name)
+        return sorted(lines), sorted(subfolders)
+
+
+    def update_lookup(self):
+        # NB built aside and then swapped in, the GUI reads the catalog while it is refreshed in the background
+        all_lines, all_specs, uv_lines = set(), {}, set()
+        for _, lines, _ in self.folders.values():
+            all_lines.update(lines)
+        for name in all_lines:
+            formula, specs = parse_line_name(name)
+            if specs == 'UV':
+                uv_lines.add(formula)
+            else:
+                all_specs.setdefault(formula, set()).add(specs)
+        self.lines, self.specs, self.uv_lines = all_lines, all_specs, uv_lines
+
+
+    def available_specs(self, formula):
+        '''
+        [Returns]
+            set of the spec tuples (values of LINE_SPECS) for which line data of the species exists
+        '''
+        return self.specs.get(formula, set())
+
+
+    def has_uv(self, formula):
+        return formula in self.uv_lines
+
+
+
+
+@lru_cache(maxsize=None)
+def cached_catalog(root):
+    catalog = LineCatalog(root)
+    catalog.load()
+    return catalog
+
+
+def loaded_catalog():
+    '''
+    The catalog of OPACITY_DIR as far as it is known, without accessing OPACITY_DIR (e.g. from the UI thread,
+    the folder may be on a slow network mount). Call get_catalog in the background to bring it up to date.
+
+    [Returns]
+        LineCatalog, None if OPACITY_DIR is not set or the catalog was never built
+    '''
+    if not OPACITY_DIR:
+        return None
+    catalog = cached_catalog(os.path.abspath(OPACITY_DIR))
+    return catalog if len(catalog.folders) != 0 else None
+
+
+def get_catalog(refresh=True):
+    '''
+    The catalog of OPACITY_DIR, loaded once per process.
+
+    [Args]
+        refresh: whether to bring the catalog up to date with the files first (and persist it if anything changed)
+
+    [Returns]
+        LineCatalog, None if OPACITY_DIR is not set or does not exist
+    '''
+    if not OPACITY_DIR or not os.path.isdir(OPACITY_DIR):
+        return None
+    catalog = cached_catalog(os.path.abspath(OPACITY_DIR))
+    if refresh or len(catalog.folders) == 0:
+        catalog.refresh()
+    if catalog.modified:
+        try:
+            catalog.save()
+        except OSError as error:
+            print('[get_catalog] Could not save the line catalog: %s' % error)
+    return catalog
@@ -0,0 +1,135 @@
+'''
+Vectorized sampling of the priors in PRIOR_PARAM_NAMES.
+
+A prior is a (kind, params) pair, params in the order of PRIOR_PARAM_NAMES[kind]:
+- uniform: uniform between lower and upper
+- fourth-uniform: the fourth root is uniform between the fourth roots of lower and upper
+- log-uniform: the log10 is uniform between log_lower and log_upper
+- gaussian: normal with mean and sigma
+- log-gaussian: the log10 is normal with log_mean and log_sigma
+sample_priors draws all priors at once, with one array operation per kind (the parameters are broadcast as columns).
+Histograms of single priors are cached by their parameters, see prior_histogram.
+'''
+from functools import lru_cache
+
+import numpy as np
+
+from constants import PRIOR_PARAM_NAMES
+from runtime_model import PARAMETER_SECTIONS
+
+
+
+
+# kinds whose samples are shown as log10 in histograms
+LOG_KINDS = ['log-uniform', 'log-gaussian']
+# samples of a prior histogram, and the seed so that a histogram does not change when it is redrawn
+HISTOGRAM_SAMPLES = 100000
+HISTOGRAM_SEED = 0
+
+
+
+
+def check_prior(kind, params):
+    if kind not in PRIOR_PARAM_NAMES or kind == '(known)':
+        raise ValueError('[check_prior] Unknown prior kind %s.' % kind)
+    if len(params) != len(PRIOR_PARAM_NAMES[kind]):
+        raise ValueError('[check_prior] %s prior needs %s.' % (kind, ', '.join(PRIOR_PARAM_NAMES[kind])))
+    if kind in ['uniform', 'fourth-uniform', 'log-uniform'] and not params[0] < params[1]:
+        raise ValueError('[check_prior] Lower bound of the %s prior must be less than the upper bound.' % kind)
+    if kind == 'fourth-uniform' and params[0] < 0:
+        raise ValueError('[check_prior] Bounds of the fourth-uniform prior must be positive.')
+    if kind in ['gaussian', 'log-gaussian'] and not params[1] > 0:
+        raise ValueError('[check_prior] Width of the %s prior must be positive.' % kind)
+
+
+def sample_priors(priors, n_samples, rng=None):
+    '''
+    Draw samples of many priors in one batch.
+
+    [Args]
+        priors: list of (kind, params)
+        n_samples: samples per prior
+        rng: numpy Generator, a new one by default
+
+    [Returns]
+        array of shape (len(priors), n_samples)
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    samples = np.empty((len(priors), n_samples))
+
+    rows = {}
+    for i, (kind, params) in enumerate(priors):
+        check_prior(kind, params)
+        rows.setdefault(kind, []).append(i)
+
+    for kind, kind_rows in rows.items():
+        # columns of the parameters, broadcast over the samples
+        params = np.array([priors[i][1] for i in kind_rows], dtype=float)
+        first, second = params[:, :1], params[:, 1:]
+        shape = (len(kind_rows), n_samples)
+        if kind == 'uniform':
+            values = first + (second - first) * rng.random(shape)
+        elif kind == 'fourth-uniform':
+            lower, upper = first**0.25, second**0.25
+            values = (lower + (upper - lower) * rng.random(shape))**4
+        elif kind == 'log-uniform':
+            values = 10**(first + (second - first) * rng.random(shape))
+        elif kind == 'gaussian':
+            values = first + second * rng.standard_normal(shape)
+        else: # log-gaussian
+            values = 10**(first + second * rng.standard_normal(shape))
+        samples[kind_rows] = values
+    return samples
+
+
+def config_priors(config):
+    '''
+    [Returns]
+        list of (section, name), list of (kind, params) of the parameters with a prior
+    '''
+    names, priors = [], []
+    for section in PARAMETER_SECTIONS:
+        for name, param in (config.get(section) or {}).items():
+            if not isinstance(param, dict) or param.get('prior') is None:
+                continue
+            prior = param['prior']
+            names.append((section, name))
+            priors.append((prior['kind'], [prior['prior_specs'][param_name] for param_name in PRIOR_PARAM_NAMES[prior['kind']]]))
+    return names, priors
+
+
+def sample_config(config, n_samples, rng=None):
+    '''
+    [Returns]
+        list of (section, name) of the free parameters, array of shape (number of free parameters, n_samples)
+    '''
+    names, priors = config_priors(config)
+    return names, sample_priors(priors, n_samples, rng)
+
+
+@lru_cache(maxsize=256)
+def prior_histogram(kind, params, n_bins=40, n_samples=HISTOGRAM_SAMPLES):
+    '''
+    Histogram of a prior, cached by its parameters.
+
+    [Args]
+        kind: prior kind
+        params: tuple of the prior parameters
+        n_bins: number of bins
+
+    [Returns]
+        bin edges, counts normalized to a maximum of 1, whether the values are log10
+    '''
+    samples = sample_priors([(kind, params)], n_samples, np.random.default_rng(HISTOGRAM_SEED))[0]
+    log = kind in LOG_KINDS
+    if log:
+        samples = np.log10(samples)
+    # bounded priors are shown over their bounds, not over the range of the samples
+    bounds = tuple(params) if kind in ['uniform', 'fourth-uniform', 'log-uniform'] else None
+    counts, edges = np.histogram(samples, n_bins, bounds)
+    counts = counts / counts.max()
+    # NB the arrays are shared by everyone asking for the same prior
+    edges.flags.writeable = False
+    counts.flags.writeable = False
+    return edges, counts, log
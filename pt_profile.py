@@ -0,0 +1,185 @@
+'''
+Temperature profiles of the P-T parameterizations, evaluated on the layer pressure grid of a run.
+
+A parameterization is linear in its parameters, T = V a, where the rows of the basis matrix V belong to the layers
+(for the polynomial, V[i, k] = log10(P_i)**(4 - k), matching the order a_4, ..., a_0 of PT_PARAMETERIZATIONS).
+Profiles of the truth and of many prior draws are therefore a single matrix product.
+'''
+import io
+import os
+
+import numpy as np
+
+from constants import PT_PARAMETERIZATIONS
+from prior_sampling import sample_priors
+
+
+
+
+# percentiles of the prior envelopes, pairs around the median
+ENVELOPE_PERCENTILES = [2.5, 16., 50., 84., 97.5]
+PROFILE_DRAWS = 2000
+PROFILE_SEED = 0
+
+# path -> ((size, mtime), (log10 pressure, temperature) or the ValueError of the file)
+INPUT_PROFILE_CACHE = {}
+
+
+
+
+def log_pressure_grid(top_log_pressure, ground_pressure, n_layers):
+    # layers equally spaced in log pressure, from the top of the atmosphere to the ground
+    if ground_pressure <= 0 or n_layers < 2:
+        raise ValueError('[log_pressure_grid] Need a positive ground pressure and at least two layers.')
+    return np.linspace(top_log_pressure, np.log10(ground_pressure), int(n_layers))
+
+
+def basis_matrix(parameterization, log_pressure):
+    '''
+    [Returns]
+        array of shape (n_layers, number of parameters of the parameterization)
+    '''
+    n_params = len(PT_PARAMETERIZATIONS[parameterization])
+    if parameterization == 'constant':
+        return np.ones((len(log_pressure), 1))
+    if parameterization == 'polynomial':
+        return np.vander(log_pressure, n_params)
+    raise ValueError('[basis_matrix] No basis for parameterization %s.' % parameterization)
+
+
+def get_parameterization(config):
+    # NB the GUI writes the parameterization to the temperature section, older configs have it in the run settings
+    return config['TEMPERATURE PARAMETERS'].get('parameterization', config['RUN SETTINGS'].get('parameterization'))
+
+
+def coefficient_matrix(pt_params, parameterization, n_draws=PROFILE_DRAWS, seed=PROFILE_SEED):
+    '''
+    Parameters of the truth and of prior draws, known parameters are fixed to their truth in the draws.
+
+    [Args]
+        pt_params: dictionary as in the TEMPERATURE PARAMETERS section of a config
+        parameterization: one of PT_PARAMETERIZATIONS
+
+    [Returns]
+        truth row (None if a truth is missing), array of shape (n_draws, number of parameters) (None if no parameter has a prior)
+    '''
+    names = PT_PARAMETERIZATIONS[parameterization]
+    truths = [pt_params[name].get('truth') for name in names]
+    truth_row = None if None in truths else np.array(truths, dtype=float)
+
+    free = [i for i, name in enumerate(names) if pt_params[name].get('prior') is not None]
+    if len(free) == 0:
+        return truth_row, None
+    if truth_row is None and len(free) != len(names):
+        raise ValueError('[coefficient_matrix] Known parameters need a truth.')
+
+    priors = []
+    for i in free:
+        prior = pt_params[names[i]]['prior']
+        priors.append((prior['kind'], tuple(prior['prior_specs'].values())))
+    # NB a fixed seed, so that the envelope does not jitter while the priors are edited
+    draws = sample_priors(priors, n_draws, np.random.default_rng(seed))
+
+    coefficients = np.empty((n_draws, len(names)))
+    if truth_row is not None:
+        coefficients[:] = truth_row
+    coefficients[:, free] = draws.T
+    return truth_row, coefficients
+
+
+def profile_envelope(pt_params, parameterization, log_pressure, n_draws=PROFILE_DRAWS, percentiles=ENVELOPE_PERCENTILES):
+    '''
+    [Args]
+        pt_params: dictionary as in the TEMPERATURE PARAMETERS section of a config
+        parameterization: one of PT_PARAMETERIZATIONS
+        log_pressure: log10 pressures of the layers
+
+    [Returns]
+        temperatures of the truth (None if a truth is missing),
+        array of shape (len(percentiles), n_layers) of the prior percentiles (None if no parameter has a prior)
+    '''
+    basis = basis_matrix(parameterization, log_pressure)
+    truth_row, coefficients = coefficient_matrix(pt_params, parameterization, n_draws)
+
+    rows = [row for row in (truth_row, ) if row is not None]
+    if coefficients is not None:
+        rows.append(coefficients)
+    if len(rows) == 0:
+        return None, None
+    # all profiles in one product, the truth is the first row if there is one
+    profiles = np.vstack(rows) @ basis.T
+
+    truth_profile = None
+    if truth_row is not None:
+        truth_profile, profiles = profiles[0], profiles[1:]
+    envelope = None if coefficients is None else np.percentile(profiles, percentiles, axis=0)
+    return truth_profile, envelope
+
+
+def parse_input_profile(content, path=''):
+    '''
+    Parse the content of a profile file with pressure [bar] and temperature [K] columns.
+
+    [Args]
+        content: bytes of the file
+        path: path of the file, for the error messages
+
+    [Returns]
+        log10 pressure, temperature
+    '''
+    data = np.loadtxt(io.BytesIO(content), comments='#', ndmin=2)
+    if data.shape[1] < 2:
+        raise ValueError('[parse_input_profile] %s has less than two columns.' % path)
+    if np.any(data[:, 0] <= 0):
+        raise ValueError('[parse_input_profile] %s has non-positive pressures.' % path)
+    # NB contiguous copies, the chart reads the arrays directly
+    return np.log10(data[:, 0]), np.ascontiguousarray(data[:, 1])
+
+
+def cached_input_profile(path, stat):
+    '''
+    [Args]
+        stat: os.stat_result of the file, e.g. the one cached by the FileService (no file access here)
+
+    [Returns]
+        log10 pressure, temperature of the file as parsed before, None if it was not parsed since it changed
+        (raises the ValueError of the file if it could not be parsed)
+    '''
+    cached = INPUT_PROFILE_CACHE.get(path)
+    if cached is None or cached[0] != (stat.st_size, stat.st_mtime_ns):
+        return None
+    if isinstance(cached[1], ValueError):
+        raise cached[1]
+    return cached[1]
+
+
+def store_input_profile(path, stat, content):
+    '''
+    Parse the content of a profile file read for stat and cache the result (or the parse error) until the file changes.
+
+    [Returns]
+        log10 pressure, temperature
+    '''
+    try:
+        profile = parse_input_profile(content, path)
+    except ValueError as error:
+        INPUT_PROFILE_CACHE[path] = ((stat.st_size, stat.st_mtime_ns), error)
+        raise
+    INPUT_PROFILE_CACHE[path] = ((stat.st_size, stat.st_mtime_ns), profile)
+    return profile
+
+
+def load_input_profile(path):
+    '''
+    Read a profile file with pressure [bar] and temperature [K] columns, cached until the file changes.
+    NB accesses the file directly, the GUI reads it through the FileService instead (see cached_input_profile)
+
+    [Returns]
+        log10 pressure, temperature
+    '''
+    stat = os.stat(path)
+    profile = cached_input_profile(path, stat)
+    if profile is not None:
+        return profile
+    with open(path, 'rb') as profile_file:
+        return store_input_profile(path, stat, profile_file.read())
@@ -0,0 +1,150 @@
+'''
+Flux-conserving rebinning of spectra onto grids of constant resolution R = wavelength / bin width.
+
+The edges of a constant-R grid grow geometrically, edge[i + 1] = edge[i] (2R + 1) / (2R - 1),
+so that the center of every bin is R times its width.
+A spectrum is taken as constant over the bins of its samples (with edges halfway between neighbouring samples),
+so its integral up to any wavelength is a cumulative sum plus a linear interpolation within one sample bin.
+The mean flux of an output bin is the difference of the integral at its edges divided by its width,
+computed for all bins at once with np.cumsum and np.interp. Output bins not fully covered by the spectrum are NaN.
+Samples with a non-finite flux are integrated as zero, and the width of their bins is integrated the same way,
+so exactly the output bins that overlap such a sample are NaN, rather than every bin after it.
+'''
+import math
+from functools import lru_cache
+
+import numpy as np
+
+from line_catalog import parse_line_name, DEFAULT_RESOLUTION
+from spectrum import Spectrum, load_window
+from units import DEFAULT_UNIT, parse_unit, convert_wavelength, convert_spectrum
+
+
+
+
+@lru_cache(maxsize=64)
+def constant_r_edges(resolution, lower, upper):
+    '''
+    [Args]
+        resolution: R
+        lower, upper: wavelength range, the last edge is the first one at or above upper
+
+    [Returns]
+        ascending bin edges (read-only, shared by everyone asking for the same grid)
+    '''
+    resolution = float(resolution)
+    if resolution <= 0.5 or not 0 < lower < upper:
+        raise ValueError('[constant_r_edges] Need R > 0.5 and 0 < lower < upper.')
+    ratio = (2 * resolution + 1) / (2 * resolution - 1)
+    n_bins = max(math.ceil(math.log(upper / lower) / math.log(ratio) - 1e-9), 1)
+    edges = lower * ratio**np.arange(n_bins + 1)
+    edges.flags.writeable = False
+    return edges
+
+
+def sample_edges(wavelength):
+    # edges of the bins of ascending samples, the outer bins are as wide as their neighbours
+    edges = np.empty(len(wavelength) + 1)
+    edges[1:-1] = 0.5 * (wavelength[1:] + wavelength[:-1])
+    edges[0] = 1.5 * wavelength[0] - 0.5 * wavelength[1]
+    edges[-1] = 1.5 * wavelength[-1] - 0.5 * wavelength[-2]
+    return edges
+
+
+def rebin(wavelength, flux, edges):
+    '''
+    [Args]
+        wavelength: sorted samples (ascending or descending), at least two
+        flux: flux of the samples
+        edges: ascending edges of the output bins
+
+    [Returns]
+        mean flux of every output bin, NaN if the bin is not fully covered by the samples or overlaps a non-finite flux
+    '''
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    flux = np.asarray(flux, dtype=np.float64)
+    if len(wavelength) < 2:
+        raise ValueError('[rebin] Need at least two samples.')
+    if wavelength[0] > wavelength[-1]:
+        wavelength, flux = wavelength[::-1], flux[::-1]
+
+    input_edges = sample_edges(wavelength)
+    widths = np.diff(input_edges)
+    finite = np.isfinite(flux)
+    integral = np.zeros(len(input_edges))
+    np.cumsum(np.where(finite, flux, 0.) * widths, out=integral[1:])
+    # NB the width of the non-finite samples only grows across them, so it differs exactly over the bins they overlap
+    invalid_width = np.zeros(len(input_edges))
+    np.cumsum(np.where(finite, 0., widths), out=invalid_width[1:])
+
+    rebinned = np.diff(np.interp(edges, input_edges, integral)) / np.diff(edges)
+    rebinned[(edges[:-1] < input_edges[0]) | (edges[1:] > input_edges[-1])] = np.nan
+    rebinned[np.diff(np.interp(edges, input_edges, invalid_width)) > 0] = np.nan
+    return rebinned
+
+
+def rebin_spectrum(spectrum, resolution, wavelength_range=None):
+    '''
+    [Args]
+        spectrum: Spectrum
+        resolution: R of the new grid
+        wavelength_range: [lower, upper] covered by the new grid, the range of the spectrum by default
+
+    [Returns]
+        Spectrum at the centers of the new bins (ascending)
+    '''
+    if wavelength_range is None:
+        wavelength_range = [np.min(spectrum.wavelength), np.max(spectrum.wavelength)]
+    edges = constant_r_edges(resolution, float(min(wavelength_range)), float(max(wavelength_range)))
+    flux = rebin(spectrum.wavelength, spectrum.flux, edges)
+    return Spectrum(0.5 * (edges[1:] + edges[:-1]), flux, spectrum.header, spectrum.path)
+
+
+def rebin_file(path, resolution, wavelength_range, unit=DEFAULT_UNIT):
+    '''
+    Rebin the part of a spectrum file within a wavelength range, large files are streamed (see spectrum.load_window).
+
+    [Args]
+        wavelength_range: [lower, upper] in the wavelength unit of DEFAULT_UNIT
+        unit: unit of the file, the spectrum is converted to DEFAULT_UNIT
+
+    [Returns]
+        Spectrum
+    '''
+    file_range = convert_wavelength(np.array(wavelength_range, dtype=float), parse_unit(DEFAULT_UNIT)[0], parse_unit(unit)[0])
+    spectrum = convert_spectrum(load_window(path, file_range), unit)
+    return rebin_spectrum(spectrum, resolution, wavelength_range)
+
+
+def config_resolution(config):
+    '''
+    [Returns]
+        the finest resolution of the lines of a config (the radiative transfer is solved at it), as an int
+    '''
+    resolutions = []
+    for param in config['CHEMICAL COMPOSITION PARAMETERS'].values():
+        if not isinstance(param, dict):
+            continue
+        for line in param.get('lines') or []:
+            parsed = parse_line_name(line)
+            if parsed is not None and parsed[1] != 'UV':
+                resolutions.append(int(parsed[1][-1]))
+    return max(resolutions, default=int(DEFAULT_RESOLUTION))
+
+
+
+
+if __name__ == '__main__':
+    # a non-finite flux sample only invalidates the output bins that overlap it
+    test_wavelength = np.linspace(3., 20., 5000)
+    test_flux = 1 + 0.1 * np.sin(test_wavelength)
+    test_edges = constant_r_edges(200, 3.5, 19.5)
+    reference = rebin(test_wavelength, test_flux, test_edges)
+    test_flux[2000] = np.nan
+    rebinned = rebin(test_wavelength, test_flux, test_edges)
+
+    sample_lower, sample_upper = sample_edges(test_wavelength)[2000:2002]
+    overlapping = (test_edges[:-1] < sample_upper) & (test_edges[1:] > sample_lower)
+    assert np.array_equal(np.isnan(rebinned), overlapping), 'NaN bins %d, overlapping bins %d' % (np.isnan(rebinned).sum(), overlapping.sum())
+    assert np.allclose(rebinned[~overlapping], reference[~overlapping], rtol=1e-12)
+    print('rebin: %d of %d bins NaN around one NaN sample' % (np.isnan(rebinned).sum(), len(rebinned)))
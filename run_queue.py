@@ -0,0 +1,304 @@
+'''
+Local queue of retrieval runs.
+
+Every submitted config becomes a job with its own folder under the output_folder of the config
+(<output_folder>/<config name>_<number>), holding a copy of the config whose output_folder points to the job folder,
+and the log of every attempt (run_<attempt>.log).
+The queue starts jobs as subprocesses (RETRIEVAL_COMMAND <config>) as long as the cores and the memory of the running
+jobs stay within the limits, by default all cores and the memory available when the queue was created.
+The memory of a job is its estimate from cost_model.py. Jobs are started in the order they were submitted,
+a job that does not fit is skipped for smaller jobs behind it, and a job larger than the limits runs on its own.
+Once a skipped job has waited for MAX_BACKFILL_WAIT seconds, no jobs behind it are started anymore until it runs,
+so a steady stream of small jobs cannot starve a large one.
+Nothing runs in the background: poll has to be called regularly (by a timer in the GUI, or by run_all).
+NB nothing in here may import PySide6, the queue is used by the CLI as well.
+'''
+import os
+import shlex
+import signal
+import subprocess
+from time import time, sleep
+
+from constants import RETRIEVAL_COMMAND
+from config_handler import ConfigHandler
+from cost_model import estimate_cost
+
+
+
+
+# seconds a cancelled job gets to exit before it is killed
+CANCEL_GRACE = 10.
+POLL_INTERVAL = 0.5
+# seconds a queued job that does not fit may be overtaken by smaller jobs
+MAX_BACKFILL_WAIT = 600.
+
+QUEUED, RUNNING, FINISHED, FAILED, CANCELLED = 'queued', 'running', 'finished', 'failed', 'cancelled'
+
+
+
+
+def available_cores():
+    # cores this process may run on, which can be fewer than the cores of the machine (e.g. in a batch job)
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def available_memory():
+    '''
+    [Returns]
+        bytes of memory available for new processes, None if unknown
+    '''
+    try:
+        with open('/proc/meminfo', 'r') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def new_job_folder(output_folder, name):
+    # the first free <name>_<number>, created right away so that concurrent submissions get different folders
+    number = 1
+    while True:
+        folder = os.path.join(output_folder, '%s_%d' % (name, number))
+        try:
+            os.makedirs(folder)
+            return folder
+        except FileExistsError:
+            number += 1
+
+
+
+
+class Job:
+    def __init__(self, job_id, config_path, folder, cores, memory_bytes):
+        self.job_id = job_id
+        self.config_path = config_path
+        self.folder = folder
+        self.cores = cores
+        self.memory_bytes = memory_bytes
+        self.state = QUEUED
+        self.attempts = 0
+        self.returncode = None
+        self.process = None
+        self.start_time = None
+        self.end_time = None
+        # time the job was (re)queued
+        self.queue_time = time()
+        # time of the cancellation of a running job, it is killed after CANCEL_GRACE seconds
+        self.cancel_time = None
+
+
+    def __repr__(self):
+        return 'Job(%d, %s, %s)' % (self.job_id, self.folder, self.state)
+
+
+    @property
+    def run_config(self):
+        # copy of the config the retrieval is started with
+        return os.path.join(self.folder, 'config.yaml')
+
+
+    @property
+    def log_path(self):
+        return os.path.join(self.folder, 'run_%d.log' % self.attempts)
+
+
+    @property
+    def runtime(self):
+        if self.start_time is None:
+            return None
+        return (time() if self.end_time is None else self.end_time) - self.start_time
+
+
+
+
+class RunQueue:
+    def __init__(self, max_cores=None, max_memory=None, command=None, max_backfill_wait=MAX_BACKFILL_WAIT):
+        '''
+        [Args]
+            max_cores: cores the running jobs may use together, all cores by default
+            max_memory: bytes the running jobs may use together, the available memory by default (no limit if unknown)
+            command: command of a retrieval as a list or a string, the config is appended, RETRIEVAL_COMMAND by default
+            max_backfill_wait: seconds a job that does not fit may be overtaken by smaller jobs behind it
+        '''
+        self.max_backfill_wait = max_backfill_wait
+        self.max_cores = available_cores() if max_cores is None else max_cores
+        self.max_memory = available_memory() if max_memory is None else max_memory
+        if command is None:
+            command = RETRIEVAL_COMMAND
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+        self.jobs = []
+
+
+    def submit(self, config_path, cores=1):
+        '''
+        Queue a run of a saved config.
+
+        [Args]
+            config_path: config file
+            cores: cores of the job, also passed on as OMP_NUM_THREADS
+
+        [Returns]
+            Job
+        '''
+        config = ConfigHandler(config_path)
+        try:
+            memory_bytes = estimate_cost(config.config).memory_bytes
+        except (KeyError, ValueError, TypeError, ZeroDivisionError): # NB the estimate is only needed for the scheduling
+            memory_bytes = 0.
+
+        # NB a relative output folder is taken relative to the config, the retrieval runs in the job folder
+        output_folder = os.path.join(os.path.dirname(os.path.abspath(config_path)), config['RUN SETTINGS']['output_folder'])
+        name = os.path.splitext(os.path.basename(config_path))[0]
+        folder = new_job_folder(output_folder, name)
+        config['RUN SETTINGS']['output_folder'] = folder
+
+        job = Job(len(self.jobs), os.path.abspath(config_path), folder, max(int(cores), 1), memory_bytes)
+        config.write_yaml(job.run_config)
+        self.jobs.append(job)
+        self.schedule()
+        return job
+
+
+    def cancel(self, job):
+        if job.state == QUEUED:
+            job.state = CANCELLED
+        elif job.state == RUNNING and job.cancel_time is None:
+            job.cancel_time = time()
+            # NB the whole process group, the retrieval may have started workers
+            self.signal(job, signal.SIGTERM)
+
+
+    def retry(self, job):
+        # a failed or cancelled job is queued again, in the same folder
+        if job.state in [FAILED, CANCELLED]:
+            job.state = QUEUED
+            job.queue_time = time()
+            job.returncode = None
+            job.cancel_time = None
+            self.schedule()
+
+
+    def signal(self, job, signum):
+        try:
+            os.killpg(job.process.pid, signum)
+        except (ProcessLookupError, PermissionError, AttributeError):
+            try:
+                job.process.send_signal(signum)
+            except ProcessLookupError:
+                pass
+
+
+    @property
+    def running(self):
+        return [job for job in self.jobs if job.state == RUNNING]
+
+
+    @property
+    def queued(self):
+        return [job for job in self.jobs if job.state == QUEUED]
+
+
+    @property
+    def done(self):
+        return len(self.running) == 0 and len(self.queued) == 0
+
+
+    def poll(self):
+        '''
+        Update the running jobs and start queued ones.
+
+        [Returns]
+            list of the jobs whose state changed
+        '''
+        changed = []
+        for job in self.running:
+            returncode = job.process.poll()
+            if returncode is None:
+                if job.cancel_time is not None and time() - job.cancel_time > CANCEL_GRACE:
+                    self.signal(job, signal.SIGKILL)
+                continue
+            job.returncode = returncode
+            job.end_time = time()
+            job.process = None
+            if job.cancel_time is not None:
+                job.state = CANCELLED
+            else:
+                job.state = FINISHED if returncode == 0 else FAILED
+            changed.append(job)
+        return changed + self.schedule()
+
+
+    def schedule(self):
+        '''
+        Start the queued jobs that fit.
+
+        [Returns]
+            list of the started jobs
+        '''
+        running = self.running
+        cores = sum(job.cores for job in running)
+        memory = sum(job.memory_bytes for job in running)
+        started = []
+        for job in self.queued:
+            fits = cores + job.cores <= self.max_cores and (self.max_memory is None or memory + job.memory_bytes <= self.max_memory)
+            # NB a job that exceeds the limits on its own runs alone
+            if not fits and cores != 0:
+                if time() - job.queue_time > self.max_backfill_wait:
+                    # the cores and memory that free up are kept for this job
+                    break
+                continue
+            self.start(job)
+            started.append(job)
+            if job.state == RUNNING:
+                cores += job.cores
+                memory += job.memory_bytes
+        return started
+
+
+    def start(self, job):
+        job.attempts += 1
+        environment = dict(os.environ, OMP_NUM_THREADS=str(job.cores))
+        with open(job.log_path, 'w') as log_file:
+            try:
+                job.process = subprocess.Popen(
+                    self.command + [job.run_config], cwd=job.folder, env=environment,
+                    stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT, start_new_session=True
+                )
+            except OSError as error: # e.g. the command is not found
+                log_file.write('[RunQueue.start] Could not start %s: %s\n' % (' '.join(self.command), error))
+                job.state = FAILED
+                return
+        job.state = RUNNING
+        job.start_time = time()
+        job.end_time = None
+
+
+    def run_all(self, poll_interval=POLL_INTERVAL, report=None):
+        '''
+        Poll until all jobs are done.
+
+        [Args]
+            report: function called with every job whose state changed
+        '''
+        changed = self.schedule()
+        while True:
+            if report is not None:
+                for job in changed:
+                    report(job)
+            if self.done:
+                return
+            sleep(poll_interval)
+            changed = self.poll()
+
+
+    def cancel_all(self):
+        for job in self.jobs:
+            self.cancel(job)
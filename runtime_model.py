@@ -0,0 +1,100 @@
+'''
+Estimate of the number of likelihood evaluations and the wall-clock time of a nested sampling run.
+
+Nested sampling shrinks the prior volume by a factor of about e every n_live iterations, so reaching the posterior
+takes about n_live * H iterations, H being the information gained (in nats), and the remaining evidence is collected
+within about TERMINATION_NATS further e-folds. H grows about linearly with the number of free parameters.
+Each iteration needs 1 / efficiency likelihood evaluations on average, the efficiency of drawing a point within the
+likelihood constraint drops with the dimension.
+The time per evaluation comes from cost_model.py, which is calibrated with measured runs.
+'''
+from collections import namedtuple
+
+
+
+
+# information gained per free parameter, in nats
+INFORMATION_PER_PARAMETER = 2.5
+# e-folds of the prior volume after the posterior bulk until the run terminates
+TERMINATION_NATS = 5.
+# efficiency = BASE_EFFICIENCY / (1 + n_free / EFFICIENCY_SCALE)
+BASE_EFFICIENCY = 0.5
+EFFICIENCY_SCALE = 8.
+
+# sections with parameters that can have a prior
+PARAMETER_SECTIONS = [
+    'PHYSICAL PARAMETERS',
+    'TEMPERATURE PARAMETERS',
+    'CHEMICAL COMPOSITION PARAMETERS',
+    'SCATTERING PARAMETERS',
+    'CLOUD PARAMETERS'
+]
+
+
+RuntimeEstimate = namedtuple('RuntimeEstimate', ['n_free', 'iterations', 'evaluations', 'seconds'])
+
+
+
+
+def free_parameters(config):
+    '''
+    [Returns]
+        set of (section, name) of the parameters with a prior
+    '''
+    free = set()
+    for section in PARAMETER_SECTIONS:
+        for name, param in (config.get(section) or {}).items():
+            if isinstance(param, dict) and param.get('prior') is not None:
+                free.add((section, name))
+    return free
+
+
+def estimate_runtime(live_points, n_free, call_seconds=None, processes=1):
+    '''
+    [Args]
+        live_points: number of live points
+        n_free: number of free parameters
+        call_seconds: time of a likelihood evaluation (see cost_model.estimate_cost), None if unknown
+        processes: number of processes evaluating the likelihood in parallel
+
+    [Returns]
+        RuntimeEstimate, seconds is None if call_seconds is
+    '''
+    iterations = live_points * (INFORMATION_PER_PARAMETER * n_free + TERMINATION_NATS)
+    efficiency = BASE_EFFICIENCY / (1 + n_free / EFFICIENCY_SCALE)
+    evaluations = iterations / efficiency
+    seconds = None if call_seconds is None else evaluations * call_seconds / max(processes, 1)
+    return RuntimeEstimate(n_free, iterations, evaluations, seconds)
+
+
+
+
+class FreeParameterSet:
+    '''
+    Free parameters of a config, kept up to date with single updates as prior boxes change.
+    '''
+    def __init__(self, config=None):
+        self.free = set()
+        if config is not None:
+            self.reset(config)
+
+
+    def __len__(self):
+        return len(self.free)
+
+
+    def reset(self, config):
+        self.free = free_parameters(config)
+
+
+    def update(self, section, updates):
+        '''
+        [Args]
+            section: config section of the parameters
+            updates: dictionary name -> whether the parameter is free, False for removed parameters
+        '''
+        for name, free in updates.items():
+            if free:
+                self.free.add((section, name))
+            else:
+                self.free.discard((section, name))
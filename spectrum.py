@@ -0,0 +1,360 @@
+'''
+Loading of input spectra.
+
+A spectrum file has two whitespace separated columns (wavelength and flux), optionally preceded by comment lines starting with '#'.
+Parsed spectra are cached in SPECTRUM_CACHE_DIR as .npy files that are memory-mapped on later loads,
+together with a small JSON file recording the header and the size and modification time of the source.
+A cache entry is rebuilt automatically as soon as the source file changes.
+
+Files too large to be loaded whole are streamed instead (see iter_blocks): the data is parsed in chunks of about
+CHUNK_SIZE bytes, and since the wavelengths are sorted (in either order), the first chunk of a wavelength window is found
+by a binary search on byte offsets, reading a single line per step.
+'''
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from constants import CACHE_DIR
+
+
+
+
+SPECTRUM_CACHE_DIR = os.path.join(CACHE_DIR, 'spectra')
+# bytes of a file parsed at once when streaming
+CHUNK_SIZE = 4 * 2**20
+# files larger than this are streamed rather than loaded whole
+STREAM_SIZE = 256 * 2**20
+
+
+
+
+class Spectrum:
+    def __init__(self, wavelength, flux, header=None, path=None):
+        '''
+        [Args]
+            wavelength: 1D array, in the order of the file
+            flux: 1D array of the same length
+            header: list of comment lines (without the leading '#')
+            path: file the spectrum was read from
+        '''
+        self.wavelength = wavelength
+        self.flux = flux
+        self.header = [] if header is None else header
+        self.path = path
+
+
+    def __len__(self):
+        return len(self.wavelength)
+
+
+
+
+def read_header(spectrum_file):
+    '''
+    Read the comment lines at the top of an open (text or binary) spectrum file, the file is left at the first data line.
+    '''
+    header = []
+    while True:
+        position = spectrum_file.tell()
+        line = spectrum_file.readline()
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.startswith('#'):
+            spectrum_file.seek(position)
+            return header
+        header.append(line[1:].strip())
+
+
+def parse_spectrum(path):
+    '''
+    Parse a spectrum file without using the cache.
+
+    [Returns]
+        Spectrum
+    '''
+    with open(path, 'r', encoding='utf-8') as spectrum_file:
+        header = read_header(spectrum_file)
+        data = np.loadtxt(spectrum_file, dtype=np.float64, comments='#', ndmin=2)
+    if data.shape[1] < 2:
+        raise ValueError('[parse_spectrum] %s has less than two columns.' % path)
+    # NB one row per column so that wavelength and flux are contiguous
+    data = np.ascontiguousarray(data[:, :2].T)
+    return Spectrum(data[0], data[1], header, path)
+
+
+def cache_paths(path, cache_dir):
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(cache_dir, key + '.npy'), os.path.join(cache_dir, key + '.json')
+
+
+def load_spectrum(path, use_cache=True, cache_dir=None):
+    '''
+    Load a spectrum, from the cache if it is up to date.
+
+    [Args]
+        path: spectrum file
+        use_cache: whether to read and write the cache
+        cache_dir: folder of the cache, SPECTRUM_CACHE_DIR by default
+
+    [Returns]
+        Spectrum, read-only memory-mapped arrays if it was loaded from the cache
+    '''
+    if not use_cache:
+        return parse_spectrum(path)
+    if cache_dir is None:
+        cache_dir = SPECTRUM_CACHE_DIR
+
+    stat = os.stat(path)
+    data_path, meta_path = cache_paths(path, cache_dir)
+    key = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+        if meta['key'] == key:
+            data = np.load(data_path, mmap_mode='r')
+            return Spectrum(data[0], data[1], meta['header'], path)
+    except (OSError, ValueError, KeyError):
+        pass # no cache yet, or it is damaged: rebuild
+
+    spectrum = parse_spectrum(path)
+    try:
+        write_cache(spectrum, key, data_path, meta_path)
+    except OSError as error:
+        print('[load_spectrum] Could not cache %s: %s' % (path, error))
+    return spectrum
+
+
+def write_cache(spectrum, key, data_path, meta_path):
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+    # write to temporary files first so that concurrent loads never see half-written files
+    # NB the meta data is replaced last, so a matching key always refers to complete data
+    tmp_suffix = '.%d.tmp' % os.getpid()
+    with open(data_path + tmp_suffix, 'wb') as data_file:
+        np.save(data_file, np.stack([spectrum.wavelength, spectrum.flux]))
+    with open(meta_path + tmp_suffix, 'w', encoding='utf-8') as meta_file:
+        json.dump({'key': key, 'header': spectrum.header}, meta_file)
+    os.replace(data_path + tmp_suffix, data_path)
+    os.replace(meta_path + tmp_suffix, meta_path)
+
+
+
+
+def parse_block(lines):
+    '''
+    [Args]
+        lines: list of data lines (bytes), comment and empty lines are skipped
+
+    [Returns]
+        wavelength, flux: contiguous arrays
+    '''
+    lines = [line for line in lines if line.strip() != b'' and not line.lstrip().startswith(b'#')]
+    if len(lines) == 0:
+        return np.empty(0), np.empty(0)
+    data = np.loadtxt(lines, dtype=np.float64, ndmin=2)
+    if data.shape[1] < 2:
+        raise ValueError('[parse_block] Found lines with less than two columns.')
+    data = np.ascontiguousarray(data[:, :2].T)
+    return data[0], data[1]
+
+
+def next_wavelength(spectrum_file, offset, end):
+    '''
+    Wavelength of the first data line starting at or after offset.
+
+    [Returns]
+        offset of the line, its wavelength (None if there is no data line before end)
+    '''
+    spectrum_file.seek(offset)
+    if offset > 0:
+        spectrum_file.seek(offset - 1)
+        spectrum_file.readline() # rest of the line offset is in, an empty line if offset is a line start
+    while spectrum_file.tell() < end:
+        position = spectrum_file.tell()
+        fields = spectrum_file.readline().split()
+        if len(fields) != 0 and not fields[0].startswith(b'#'):
+            return position, float(fields[0])
+    return end, None
+
+
+def last_wavelength(spectrum_file, start, end):
+    # the end of the file is read backwards in steps of 4 kB until it contains a data line
+    position = end
+    while position > start:
+        position = max(position - 4096, start)
+        spectrum_file.seek(position)
+        lines = spectrum_file.read(end - position).splitlines()
+        if position > start: # the first line may be cut
+            lines = lines[1:]
+        for line in reversed(lines):
+            fields = line.split()
+            if len(fields) != 0 and not fields[0].startswith(b'#'):
+                return float(fields[0])
+    return None
+
+
+def seek_wavelength(spectrum_file, wavelength, start, end, descending):
+    '''
+    Binary search for the first data line between the offsets start and end whose wavelength is not before wavelength,
+    in the order of the file.
+
+    [Returns]
+        offset of the line, end if there is none
+    '''
+    sign = -1 if descending else 1
+    lower, upper = start, end
+    while lower < upper:
+        middle = (lower + upper) // 2
+        _, found = next_wavelength(spectrum_file, middle, end)
+        if found is None or sign * found >= sign * wavelength:
+            upper = middle
+        else:
+            lower = middle + 1
+    return next_wavelength(spectrum_file, lower, end)[0]
+
+
+def iter_blocks(path, wavelength_range=None, chunk_size=CHUNK_SIZE):
+    '''
+    Stream a spectrum file in blocks, the memory use does not depend on the size of the file.
+
+    [Args]
+        path: spectrum file, the wavelengths must be sorted (ascending or descending)
+        wavelength_range: [lower, upper], only the blocks covering the range are read (trimmed to it), the whole file by default
+        chunk_size: approximate number of bytes per block
+
+    [Yields]
+        wavelength, flux: arrays of a block, in the order of the file
+    '''
+    with open(path, 'rb') as spectrum_file:
+        read_header(spectrum_file)
+        start = spectrum_file.tell()
+        end = os.fstat(spectrum_file.fileno()).st_size
+
+        if wavelength_range is not None:
+            lower, upper = min(wavelength_range), max(wavelength_range)
+            _, first = next_wavelength(spectrum_file, start, end)
+            if first is None:
+                return
+            last = last_wavelength(spectrum_file, start, end)
+            descending = first > last
+            start = seek_wavelength(spectrum_file, upper if descending else lower, start, end, descending)
+
+        spectrum_file.seek(start)
+        while spectrum_file.tell() < end:
+            # NB a chunk is completed to the end of its last line
+            chunk = spectrum_file.read(chunk_size) + spectrum_file.readline()
+            wavelength, flux = parse_block(chunk.splitlines())
+            if wavelength_range is None:
+                yield wavelength, flux
+                continue
+            inside = (wavelength >= lower) & (wavelength <= upper)
+            yield wavelength[inside], flux[inside]
+            # the block reached the end of the window (the window starts at the first line of the first block)
+            if len(wavelength) != 0 and not inside[-1]:
+                return
+
+
+def read_window(path, wavelength_range, chunk_size=CHUNK_SIZE):
+    '''
+    Read the part of a spectrum file within a wavelength range, by streaming only the chunks covering it.
+
+    [Returns]
+        Spectrum
+    '''
+    with open(path, 'r', encoding='utf-8') as spectrum_file:
+        header = read_header(spectrum_file)
+    blocks = list(iter_blocks(path, wavelength_range, chunk_size))
+    if len(blocks) == 0:
+        return Spectrum(np.empty(0), np.empty(0), header, path)
+    wavelength = np.concatenate([block[0] for block in blocks])
+    flux = np.concatenate([block[1] for block in blocks])
+    return Spectrum(wavelength, flux, header, path)
+
+
+def load_window(path, wavelength_range, use_cache=True):
+    '''
+    Load the part of a spectrum within a wavelength range, streamed for files larger than STREAM_SIZE
+    and from the whole (cached) spectrum otherwise.
+
+    [Returns]
+        Spectrum
+    '''
+    if os.stat(path).st_size > STREAM_SIZE:
+        return read_window(path, wavelength_range)
+    spectrum = load_spectrum(path, use_cache)
+    lower, upper = min(wavelength_range), max(wavelength_range)
+    inside = (spectrum.wavelength >= lower) & (spectrum.wavelength <= upper)
+    return Spectrum(spectrum.wavelength[inside], spectrum.flux[inside], spectrum.header, path)
+
+
+
+class MinMaxPyramid:
+    '''
+    Decimation levels of a spectrum for drawing.
+    Level k holds the minimum and maximum flux of buckets of 2**(k+1) consecutive points,
+    so any wavelength window can be drawn with at most a few points per pixel, independent of the file size.
+    '''
+    # no further levels are built once a level has fewer buckets than this
+    MIN_BUCKETS = 256
+
+    def __init__(self, wavelength, flux):
+        # NB the levels need ascending wavelengths, files in descending order are reversed (a view, no copy)
+        if len(wavelength) > 1 and wavelength[0] > wavelength[-1]:
+            wavelength = wavelength[::-1]
+            flux = flux[::-1]
+        self.wavelength = np.asarray(wavelength)
+        self.flux = np.asarray(flux)
+
+        self.levels = []
+        x, lower, upper = self.wavelength, self.flux, self.flux
+        while len(x) > MinMaxPyramid.MIN_BUCKETS:
+            n_pairs = len(x) // 2
+            # with an odd number of buckets, the last one is carried over as it is
+            new_lower = lower[0::2].copy()
+            new_lower[:n_pairs] = np.minimum(lower[0:2*n_pairs:2], lower[1:2*n_pairs:2])
+            new_upper = upper[0::2].copy()
+            new_upper[:n_pairs] = np.maximum(upper[0:2*n_pairs:2], upper[1:2*n_pairs:2])
+            x, lower, upper = x[0::2], new_lower, new_upper
+            self.levels.append((x, lower, upper))
+
+
+    @property
+    def wavelength_limits(self):
+        return float(self.wavelength[0]), float(self.wavelength[-1])
+
+
+    @property
+    def flux_limits(self):
+        if len(self.levels) == 0:
+            return float(np.nanmin(self.flux)), float(np.nanmax(self.flux))
+        _, lower, upper = self.levels[-1]
+        return float(np.nanmin(lower)), float(np.nanmax(upper))
+
+
+    def points(self, lower, upper, n_pixels):
+        '''
+        Points to draw the wavelength window [lower, upper] on n_pixels pixels.
+
+        [Returns]
+            x, y: arrays, the raw data if it is sparse enough, otherwise the minimum and maximum of each bucket
+        '''
+        start = max(np.searchsorted(self.wavelength, lower, 'left') - 1, 0)
+        stop = min(np.searchsorted(self.wavelength, upper, 'right') + 1, len(self.wavelength))
+        n_points = stop - start
+        n_pixels = max(int(n_pixels), 1)
+
+        if n_points <= 2 * n_pixels or len(self.levels) == 0:
+            return self.wavelength[start:stop], self.flux[start:stop]
+
+        # smallest level with at most one bucket per pixel
+        level = min(int(np.ceil(np.log2(n_points / n_pixels))), len(self.levels))
+        x, bucket_lower, bucket_upper = self.levels[level - 1]
+        first, last = start >> level, ((stop - 1) >> level) + 1
+
+        xs = np.repeat(x[first:last], 2)
+        ys = np.empty(len(xs))
+        ys[0::2] = bucket_lower[first:last]
+        ys[1::2] = bucket_upper[first:last]
+        return xs, ys
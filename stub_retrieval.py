@@ -0,0 +1,34 @@
+'''
+Stand-in for the retrieval, to try the run queue (run_queue.py) without it:
+    PYRETLIFE_RETRIEVAL_COMMAND="python /path/to/stub_retrieval.py" python cli.py run config.yaml
+
+It reads the config, works for about live_points / 100 seconds (PYRETLIFE_STUB_SECONDS overrides this)
+and writes stub_result.yaml to the output folder of the config. It fails if the config cannot be read.
+'''
+import os
+import sys
+from time import time, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from config_handler import ConfigHandler
+from yaml_io import write_yaml_file
+
+
+
+
+def main(config_path):
+    start_time = time()
+    config = ConfigHandler(config_path)
+    seconds = float(os.environ.get('PYRETLIFE_STUB_SECONDS', config['RUN SETTINGS']['live_points'] / 100))
+    print('stub retrieval of %s on %s threads, %g s' % (config_path, os.environ.get('OMP_NUM_THREADS', '?'), seconds), flush=True)
+    sleep(seconds)
+
+    result = {'config': os.path.abspath(config_path), 'seconds': time() - start_time}
+    write_yaml_file(result, os.path.join(config['RUN SETTINGS']['output_folder'], 'stub_result.yaml'))
+    print('done', flush=True)
+
+
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
@@ -0,0 +1,268 @@
+'''
+Parameter sweeps around a base config.
+
+A sweep spec is a YAML file (or dictionary) like
+
+    mode: latin-hypercube       # grid, random or latin-hypercube
+    samples: 1000               # number of configs, ignored for grid
+    seed: 42
+    parameters:
+      RUN SETTINGS.live_points: [400, 600, 800]
+      RUN SETTINGS.n_layers: {range: [50, 150], integer: true}
+      PHYSICAL PARAMETERS.R_pl.truth: {range: [0.8, 1.2], num: 5}
+      CHEMICAL COMPOSITION PARAMETERS.CO2.truth: {range: [1.0e-5, 1.0e-2], log: true}
+      species: [[N2, O2, CO2], [N2, O2, CO2, CH4, H2O]]
+
+Lists are choices, ranges are sampled uniformly (in log10 space if log is set).
+For grids, ranges need the number of grid points 'num'.
+The special key 'species' selects which species of the base config are kept.
+
+The configs are generated lazily and written by a process pool, so the sweep is never held in memory as a whole.
+Every written config gets a row in manifest.csv in the output folder.
+'''
+import copy
+import csv
+import itertools
+import math
+import os
+import random
+from multiprocessing import Pool
+
+from config_handler import ConfigHandler
+from yaml_io import load_yaml
+
+
+
+
+SWEEP_MODES = ['grid', 'random', 'latin-hypercube']
+SPECIES_KEY = 'species'
+
+
+
+
+class ChoiceDimension:
+    def __init__(self, path, values):
+        if not isinstance(values, list) or len(values) == 0:
+            raise ValueError('[ChoiceDimension] %s: choices must be a non-empty list.' % path)
+        self.path = path
+        self.values = values
+
+
+    def grid_values(self):
+        return self.values
+
+
+    def value_at(self, u):
+        # u is uniform in [0, 1)
+        return self.values[min(int(u * len(self.values)), len(self.values) - 1)]
+
+
+
+
+class RangeDimension:
+    def __init__(self, path, spec):
+        try:
+            self.lower, self.upper = (float(bound) for bound in spec['range'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('[RangeDimension] %s: range must be given as [lower, upper].' % path)
+        self.path = path
+        self.num = spec.get('num')
+        self.log = spec.get('log', False)
+        self.integer = spec.get('integer', False)
+
+        if self.log:
+            if self.lower <= 0 or self.upper <= 0:
+                raise ValueError('[RangeDimension] %s: log ranges must be positive.' % path)
+            self.lower, self.upper = math.log10(self.lower), math.log10(self.upper)
+
+
+    def grid_values(self):
+        if self.num is None:
+            raise ValueError('[RangeDimension.grid_values] %s: grid sweeps need the number of points (num) for ranges.' % self.path)
+        if self.num == 1:
+            return [self.value_at(0.)]
+        return [self.value_at(i / (self.num - 1)) for i in range(self.num)]
+
+
+    def value_at(self, u):
+        value = self.lower + u * (self.upper - self.lower)
+        if self.log:
+            value = 10**value
+        if self.integer:
+            value = int(round(value))
+        return value
+
+
+
+
+class SweepSpec:
+    def __init__(self, spec):
+        if isinstance(spec, str):
+            with open(spec, 'r') as spec_file:
+                spec = load_yaml(spec_file)
+
+        self.mode = spec.get('mode', 'grid')
+        if self.mode not in SWEEP_MODES:
+            raise ValueError('[SweepSpec] Unknown sweep mode %s, use one of %s.' % (self.mode, ', '.join(SWEEP_MODES)))
+        self.samples = spec.get('samples')
+        if self.mode != 'grid' and not isinstance(self.samples, int):
+            raise ValueError('[SweepSpec] Mode %s needs the number of samples.' % self.mode)
+        self.seed = spec.get('seed')
+
+        self.dimensions = []
+        for path, values in spec.get('parameters', {}).items():
+            if isinstance(values, dict):
+                self.dimensions.append(RangeDimension(path, values))
+            else:
+                self.dimensions.append(ChoiceDimension(path, values))
+        if len(self.dimensions) == 0:
+            raise ValueError('[SweepSpec] No parameters to sweep.')
+
+
+    @property
+    def paths(self):
+        return [dim.path for dim in self.dimensions]
+
+
+    def __len__(self):
+        if self.mode == 'grid':
+            return math.prod(len(dim.grid_values()) for dim in self.dimensions)
+        return self.samples
+
+
+    def assignments(self):
+        '''
+        Generator of the swept values, each assignment is a list with one value per dimension.
+        '''
+        if self.mode == 'grid':
+            yield from (list(values) for values in itertools.product(*(dim.grid_values() for dim in self.dimensions)))
+            return
+
+        rng = random.Random(self.seed)
+        if self.mode == 'random':
+            for _ in range(self.samples):
+                yield [dim.value_at(rng.random()) for dim in self.dimensions]
+            return
+
+        # latin hypercube: each dimension visits each of the strata exactly once
+        strata = []
+        for _ in self.dimensions:
+            stratum_order = list(range(self.samples))
+            rng.shuffle(stratum_order)
+            strata.append(stratum_order)
+        for i in range(self.samples):
+            yield [dim.value_at((order[i] + rng.random()) / self.samples) for dim, order in zip(self.dimensions, strata)]
+
+
+
+
+def apply_assignment(config, paths, values):
+    '''
+    Write the values of one assignment into a ConfigHandler.
+    Values under a species that the species choice of the assignment removes are skipped
+    (e.g. the CO2 truth in a config without CO2), they would otherwise add the species back without prior and lines.
+    '''
+    assignment = dict(zip(paths, values))
+    removed = set()
+    if SPECIES_KEY in assignment:
+        removed = set(config['CHEMICAL COMPOSITION PARAMETERS']) - set(assignment[SPECIES_KEY]) - {'mmw_inert'}
+        select_species(config, assignment[SPECIES_KEY])
+    for path, value in assignment.items():
+        keys = path.split('.')
+        if path == SPECIES_KEY or (keys[0] == 'CHEMICAL COMPOSITION PARAMETERS' and len(keys) > 1 and keys[1] in removed):
+            continue
+        config.set_value(path, value)
+
+
+def select_species(config, species):
+    composition = config['CHEMICAL COMPOSITION PARAMETERS']
+    missing = [formula for formula in species if formula not in composition]
+    if len(missing) != 0:
+        raise KeyError('[select_species] Species %s not found in base config.' % ', '.join(missing))
+    config['CHEMICAL COMPOSITION PARAMETERS'] = {key: value for key, value in composition.items() if key == 'mmw_inert' or key in species}
+
+
+def manifest_value(value):
+    if isinstance(value, list):
+        return ';'.join(str(v) for v in value)
+    return value
+
+
+
+
+# state of the worker processes, set once by init_worker instead of being sent with every task
+_worker_state = {}
+
+
+def init_worker(base_config, paths, output_folder, name_format):
+    _worker_state['base_config'] = base_config
+    _worker_state['paths'] = paths
+    _worker_state['output_folder'] = output_folder
+    _worker_state['name_format'] = name_format
+
+
+def write_config(task):
+    index, values = task
+    config = ConfigHandler(copy.deepcopy(_worker_state['base_config']))
+    apply_assignment(config, _worker_state['paths'], values)
+    file_name = _worker_state['name_format'] % index
+    # NB no fsync, it would dominate the run time on network file systems and the sweep can simply be rerun
+    config.write_yaml(os.path.join(_worker_state['output_folder'], file_name), sync=False)
+    return index, file_name, values
+
+
+
+
+def run_sweep(base_config, spec, output_folder, processes=None, chunksize=64):
+    '''
+    Write one config per assignment of the sweep spec, together with manifest.csv.
+
+    [Args]
+        base_config: ConfigHandler, dictionary or path of the base config
+        spec: SweepSpec, dictionary or path of the sweep spec
+        output_folder: folder for the configs and the manifest, created if necessary
+        processes: number of worker processes, None uses all cores, 1 writes in this process
+        chunksize: number of configs sent to a worker at once
+
+    [Returns]
+        number of written configs
+    '''
+    if not isinstance(base_config, ConfigHandler):
+        base_config = ConfigHandler(base_config)
+    if not isinstance(spec, SweepSpec):
+        spec = SweepSpec(spec)
+    os.makedirs(output_folder, exist_ok=True)
+
+    name_format = 'config_%%0%dd.yaml' % max(len(str(len(spec) - 1)), 1)
+    init_args = (base_config.config, spec.paths, output_folder, name_format)
+    tasks = enumerate(spec.assignments())
+
+    n_written = 0
+    with open(os.path.join(output_folder, 'manifest.csv'), 'w', newline='') as manifest_file:
+        manifest = csv.writer(manifest_file)
+        manifest.writerow(['index', 'file'] + spec.paths)
+
+        if processes == 1:
+            init_worker(*init_args)
+            results = map(write_config, tasks)
+        else:
+            results = pooled_results(tasks, init_args, processes, chunksize)
+        
+        for index, file_name, values in results:
+            manifest.writerow([index, file_name] + [manifest_value(v) for v in values])
+            n_written += 1
+
+    return n_written
+
+
+def pooled_results(tasks, init_args, processes, chunksize):
+    if processes is None:
+        processes = os.cpu_count()
+    # NB Pool.imap consumes its whole input at once, so the tasks are handed over in batches to bound the memory
+    batch_size = chunksize * processes * 4
+    with Pool(processes, initializer=init_worker, initargs=init_args) as pool:
+        while True:
+            batch = list(itertools.islice(tasks, batch_size))
+            if len(batch) == 0:
+                return
+            yield from pool.imap(write_config, batch, chunksize)
\ No newline at end of file
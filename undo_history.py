@@ -0,0 +1,110 @@
+'''
+Undo/redo history of a config as a log of structural changes.
+
+A step is the list of Change (path, old, new) between two states of the config, as found by config_diff.diff,
+so its memory is proportional to what changed rather than to the size of the config.
+Undoing a step writes the old values back (see ConfigHandler.apply_changes), redoing it writes the new values.
+The oldest steps are dropped once the history exceeds its memory budget.
+'''
+import sys
+
+
+
+
+# memory budget of the history, in bytes
+UNDO_BUDGET = 16 * 2**20
+
+
+
+
+def value_size(value):
+    # approximate memory of a value of the config, including its contents
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(value_size(key) + value_size(child) for key, child in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(value_size(child) for child in value)
+    return size
+
+
+
+
+class UndoHistory:
+    def __init__(self, budget=UNDO_BUDGET):
+        '''
+        [Args]
+            budget: memory budget in bytes, the oldest steps are dropped beyond it (the latest step is always kept)
+        '''
+        self.budget = budget
+        # lists of (changes, size), the last entry is undone or redone first
+        self.undo_steps = []
+        self.redo_steps = []
+        self.size = 0
+
+
+    def __len__(self):
+        return len(self.undo_steps)
+
+
+    @property
+    def can_undo(self):
+        return len(self.undo_steps) != 0
+
+
+    @property
+    def can_redo(self):
+        return len(self.redo_steps) != 0
+
+
+    def clear(self):
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.size = 0
+
+
+    def record(self, changes):
+        '''
+        Add a step, this discards the steps that were undone.
+
+        [Args]
+            changes: list of Change, from the previous state to the current one
+        '''
+        if len(changes) == 0:
+            return
+        # NB the values of changes found by diff are not shared with the config (see config_diff.HashTree),
+        # so editors that modify the config in place cannot change the recorded steps
+        size = sum(value_size(change) for change in changes)
+
+        for _, redo_size in self.redo_steps:
+            self.size -= redo_size
+        self.redo_steps.clear()
+        self.undo_steps.append((changes, size))
+        self.size += size
+
+        while self.size > self.budget and len(self.undo_steps) > 1:
+            _, dropped_size = self.undo_steps.pop(0)
+            self.size -= dropped_size
+
+
+    def undo(self):
+        '''
+        [Returns]
+            changes of the last step (to be applied reversed), None if there is nothing to undo
+        '''
+        if not self.can_undo:
+            return None
+        step = self.undo_steps.pop()
+        self.redo_steps.append(step)
+        return step[0]
+
+
+    def redo(self):
+        '''
+        [Returns]
+            changes of the last undone step, None if there is nothing to redo
+        '''
+        if not self.can_redo:
+            return None
+        step = self.redo_steps.pop()
+        self.undo_steps.append(step)
+        return step[0]
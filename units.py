@@ -0,0 +1,128 @@
+'''
+Conversion of the wavelength and flux units of input spectra (the options of UNITS).
+
+A flux unit is a spectral flux density, of energy or photons, per unit wavelength or per unit frequency.
+Converting between any two of them multiplies by a constant and by a power of the wavelength:
+    photons = energy * wavelength / (h c)
+    per unit frequency = per unit wavelength * wavelength**2 / c
+so a conversion is a (factor, power) pair, computed once per pair of units and cached,
+and whole arrays are converted with a single expression.
+'''
+from functools import lru_cache
+
+import numpy as np
+
+from constants import UNITS
+from spectrum import Spectrum
+
+
+
+
+PLANCK = 6.62607015e-34 # J s
+LIGHT_SPEED = 299792458. # m s-1
+
+# wavelength unit -> metres
+WAVELENGTH_UNITS = {
+    'micron': 1e-6,
+    'nm': 1e-9,
+    'angstrom': 1e-10,
+    'cm': 1e-2,
+    'm': 1.
+}
+
+# flux unit -> (photons, per unit frequency, factor to W m-2 m-1, W m-2 Hz-1, photon s-1 m-2 m-1 or photon s-1 m-2 Hz-1)
+FLUX_UNITS = {
+    'erg s-1 Hz-1 m-2': (False, True, 1e-7),
+    'erg s-1 Hz-1 cm-2': (False, True, 1e-3),
+    'W m-2 Hz-1': (False, True, 1.),
+    'Jy': (False, True, 1e-26),
+    'mJy': (False, True, 1e-29),
+    'W m-2 micron-1': (False, False, 1e6),
+    'erg s-1 cm-2 micron-1': (False, False, 1e-3 * 1e6),
+    'erg s-1 cm-2 angstrom-1': (False, False, 1e-3 * 1e10),
+    'photon s-1 m-2 micron-1': (True, False, 1e6),
+    'photon s-1 cm-2 angstrom-1': (True, False, 1e4 * 1e10),
+    'photon s-1 m-2 Hz-1': (True, True, 1.)
+}
+
+DEFAULT_UNIT = '%s, %s' % (UNITS['wavelength']['default'], UNITS['flux']['default'])
+
+
+
+
+def parse_unit(unit):
+    '''
+    [Args]
+        unit: unit of a data file, '<wavelength unit>, <flux unit>'
+
+    [Returns]
+        wavelength unit, flux unit
+    '''
+    units = unit.split(', ') if isinstance(unit, str) else []
+    if len(units) != 2 or units[0] not in WAVELENGTH_UNITS or units[1] not in FLUX_UNITS:
+        raise ValueError('[parse_unit] Unknown unit %s.' % unit)
+    return units[0], units[1]
+
+
+@lru_cache(maxsize=None)
+def flux_factor(from_unit, to_unit):
+    '''
+    [Returns]
+        factor, power: flux in to_unit = flux in from_unit * factor * (wavelength in m)**power
+    '''
+    if from_unit not in FLUX_UNITS or to_unit not in FLUX_UNITS:
+        raise ValueError('[flux_factor] Unknown flux unit %s.' % (from_unit if from_unit not in FLUX_UNITS else to_unit))
+    from_photons, from_frequency, from_scale = FLUX_UNITS[from_unit]
+    to_photons, to_frequency, to_scale = FLUX_UNITS[to_unit]
+
+    factor, power = from_scale / to_scale, 0
+    if to_photons != from_photons:
+        sign = 1 if to_photons else -1
+        factor *= (PLANCK * LIGHT_SPEED)**-sign
+        power += sign
+    if to_frequency != from_frequency:
+        sign = 1 if to_frequency else -1
+        factor *= LIGHT_SPEED**-sign
+        power += 2 * sign
+    return factor, power
+
+
+def convert_wavelength(wavelength, from_unit, to_unit):
+    if from_unit == to_unit:
+        return wavelength
+    return np.asarray(wavelength) * (WAVELENGTH_UNITS[from_unit] / WAVELENGTH_UNITS[to_unit])
+
+
+def convert_flux(flux, wavelength, from_unit, to_unit, wavelength_unit='micron'):
+    '''
+    [Args]
+        flux: array of the flux in from_unit
+        wavelength: array of the wavelengths of the flux, in wavelength_unit
+
+    [Returns]
+        array of the flux in to_unit (flux itself if the units are the same)
+    '''
+    factor, power = flux_factor(from_unit, to_unit)
+    if power == 0:
+        return flux if factor == 1 else np.asarray(flux) * factor
+    # NB the factor of the wavelength unit is folded into the constant, the wavelengths are not converted
+    factor *= WAVELENGTH_UNITS[wavelength_unit]**power
+    return np.asarray(flux) * factor * np.asarray(wavelength)**power
+
+
+def convert_spectrum(spectrum, unit, to_unit=DEFAULT_UNIT):
+    '''
+    [Args]
+        spectrum: Spectrum in unit
+        unit, to_unit: units as in the data files, '<wavelength unit>, <flux unit>'
+
+    [Returns]
+        Spectrum in to_unit (spectrum itself if the units are the same)
+    '''
+    from_wavelength, from_flux = parse_unit(unit)
+    to_wavelength, to_flux = parse_unit(to_unit)
+    if (from_wavelength, from_flux) == (to_wavelength, to_flux):
+        return spectrum
+    flux = convert_flux(spectrum.flux, spectrum.wavelength, from_flux, to_flux, from_wavelength)
+    wavelength = convert_wavelength(spectrum.wavelength, from_wavelength, to_wavelength)
+    return Spectrum(wavelength, flux, spectrum.header, spectrum.path)
@@ -0,0 +1,113 @@
+from PySide6.QtCore import Signal
+from PySide6.QtWidgets import (
+    QWidget,
+    QLabel,
+    QSpinBox,
+    QPushButton,
+    QTableWidget,
+    QTableWidgetItem,
+    QAbstractItemView,
+    QHeaderView,
+    QHBoxLayout,
+    QVBoxLayout
+)
+
+from cost_model import format_seconds
+from run_queue import QUEUED, RUNNING, FAILED, CANCELLED
+
+
+
+
+class JobWindow(QWidget):
+    '''
+    Window listing the runs of a RunQueue (see run_queue.py), with buttons to cancel and retry them.
+    NB the window does not poll the queue, refresh is called by the main window after every poll.
+    '''
+    COLUMNS = ['Config', 'Folder', 'Cores', 'State', 'Runtime']
+    # emitted when jobs were cancelled or retried, the queue has to be polled again
+    jobs_changed = Signal()
+
+    def __init__(self, queue):
+        super().__init__()
+        self.setWindowTitle('Runs')
+        self.resize(700, 300)
+        self.queue = queue
+
+        self.table = QTableWidget(0, len(JobWindow.COLUMNS))
+        self.table.setHorizontalHeaderLabels(JobWindow.COLUMNS)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.table.itemSelectionChanged.connect(self.update_buttons)
+
+        # cores of the next submitted runs
+        self.cores = QSpinBox()
+        self.cores.setRange(1, max(queue.max_cores, 1))
+        self.limits = QLabel()
+
+        self.cancel_button = QPushButton('Cancel')
+        self.cancel_button.clicked.connect(self.cancel)
+        self.retry_button = QPushButton('Retry')
+        self.retry_button.clicked.connect(self.retry)
+
+        button_hbox = QHBoxLayout()
+        button_hbox.addWidget(QLabel('Cores per run'))
+        button_hbox.addWidget(self.cores)
+        button_hbox.addWidget(self.limits)
+        button_hbox.addStretch()
+        button_hbox.addWidget(self.cancel_button)
+        button_hbox.addWidget(self.retry_button)
+
+        main_vbox = QVBoxLayout()
+        main_vbox.addWidget(self.table)
+        main_vbox.addLayout(button_hbox)
+        self.setLayout(main_vbox)
+        self.refresh()
+
+
+    def selected_jobs(self):
+        rows = sorted({index.row() for index in self.table.selectedIndexes()})
+        return [self.queue.jobs[row] for row in rows if row < len(self.queue.jobs)]
+
+
+    def refresh(self):
+        # NB rows are only appended, the jobs of the queue keep their order
+        for i in range(self.table.rowCount(), len(self.queue.jobs)):
+            self.table.insertRow(i)
+        for i, job in enumerate(self.queue.jobs):
+            state = job.state
+            if state == RUNNING and job.cancel_time is not None:
+                state = 'cancelling'
+            elif state == FAILED and job.returncode is not None:
+                state = 'failed (exit code %d)' % job.returncode
+            runtime = job.runtime
+            texts = [job.config_path, job.folder, str(job.cores), state, '' if runtime is None else format_seconds(runtime)]
+            for j, text in enumerate(texts):
+                item = self.table.item(i, j)
+                if item is None:
+                    self.table.setItem(i, j, QTableWidgetItem(text))
+                elif item.text() != text:
+                    item.setText(text)
+            self.table.item(i, 1).setToolTip(job.log_path)
+
+        running = self.queue.running
+        self.limits.setText('%d of %d cores in use' % (sum(job.cores for job in running), self.queue.max_cores))
+        self.update_buttons()
+
+
+    def update_buttons(self):
+        jobs = self.selected_jobs()
+        self.cancel_button.setEnabled(any(job.state in [QUEUED, RUNNING] for job in jobs))
+        self.retry_button.setEnabled(any(job.state in [FAILED, CANCELLED] for job in jobs))
+
+
+    def cancel(self):
+        for job in self.selected_jobs():
+            self.queue.cancel(job)
+        self.jobs_changed.emit()
+
+
+    def retry(self):
+        for job in self.selected_jobs():
+            self.queue.retry(job)
+        self.jobs_changed.emit()
@@ -1,21 +1,34 @@
+import copy
+import os
 import sys
-from time import time
+from time import time, strftime, localtime
 
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QAction
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QAction, QKeySequence
 from PySide6.QtWidgets import (
+    QWidget,
     QDialogButtonBox,
     QLabel,
     QTabWidget,
     QDialog,
     QFileDialog,
-    QMainWindow
+    QMessageBox,
+    QMainWindow,
+    QVBoxLayout
 )
 
 from widgets.species_editor import SpeciesEditor
 from widgets.physical_editor import PhysEditor
 from widgets.run_settings_editor import RunSettingsEditor
+from widgets.util_widgets import FileRequests
 from config_handler import ConfigHandler
+from config_diff import diff
+from runtime_model import FreeParameterSet, estimate_runtime
+from undo_history import UndoHistory
+from autosave import Autosaver, read_autosave, stale_autosaves, remove_autosave
+
+# NB the previews (QtCharts, numpy), the run queue and the cost model are imported the first time they are used,
+# like the editors of the tabs are only built when they are first shown
 
 
 
@@ -25,6 +38,7 @@ class MainWindow(QMainWindow):
         start_time = time()
 
         super().__init__()
+        self.title = title
         self.setWindowTitle(title)
 
         if fixed_size:
@@ -33,54 +47,330 @@ class MainWindow(QMainWindow):
             self.resize(width, height)
         
         self.current_file = None
+        self.preview_window = None
+        self.profile_window = None
+        self.job_window = None
         self.config = ConfigHandler()
         self.config.read_yaml('default.yaml')
 
+        # sections that differ from the saved config (or could not be collected from the editors)
+        self.dirty_sections = set()
+        # sections edited in the editors but not yet collected into the config
+        self.pending_sections = set()
+        # file and content of the last save or load, None if the config has not been saved yet
+        self.saved_file = None
+        self.saved_config = ConfigHandler(copy.deepcopy(self.config.config))
+
+        # edits are collected shortly after typing stops, to update the "modified" markers
+        self.collect_timer = QTimer(self)
+        self.collect_timer.setSingleShot(True)
+        self.collect_timer.setInterval(300)
+        self.collect_timer.timeout.connect(self.collect_pending)
+
+        self.files = FileRequests()
+        # input profiles that are being read
+        self.profile_reads = set()
+
+        # the profile preview follows the edits directly, several edits of one event loop iteration are drawn once
+        self.profile_timer = QTimer(self)
+        self.profile_timer.setSingleShot(True)
+        self.profile_timer.setInterval(0)
+        self.profile_timer.timeout.connect(self.update_profile_preview)
+
+        # unsaved edits are written to the autosave in the background, a while after typing stops
+        self.autosaver = Autosaver()
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setSingleShot(True)
+        self.autosave_timer.setInterval(5000)
+        self.autosave_timer.timeout.connect(self.autosave)
+
+        # runs of saved configs, the queue is created by the first run and polled while it has jobs
+        self.run_queue = None
+        self.run_timer = QTimer(self)
+        self.run_timer.setInterval(500)
+        self.run_timer.timeout.connect(self.poll_runs)
+
+        # edits collected from the editors, the tree of the config after the last recorded step is kept to find the next step
+        self.history = UndoHistory()
+        self.history_tree = self.config.hash_tree()
+
+        # the free parameters are counted from the config, then updated by the editors box by box
+        self.free_parameters = FreeParameterSet(self.config.config)
+        self.cost_estimate = None
+        self.runtime_label = QLabel()
+        self.statusBar().addWidget(self.runtime_label)
+
         self.file_menu = self.menuBar().addMenu('File') # NB can use "&" to emphasize a letter
         
         save_action = QAction('Save', self)
-        save_action.triggered.connect(self.save)
+        save_action.setShortcut(QKeySequence.Save)
+        save_action.triggered.connect(lambda: self.save())
         self.file_menu.addAction(save_action)
 
         load_action = QAction('Load YAML', self)
         load_action.triggered.connect(self.load_yaml)
         self.file_menu.addAction(load_action)
 
-        preview_action = QAction('Preview (dummy)', self)
-        #preview_action.triggered.connect(self.preview)
+        preview_action = QAction('Preview', self)
+        preview_action.triggered.connect(self.preview)
         self.file_menu.addAction(preview_action)
 
+        profile_action = QAction('Preview P-T Profile', self)
+        profile_action.triggered.connect(self.preview_profile)
+        self.file_menu.addAction(profile_action)
+
+        run_action = QAction('Run', self)
+        run_action.triggered.connect(self.run)
+        self.file_menu.addAction(run_action)
+
+        jobs_action = QAction('Show Runs', self)
+        jobs_action.triggered.connect(self.show_runs)
+        self.file_menu.addAction(jobs_action)
+
+        self.edit_menu = self.menuBar().addMenu('Edit')
+
+        self.undo_action = QAction('Undo', self)
+        self.undo_action.setShortcut(QKeySequence.Undo)
+        self.undo_action.triggered.connect(self.undo)
+        self.edit_menu.addAction(self.undo_action)
+
+        self.redo_action = QAction('Redo', self)
+        self.redo_action.setShortcut(QKeySequence.Redo)
+        self.redo_action.triggered.connect(self.redo)
+        self.edit_menu.addAction(self.redo_action)
+        self.update_history_actions()
+
         reset_action = QAction('Reset (dummy)', self)
         #reset_action.triggered.connect(self.reset)
         self.file_menu.addAction(reset_action)
 
-        central_tab = QTabWidget()
-        central_tab.setTabPosition(QTabWidget.North)
+        # NB tabs are only filled with their editor the first time they are shown
+        self.central_tab = QTabWidget()
+        self.central_tab.setTabPosition(QTabWidget.North)
+
+        self.pt_editor = None
+        self.phys_editor = None
+        self.species_editor = None
+
+        self.lazy_tabs = {}
+        self.tab_titles = {}
+        self.tab_sections = {}
+        self.add_lazy_tab('Run Settings', self.build_run_settings_editor, RunSettingsEditor.SECTIONS)
+        self.add_lazy_tab('Physical Parameters', self.build_phys_editor, PhysEditor.SECTIONS)
+        self.add_lazy_tab('Species', self.build_species_editor, SpeciesEditor.SECTIONS)
+        
+        self.central_tab.addTab(QLabel('To be implemented'), 'Clouds')
+
+        self.central_tab.currentChanged.connect(self.build_tab)
+        self.build_tab(self.central_tab.currentIndex())
+
+        self.setCentralWidget(self.central_tab)
+        # NB the estimate is made once the window is shown
+        self.runtime_label.setText('Runtime: estimating...')
+        QTimer.singleShot(0, self.update_cost_estimate)
+
+        init_time = (time() - start_time) * 1000
+        print('Init time: %.3f ms' % init_time)
+
+    
+    def add_lazy_tab(self, title, factory, sections):
+        # an empty container is shown until the editor is built by build_tab
+        container = QWidget()
+        container.setLayout(QVBoxLayout())
+        container.layout().setContentsMargins(0, 0, 0, 0)
+        index = self.central_tab.addTab(container, title)
+        self.lazy_tabs[index] = factory
+        self.tab_titles[index] = title
+        self.tab_sections[index] = sections
+    
+
+    def build_tab(self, index):
+        factory = self.lazy_tabs.pop(index, None)
+        if factory is None: # not a lazy tab, or already built
+            return
+        self.central_tab.widget(index).layout().addWidget(factory())
 
+
+    def build_run_settings_editor(self):
         self.pt_editor = RunSettingsEditor(self.config)
-        central_tab.addTab(self.pt_editor, 'Run Settings')
+        self.pt_editor.changed.connect(self.mark_dirty)
+        self.pt_editor.live_points.textEdited.connect(self.update_runtime)
+        self.pt_editor.show_estimate(self.cost_estimate)
+        return self.pt_editor
+    
 
+    def build_phys_editor(self):
         self.phys_editor = PhysEditor(self.config)
-        central_tab.addTab(self.phys_editor, 'Physical Parameters')
+        self.phys_editor.changed.connect(self.mark_dirty)
+        self.phys_editor.free_changed.connect(self.update_free_parameters)
+        return self.phys_editor
+    
 
+    def build_species_editor(self):
         self.species_editor = SpeciesEditor(self.config)
-        central_tab.addTab(self.species_editor, 'Species')
-        
-        central_tab.addTab(QLabel('To be implemented'), 'Clouds')
+        self.species_editor.changed.connect(self.mark_dirty)
+        self.species_editor.free_changed.connect(self.update_free_parameters)
+        return self.species_editor
 
-        self.setCentralWidget(central_tab)
 
-        init_time = (time() - start_time) * 1000
-        print('Init time: %.3f ms' % init_time)
+    @property
+    def editors(self):
+        # only editors that have been built, the sections of the others are left untouched
+        return [editor for editor in (self.pt_editor, self.phys_editor, self.species_editor) if editor is not None]
+
+    
+    def mark_dirty(self, section):
+        self.pending_sections.add(section)
+        self.dirty_sections.add(section)
+        self.update_markers()
+        self.collect_timer.start()
+        self.autosave_timer.start()
+        if self.profile_window is not None and self.profile_window.isVisible():
+            self.profile_timer.start()
+    
+
+    def collect_pending(self):
+        '''
+        Write the edited sections from the editors to the config and compare the config with the saved one.
+
+        [Returns]
+            sections that could not be collected because of invalid input
+        '''
+        self.collect_timer.stop()
+        for editor in self.editors:
+            sections = self.pending_sections.intersection(editor.SECTIONS)
+            if len(sections) == 0:
+                continue
+            try:
+                editor.write_to_config(self.config, sections)
+            except ValueError: # incomplete input, e.g. an empty truth
+                continue
+            finally:
+                self.config.invalidate(sections)
+            self.pending_sections.difference_update(sections)
+
+        # NB only the sections that were collected are hashed again
+        tree = self.config.hash_tree()
+        self.history.record(diff(self.history_tree, tree))
+        self.history_tree = tree
+        self.update_history_actions()
+
+        changes = diff(self.saved_config, tree)
+        self.dirty_sections = {change.path[0] for change in changes} | self.pending_sections
+        self.update_markers()
+        if len(changes) != 0:
+            self.update_cost_estimate()
+        return set(self.pending_sections)
+    
+
+    def update_history_actions(self):
+        self.undo_action.setEnabled(self.history.can_undo)
+        self.redo_action.setEnabled(self.history.can_redo)
+    
+
+    def undo(self):
+        # pending edits become a step first, so that they are undone first
+        self.collect_pending()
+        self.apply_history_step(self.history.undo(), reverse=True)
+    
+
+    def redo(self):
+        self.collect_pending()
+        self.apply_history_step(self.history.redo(), reverse=False)
+    
+
+    def apply_history_step(self, changes, reverse):
+        if changes is None:
+            return
+        sections = self.config.apply_changes(changes, reverse)
+        self.history_tree = self.config.hash_tree()
+
+        # only the editors of the changed sections read the config again
+        for editor in self.editors:
+            if sections.intersection(editor.SECTIONS):
+                editor.read_from_config(self.config)
+        # NB reading emits the change signals of the editors, the editors match the config already
+        self.collect_timer.stop()
+        self.pending_sections.clear()
+        self.free_parameters.reset(self.config.config)
+
+        self.dirty_sections = {change.path[0] for change in diff(self.saved_config, self.history_tree)}
+        self.update_markers()
+        self.update_history_actions()
+        self.update_cost_estimate()
+        self.autosave_timer.start()
+    
+
+    def update_free_parameters(self, section, updates):
+        self.free_parameters.update(section, updates)
+        self.update_runtime()
+    
+
+    def update_cost_estimate(self):
+        from cost_model import estimate_cost
+        try:
+            self.cost_estimate = estimate_cost(self.config.config)
+        except (KeyError, ValueError, TypeError, ZeroDivisionError): # e.g. an empty wavelength range
+            self.cost_estimate = None
+        if self.pt_editor is not None:
+            self.pt_editor.show_estimate(self.cost_estimate)
+        self.update_runtime()
+    
+
+    def update_runtime(self):
+        # the live points are read from the editor directly, so the estimate follows typing
+        try:
+            if self.pt_editor is None:
+                live_points = int(self.config['RUN SETTINGS']['live_points'])
+            else:
+                live_points = int(self.pt_editor.live_points.text())
+        except (KeyError, ValueError):
+            self.runtime_label.setText('Runtime: enter the number of live points')
+            return
+        from cost_model import format_seconds
+        call_seconds = None if self.cost_estimate is None else self.cost_estimate.call_seconds
+        runtime = estimate_runtime(live_points, len(self.free_parameters), call_seconds)
+        text = 'Runtime: %d free parameters, ~%.2g likelihood evaluations' % (runtime.n_free, runtime.evaluations)
+        if runtime.seconds is not None:
+            text += ', ~%s on one core' % format_seconds(runtime.seconds)
+            if self.cost_estimate.n_runs == 0:
+                text += ' (uncalibrated)'
+        self.runtime_label.setText(text)
+    
+
+    def update_markers(self):
+        for index, title in self.tab_titles.items():
+            if self.dirty_sections.intersection(self.tab_sections[index]):
+                title += ' *'
+            self.central_tab.setTabText(index, title)
+        self.setWindowTitle(self.title + (' *' if len(self.dirty_sections) != 0 else ''))
+    
+
+    def mark_clean(self, saved_file):
+        self.saved_file = saved_file
+        self.saved_config = ConfigHandler(copy.deepcopy(self.config.config))
+        self.pending_sections.clear()
+        self.dirty_sections.clear()
+        self.update_markers()
+        self.autosave_timer.stop()
+        self.autosaver.discard()
 
     
     def save(self, fname=None):
-        self.pt_editor.write_to_config(self.config)
-        self.species_editor.write_to_config(self.config)
-        self.phys_editor.write_to_config(self.config)
+        if fname is None:
+            fname = self.current_file if self.current_file is not None else './config.yaml'
         
-        self.config.write_yaml()
-        self.close()
+        invalid_sections = self.collect_pending()
+        if len(invalid_sections) != 0:
+            QMessageBox.warning(self, 'Save', 'Not saved, the input in %s is incomplete.' % ', '.join(sorted(invalid_sections)))
+            return
+        if len(self.dirty_sections) == 0 and fname == self.saved_file:
+            print('Nothing to save.')
+            return
+        
+        self.config.write_yaml(fname)
+        self.current_file = fname
+        self.mark_clean(fname)
     
 
     def load_yaml(self, fname=None):
@@ -90,5 +380,245 @@ class MainWindow(QMainWindow):
         fname = dialog.getOpenFileName(filter='*.yaml')[0]
         if fname != '':
             self.config.read_yaml(fname)
-            self.species_editor.table.species_dict = self.config['CHEMICAL COMPOSITION PARAMETERS']
-            self.species_editor.table.refresh()
\ No newline at end of file
+            self.reload_editors()
+            self.current_file = fname
+            self.mark_clean(fname)
+    
+
+    def reload_editors(self):
+        # after the whole config was replaced
+        self.free_parameters.reset(self.config.config)
+        self.history.clear()
+        self.history_tree = self.config.hash_tree()
+        self.update_history_actions()
+        # editors that are not built yet will read the new config when they are first shown
+        for editor in self.editors:
+            editor.read_from_config(self.config)
+        self.update_cost_estimate()
+        self.collect_timer.stop()
+    
+
+    def autosave(self):
+        self.autosave_timer.stop()
+        self.collect_pending()
+        if len(self.dirty_sections) == 0:
+            self.autosaver.discard()
+        else:
+            # NB the editors write to the config in place, the worker gets a copy
+            self.autosaver.submit(copy.deepcopy(self.config.config), self.current_file)
+    
+
+    def offer_restore(self):
+        '''
+        Offer to restore the autosaves of previous sessions that ended without saving, the newest first.
+        Declined autosaves are removed, the ones after a restored autosave are offered at the next start.
+        '''
+        for path in stale_autosaves():
+            autosave = read_autosave(path)
+            if autosave is None:
+                remove_autosave(path)
+                continue
+            source = autosave.get('source')
+            text = 'Unsaved edits from %s were found%s. Restore them?' % (
+                strftime('%Y-%m-%d %H:%M', localtime(autosave.get('time', 0))),
+                '' if source is None else ' (of %s)' % source
+            )
+            answer = QMessageBox.question(self, 'Restore', text, QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            if answer == QMessageBox.Yes:
+                self.restore(autosave)
+                # NB the restored edits are autosaved by this session before the old autosave is removed
+                self.autosave()
+                if self.autosaver.flush():
+                    remove_autosave(path)
+                return
+            remove_autosave(path)
+    
+
+    def restore(self, autosave):
+        self.config.config = autosave['config']
+        self.config.verify_sections()
+        self.reload_editors()
+
+        # the edits are unsaved, they are compared with the file they were made to (if it still exists)
+        source = autosave.get('source')
+        if source is not None and os.path.isfile(source):
+            self.current_file = source
+            self.saved_file = source
+            self.saved_config = ConfigHandler(source)
+        self.pending_sections.clear()
+        self.dirty_sections = {change.path[0] for change in diff(self.saved_config, self.config)}
+        self.update_markers()
+        self.autosave_timer.stop()
+    
+
+    def closeEvent(self, event):
+        # NB runs are not children of the window, they keep running unless they are cancelled
+        n_running = 0 if self.run_queue is None else len(self.run_queue.running) + len(self.run_queue.queued)
+        if n_running != 0:
+            answer = QMessageBox.question(self, 'Runs', '%d runs are queued or running. Cancel them?' % n_running,
+                                          QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if answer == QMessageBox.Yes:
+                self.run_queue.cancel_all()
+
+        # unsaved edits stay in the autosave, they are offered at the next start
+        self.autosave()
+        if not self.autosaver.close():
+            print('[MainWindow.closeEvent] The autosave did not finish in time.')
+        super().closeEvent(event)
+    
+
+    def run(self):
+        # the run uses the saved config, so unsaved edits are saved first
+        self.save()
+        if self.current_file is None or len(self.dirty_sections) != 0:
+            return
+        self.show_runs()
+        try:
+            self.run_queue.submit(self.current_file, self.job_window.cores.value())
+        except (OSError, KeyError) as error:
+            QMessageBox.warning(self, 'Run', 'Could not queue the run: %s' % error)
+        self.poll_runs()
+    
+
+    def show_runs(self):
+        if self.job_window is None:
+            from widgets.job_window import JobWindow
+            from run_queue import RunQueue
+            self.run_queue = RunQueue()
+            self.job_window = JobWindow(self.run_queue)
+            self.job_window.jobs_changed.connect(self.poll_runs)
+        self.job_window.show()
+        self.job_window.raise_()
+    
+
+    def poll_runs(self):
+        for job in self.run_queue.poll():
+            print('Run %d (%s): %s' % (job.job_id, job.folder, job.state))
+        if self.job_window is not None:
+            self.job_window.refresh()
+        # NB cancelled jobs are polled until they have exited
+        if self.run_queue.done:
+            self.run_timer.stop()
+        elif not self.run_timer.isActive():
+            self.run_timer.start()
+    
+
+    def preview(self):
+        from widgets.preview_window import SpectrumPreview
+        from rebinning import config_resolution
+        # the run settings tab may not be built yet, in that case the config is up to date
+        if self.pt_editor is None:
+            data_files = self.config.data_file_paths()
+            units = self.config.data_file_units()
+            wl_range = self.config['RUN SETTINGS']['wavelength_range']
+        else:
+            data_files = {name: info['path'] for name, info in self.pt_editor.data_files.write_dict().items()}
+            units = {name: info['unit'] for name, info in self.pt_editor.data_files.write_dict().items()}
+            wl_range = [self.pt_editor.wl_range.lb.value(), self.pt_editor.wl_range.ub.value()]
+
+        if self.preview_window is not None:
+            self.preview_window.close()
+        self.preview_window = SpectrumPreview(data_files, wl_range, config_resolution(self.config.config), units)
+        if self.pt_editor is not None:
+            self.pt_editor.wl_range.changed.connect(self.preview_window.set_range)
+        self.preview_window.show()
+    
+
+    def preview_profile(self):
+        if self.profile_window is None:
+            from widgets.preview_window import ProfilePreview
+            self.profile_window = ProfilePreview()
+        self.profile_window.show()
+        self.update_profile_preview()
+    
+
+    def profile_inputs(self):
+        '''
+        Values the P-T profile depends on, from the editors that are built and from the config otherwise.
+
+        [Returns]
+            TEMPERATURE PARAMETERS dictionary, parameterization, log10 pressures of the layers, path of the input profile
+        '''
+        from pt_profile import log_pressure_grid, get_parameterization
+        if self.phys_editor is None:
+            pt_params = self.config['TEMPERATURE PARAMETERS']
+            parameterization = get_parameterization(self.config.config)
+            ground_pressure = self.config['PHYSICAL PARAMETERS']['P0']['truth']
+        else:
+            pt_params = self.phys_editor.pt_params.write_to_dict()
+            parameterization = pt_params['parameterization']
+            ground_pressure = float(self.phys_editor.p0.truth.text())
+
+        if self.pt_editor is None:
+            n_layers = self.config['RUN SETTINGS']['n_layers']
+            input_profile = self.config['GROUND TRUTH DATA']['input_profile']
+        else:
+            n_layers = int(self.pt_editor.n_layers.text())
+            input_profile = self.pt_editor.input_profile.text()
+
+        top_log_pressure = self.config['RUN SETTINGS'].get('top_log_pressure', -6.)
+        return pt_params, parameterization, log_pressure_grid(top_log_pressure, ground_pressure, n_layers), input_profile
+    
+
+    def update_profile_preview(self):
+        if self.profile_window is None or not self.profile_window.isVisible():
+            return
+        from pt_profile import profile_envelope, cached_input_profile
+        try:
+            pt_params, parameterization, log_pressure, input_profile = self.profile_inputs()
+            truth, envelope = profile_envelope(pt_params, parameterization, log_pressure)
+        except (KeyError, ValueError, TypeError) as error: # e.g. a value that is being typed
+            self.profile_window.set_message('Incomplete input: %s' % error)
+            return
+
+        messages = []
+        input_data = None
+        # NB the input profile may be on a slow network mount, it is found and read in the background,
+        # and parsed again only when the stat cached by the file service shows that it changed
+        stat = self.files.service.cached_stat(input_profile)
+        if stat is None:
+            self.files.stat(input_profile, self.input_profile_found)
+            messages.append('Looking for the input profile...')
+        elif isinstance(stat, OSError):
+            messages.append('Could not load the input profile: %s' % stat)
+        else:
+            try:
+                input_data = cached_input_profile(input_profile, stat)
+            except ValueError as error:
+                messages.append('Could not load the input profile: %s' % error)
+            else:
+                if input_data is None:
+                    messages.append('Reading the input profile...')
+                    self.read_input_profile(input_profile, stat)
+        self.profile_window.set_profiles(log_pressure, truth, envelope, input_data)
+        self.profile_window.set_message('\n'.join(messages))
+    
+
+    def read_input_profile(self, path, stat):
+        # one read per file at a time, the edits in the meantime redraw with the message
+        if path in self.profile_reads:
+            return
+        self.profile_reads.add(path)
+        self.files.read(path, lambda content, error: self.input_profile_read(path, stat, content, error))
+    
+
+    def input_profile_read(self, path, stat, content, error):
+        from pt_profile import store_input_profile
+        self.profile_reads.discard(path)
+        if error is None:
+            try:
+                store_input_profile(path, stat, content)
+            except ValueError: # cached, it is shown by update_profile_preview
+                pass
+        elif self.profile_window is not None:
+            self.profile_window.set_message('Could not load the input profile: %s' % error)
+            return
+        self.profile_timer.start()
+    
+
+    def input_profile_found(self, stat, error):
+        if isinstance(error, TimeoutError):
+            self.profile_window.set_message('Could not load the input profile: %s' % error)
+        else:
+            self.profile_timer.start()
+
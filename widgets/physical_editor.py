@@ -1,4 +1,4 @@
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, Signal
 from PySide6.QtWidgets import (
     QWidget,
     QLabel,
@@ -7,6 +7,7 @@ from PySide6.QtWidgets import (
     QComboBox,
     QPushButton,
     QScrollArea,
+    QStackedWidget,
     QGroupBox,
     QHBoxLayout,
     QVBoxLayout,
@@ -21,6 +22,12 @@ from constants import PT_PARAMETERIZATIONS
 
 
 class PhysEditor(QWidget):
+    SECTIONS = ['PHYSICAL PARAMETERS', 'TEMPERATURE PARAMETERS']
+    # emitted with the name of the config section that was edited
+    changed = Signal(str)
+    # emitted with the section and a dictionary name -> whether the parameter is free, for the parameters that changed
+    free_changed = Signal(str, dict)
+
     def __init__(self, config=None):
         super().__init__()
         main_vbox = QVBoxLayout()
@@ -41,28 +48,48 @@ class PhysEditor(QWidget):
         
         self.setLayout(main_vbox)
 
+        for name, prior_box in [('P0', self.p0), ('R_pl', self.rpl), ('M_pl', self.mpl)]:
+            prior_box.changed.connect(lambda: self.changed.emit('PHYSICAL PARAMETERS'))
+            prior_box.free_changed.connect(lambda free, name=name: self.free_changed.emit('PHYSICAL PARAMETERS', {name: free}))
+        self.pt_params.changed.connect(lambda: self.changed.emit('TEMPERATURE PARAMETERS'))
+        self.pt_params.free_changed.connect(lambda updates: self.free_changed.emit('TEMPERATURE PARAMETERS', updates))
+
         if config is not None:
             self.read_from_config(config)
-            self.pt_params.read_from_dict(config['TEMPERATURE PARAMETERS'])
 
 
     def read_from_config(self, config):
         self.p0.read_from_dict(config['PHYSICAL PARAMETERS']['P0'])
         self.rpl.read_from_dict(config['PHYSICAL PARAMETERS']['R_pl'])
         self.mpl.read_from_dict(config['PHYSICAL PARAMETERS']['M_pl'])
+
+        self.pt_params.read_from_dict(config['TEMPERATURE PARAMETERS'])
     
 
-    def write_to_config(self, config):
-        config['PHYSICAL PARAMETERS']['p0'] = self.p0.write_to_dict()
-        config['PHYSICAL PARAMETERS']['R_pl'] = self.rpl.write_to_dict()
-        config['PHYSICAL PARAMETERS']['M_pl'] = self.mpl.write_to_dict()
+    def write_to_config(self, config, sections=None):
+        '''
+        sections: sections of the config to write, all sections of the editor by default
+        '''
+        if sections is None:
+            sections = PhysEditor.SECTIONS
 
-        config['TEMPERATURE PARAMETERS'] = self.pt_params.write_to_dict()
+        if 'PHYSICAL PARAMETERS' in sections:
+            config['PHYSICAL PARAMETERS']['P0'] = self.p0.write_to_dict()
+            config['PHYSICAL PARAMETERS']['R_pl'] = self.rpl.write_to_dict()
+            config['PHYSICAL PARAMETERS']['M_pl'] = self.mpl.write_to_dict()
+
+        if 'TEMPERATURE PARAMETERS' in sections:
+            config['TEMPERATURE PARAMETERS'] = self.pt_params.write_to_dict()
 
 
 
 
 class PTParamBox(QGroupBox):
+    # emitted when the parameterization or any of its parameters is changed
+    changed = Signal()
+    # emitted with a dictionary name -> whether the parameter is free, only parameters of the current parameterization count
+    free_changed = Signal(dict)
+
     def __init__(self):
         super().__init__('P-T Profile Approximation')
 
@@ -74,32 +101,70 @@ class PTParamBox(QGroupBox):
         self.parameterization = QComboBox()
         for prmz in PT_PARAMETERIZATIONS:
             self.parameterization.addItem(prmz)
-        self.parameterization.currentTextChanged.connect(self.update_params)
         parameterization_bar.addWidget(self.parameterization)
 
-        self.param_area = QScrollArea()
-        self.param_area.setWidgetResizable(True)
+        # one scrollable page per parameterization, built the first time it is selected
+        self.param_stack = QStackedWidget()
+        self.pages = {}
+        self.current_parameterization = None
 
         self.vbox = QVBoxLayout()
         self.vbox.addLayout(parameterization_bar)
-        self.vbox.addWidget(self.param_area)
+        self.vbox.addWidget(self.param_stack)
         self.setLayout(self.vbox)
 
-        self.params = {}
+        self.parameterization.currentTextChanged.connect(self.update_params)
         self.update_params()
+        self.parameterization.currentTextChanged.connect(lambda: self.changed.emit())
     
 
-    def update_params(self):
+    @property
+    def params(self):
+        # prior boxes of the current parameterization
+        return self.pages[self.parameterization.currentText()][1]
+    
+
+    def build_page(self, parameterization):
         param_widget = QWidget()
         param_vbox = QVBoxLayout()
 
-        self.params.clear()
-        for param_name in PT_PARAMETERIZATIONS[self.parameterization.currentText()]:
-            self.params[param_name] = HPriorBox(param_name)
-            param_vbox.addWidget(self.params[param_name])
-
+        params = {}
+        for param_name in PT_PARAMETERIZATIONS[parameterization]:
+            params[param_name] = HPriorBox(param_name)
+            params[param_name].changed.connect(self.changed)
+            params[param_name].free_changed.connect(
+                lambda free, param_name=param_name, parameterization=parameterization: self.emit_free_changed(parameterization, {param_name: free})
+            )
+            param_vbox.addWidget(params[param_name])
+        param_vbox.addStretch()
         param_widget.setLayout(param_vbox)
-        self.param_area.setWidget(param_widget)
+
+        param_area = QScrollArea()
+        param_area.setWidgetResizable(True)
+        param_area.setWidget(param_widget)
+        self.param_stack.addWidget(param_area)
+        return param_area, params
+
+
+    def emit_free_changed(self, parameterization, updates):
+        # boxes of hidden pages are not parameters of the profile
+        if parameterization == self.current_parameterization:
+            self.free_changed.emit(updates)
+
+
+    def update_params(self):
+        # NB pages are kept when switching, values entered for another parameterization are not lost
+        parameterization = self.parameterization.currentText()
+        if parameterization not in self.pages:
+            self.pages[parameterization] = self.build_page(parameterization)
+        self.param_stack.setCurrentWidget(self.pages[parameterization][0])
+
+        updates = {}
+        if self.current_parameterization is not None:
+            updates = {param_name: False for param_name in self.pages[self.current_parameterization][1]}
+        self.current_parameterization = parameterization
+        updates.update({param_name: param.free for param_name, param in self.params.items()})
+        self.free_changed.emit(updates)
     
 
     def read_from_dict(self, pt_dict):
@@ -0,0 +1,393 @@
+import os
+
+import numpy as np
+from PySide6.QtCore import Qt, QTimer, QPointF
+from PySide6.QtGui import QColor, QPainter, QPen
+from PySide6.QtWidgets import (
+    QWidget,
+    QLabel,
+    QPushButton,
+    QHBoxLayout,
+    QGridLayout,
+    QVBoxLayout
+)
+from PySide6.QtCharts import (
+    QChart,
+    QChartView,
+    QLineSeries,
+    QAreaSeries,
+    QValueAxis
+)
+
+from spectrum import STREAM_SIZE, load_spectrum, read_window, MinMaxPyramid
+from rebinning import constant_r_edges, rebin
+from units import DEFAULT_UNIT, parse_unit, convert_wavelength, convert_spectrum
+from pt_profile import ENVELOPE_PERCENTILES
+from widgets.util_widgets import FileRequests, path_problem
+
+
+
+
+# decimation levels of the spectra shown so far, so that reopening the preview or changing the range costs nothing
+# path -> ((size, mtime, unit, wavelength range), MinMaxPyramid)
+PYRAMID_CACHE = {}
+
+
+def get_pyramid(path, wl_range, unit=DEFAULT_UNIT):
+    '''
+    [Args]
+        path: spectrum file
+        wl_range: wavelength range of the retrieval, in the wavelength unit of DEFAULT_UNIT
+        unit: unit of the file, the spectrum is converted to DEFAULT_UNIT
+
+    [Returns]
+        MinMaxPyramid
+    '''
+    # NB called on the FileService workers, files larger than STREAM_SIZE are only read within the wavelength range the preview is opened with
+    stat = os.stat(path)
+    streamed = stat.st_size > STREAM_SIZE
+    key = (stat.st_size, stat.st_mtime_ns, unit, tuple(wl_range) if streamed else None)
+    cached = PYRAMID_CACHE.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    if streamed:
+        file_range = convert_wavelength(np.array(wl_range, dtype=float), parse_unit(DEFAULT_UNIT)[0], parse_unit(unit)[0])
+        spectrum = read_window(path, file_range)
+    else:
+        spectrum = load_spectrum(path)
+    if len(spectrum) == 0:
+        raise ValueError('no data in the wavelength range')
+    spectrum = convert_spectrum(spectrum, unit)
+    pyramid = MinMaxPyramid(spectrum.wavelength, spectrum.flux)
+    PYRAMID_CACHE[path] = (key, pyramid)
+    return pyramid
+
+
+
+
+class SpectrumPreview(QWidget):
+    '''
+    Window plotting the input spectra, with the wavelength range of the retrieval shaded.
+    With a resolution, the spectra rebinned to it within the wavelength range are drawn on top.
+    Zoom with the mouse wheel or by dragging a rectangle, pan by dragging with the middle button or with the arrow keys.
+    '''
+    def __init__(self, data_files, wl_range, resolution=None, units=None):
+        '''
+        [Args]
+            data_files: dictionary name -> path
+            wl_range: [lower, upper] wavelength range of the retrieval
+            resolution: R the spectra are rebinned to, None to only show the spectra
+            units: dictionary name -> unit of the file, the spectra are shown in DEFAULT_UNIT (the default for missing names)
+        '''
+        super().__init__()
+        self.setWindowTitle('Preview')
+        self.resize(800, 500)
+
+        self.chart = QChart()
+        self.chart_view = PreviewChartView(self.chart)
+
+        self.x_axis = QValueAxis()
+        self.x_axis.setTitleText('Wavelength [μm]')
+        self.chart.addAxis(self.x_axis, Qt.AlignmentFlag.AlignBottom)
+        self.y_axis = QValueAxis()
+        self.y_axis.setTitleText('Flux [%s]' % parse_unit(DEFAULT_UNIT)[1])
+        self.chart.addAxis(self.y_axis, Qt.AlignmentFlag.AlignLeft)
+
+        # the shaded wavelength range, the y values are set in fit_view
+        self.range_upper = QLineSeries()
+        self.range_lower = QLineSeries()
+        self.range_area = QAreaSeries(self.range_upper, self.range_lower)
+        self.range_area.setName('Wavelength Range')
+        self.range_area.setColor(QColor(0, 0, 255, 30))
+        self.range_area.setBorderColor(QColor(0, 0, 255, 80))
+        self.chart.addSeries(self.range_area)
+        self.range_area.attachAxis(self.x_axis)
+        self.range_area.attachAxis(self.y_axis)
+
+        self.wl_range = list(wl_range)
+        self.series = {}
+        self.resolution = resolution
+        # name -> series of the rebinned spectrum, updated by set_range
+        self.rebinned_series = {}
+
+        # redraws are coalesced, zooming can change the axis range several times in a row
+        self.redraw_timer = QTimer(self)
+        self.redraw_timer.setSingleShot(True)
+        self.redraw_timer.setInterval(0)
+        self.redraw_timer.timeout.connect(self.redraw)
+        self.x_axis.rangeChanged.connect(self.redraw_timer.start)
+
+        reset_button = QPushButton('Reset View')
+        reset_button.clicked.connect(self.fit_view)
+        button_bar = QHBoxLayout()
+        button_bar.addStretch()
+        button_bar.addWidget(reset_button)
+
+        # NB the spectra are loaded on the FileService, every file gets a row with its status until its series is added
+        self.files = FileRequests()
+        self.status = {}
+        status_grid = QGridLayout()
+        for i, (name, path) in enumerate(data_files.items()):
+            self.status[name] = QLabel('loading...')
+            self.status[name].setToolTip(path)
+            status_grid.addWidget(QLabel(name), i, 0)
+            status_grid.addWidget(self.status[name], i, 1)
+            unit = DEFAULT_UNIT if units is None else units.get(name, DEFAULT_UNIT)
+            self.files.watch(
+                self.files.service.submit(get_pyramid, path, list(wl_range), unit),
+                lambda pyramid, error, name=name: self.pyramid_loaded(name, pyramid, error),
+                path
+            )
+        status_grid.setColumnStretch(1, 1)
+
+        main_vbox = QVBoxLayout()
+        main_vbox.addWidget(self.chart_view)
+        main_vbox.addLayout(status_grid)
+        main_vbox.addLayout(button_bar)
+        self.setLayout(main_vbox)
+        self.fit_view()
+
+
+    def pyramid_loaded(self, name, pyramid, error):
+        if error is not None:
+            self.status[name].setText('could not load: %s' % path_problem(error))
+            return
+        self.status[name].setText('%d points' % len(pyramid.wavelength))
+
+        series = QLineSeries()
+        series.setName(name)
+        self.chart.addSeries(series)
+        series.attachAxis(self.x_axis)
+        series.attachAxis(self.y_axis)
+        self.series[name] = (series, pyramid)
+
+        if self.resolution is not None:
+            series = QLineSeries()
+            series.setName('%s (R = %s)' % (name, self.resolution))
+            series.setPen(QPen(QColor(200, 0, 0), 2))
+            self.chart.addSeries(series)
+            series.attachAxis(self.x_axis)
+            series.attachAxis(self.y_axis)
+            self.rebinned_series[name] = series
+        self.fit_view()
+
+
+    def fit_view(self):
+        x_limits = list(self.wl_range)
+        y_limits = None
+        for _, pyramid in self.series.values():
+            wl_limits, flux_limits = pyramid.wavelength_limits, pyramid.flux_limits
+            x_limits = [min(x_limits[0], wl_limits[0]), max(x_limits[1], wl_limits[1])]
+            if y_limits is None:
+                y_limits = list(flux_limits)
+            else:
+                y_limits = [min(y_limits[0], flux_limits[0]), max(y_limits[1], flux_limits[1])]
+        if y_limits is None: # nothing could be loaded
+            y_limits = [0., 1.]
+        margin = 0.05 * (y_limits[1] - y_limits[0])
+        self.y_limits = [y_limits[0] - margin, y_limits[1] + margin]
+
+        self.chart.zoomReset()
+        self.x_axis.setRange(*x_limits)
+        self.y_axis.setRange(*self.y_limits)
+        self.set_range(*self.wl_range)
+        self.redraw()
+
+
+    def set_range(self, lower, upper):
+        # the shaded area and the rebinned spectra are updated, the spectra themselves are not resampled
+        self.wl_range = [lower, upper]
+        y_lower, y_upper = self.y_limits
+        self.range_upper.replace([QPointF(lower, y_upper), QPointF(upper, y_upper)])
+        self.range_lower.replace([QPointF(lower, y_lower), QPointF(upper, y_lower)])
+        self.update_rebinned()
+
+
+    def update_rebinned(self):
+        try:
+            edges = constant_r_edges(self.resolution, *self.wl_range) if len(self.rebinned_series) != 0 else None
+        except ValueError: # e.g. an empty range while it is being edited
+            edges = None
+        for name, series in self.rebinned_series.items():
+            pyramid = self.series[name][1]
+            if edges is None or len(pyramid.wavelength) < 2:
+                series.clear()
+                continue
+            flux = rebin(pyramid.wavelength, pyramid.flux, edges)
+            # NB as steps, every bin is drawn over its width, bins not covered by the spectrum are left out
+            covered = np.isfinite(flux)
+            x = np.column_stack([edges[:-1][covered], edges[1:][covered]]).ravel()
+            series.replaceNp(x, np.repeat(flux[covered], 2))
+
+
+    def redraw(self):
+        n_pixels = self.chart.plotArea().width()
+        for series, pyramid in self.series.values():
+            x, y = pyramid.points(self.x_axis.min(), self.x_axis.max(), n_pixels)
+            series.replaceNp(x, y)
+
+
+
+
+class PreviewChartView(QChartView):
+    def __init__(self, chart):
+        super().__init__(chart)
+        self.setRubberBand(QChartView.RectangleRubberBand)
+        self.setRenderHint(QPainter.Antialiasing)
+        self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
+        self.pan_start = None
+
+
+    def wheelEvent(self, event):
+        factor = 1.25 if event.angleDelta().y() > 0 else 0.8
+        self.chart().zoom(factor)
+        event.accept()
+
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.MiddleButton:
+            self.pan_start = event.position()
+            event.accept()
+            return
+        super().mousePressEvent(event)
+
+
+    def mouseMoveEvent(self, event):
+        if self.pan_start is not None:
+            delta = event.position() - self.pan_start
+            self.chart().scroll(-delta.x(), delta.y())
+            self.pan_start = event.position()
+            event.accept()
+            return
+        super().mouseMoveEvent(event)
+
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.MouseButton.MiddleButton:
+            self.pan_start = None
+            event.accept()
+            return
+        super().mouseReleaseEvent(event)
+
+
+    def keyPressEvent(self, event):
+        step = 20
+        scrolls = {
+            Qt.Key.Key_Left: (-step, 0),
+            Qt.Key.Key_Right: (step, 0),
+            Qt.Key.Key_Up: (0, step),
+            Qt.Key.Key_Down: (0, -step)
+        }
+        if event.key() in scrolls:
+            self.chart().scroll(*scrolls[event.key()])
+        elif event.key() == Qt.Key.Key_Plus:
+            self.chart().zoomIn()
+        elif event.key() == Qt.Key.Key_Minus:
+            self.chart().zoomOut()
+        else:
+            super().keyPressEvent(event)
+
+
+
+
+class ProfilePreview(QWidget):
+    '''
+    Window plotting the P-T profile of the truth, the prior envelopes and the input profile (see pt_profile.py).
+    '''
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle('P-T Profile Preview')
+        self.resize(500, 600)
+
+        self.chart = QChart()
+        self.chart_view = PreviewChartView(self.chart)
+
+        self.x_axis = QValueAxis()
+        self.x_axis.setTitleText('Temperature [K]')
+        self.chart.addAxis(self.x_axis, Qt.AlignmentFlag.AlignBottom)
+        self.y_axis = QValueAxis()
+        self.y_axis.setTitleText('log10 Pressure [bar]')
+        self.y_axis.setReverse(True) # the ground at the bottom
+        self.chart.addAxis(self.y_axis, Qt.AlignmentFlag.AlignLeft)
+
+        # envelopes between pairs of percentiles around the median, the widest first
+        n_pairs = len(ENVELOPE_PERCENTILES) // 2
+        self.envelopes = []
+        for i in range(n_pairs):
+            lower, upper = QLineSeries(), QLineSeries()
+            area = QAreaSeries(upper, lower)
+            area.setName('%g-%g%%' % (ENVELOPE_PERCENTILES[i], ENVELOPE_PERCENTILES[-1 - i]))
+            area.setColor(QColor(0, 0, 255, 40 * (i + 1)))
+            area.setBorderColor(QColor(0, 0, 0, 0))
+            self.add_series(area)
+            self.envelopes.append((lower, upper, area))
+
+        self.median = QLineSeries()
+        self.median.setName('Prior Median')
+        self.truth = QLineSeries()
+        self.truth.setName('Truth')
+        self.input_profile = QLineSeries()
+        self.input_profile.setName('Input Profile')
+        for series, color, style in [(self.median, QColor(0, 0, 255), Qt.PenStyle.DashLine), (self.truth, QColor(0, 0, 0), Qt.PenStyle.SolidLine),
+                                     (self.input_profile, QColor(255, 0, 0), Qt.PenStyle.SolidLine)]:
+            series.setPen(QPen(color, 2, style))
+            self.add_series(series)
+
+        self.message = QLabel()
+        self.message.setWordWrap(True)
+
+        main_vbox = QVBoxLayout()
+        main_vbox.addWidget(self.chart_view)
+        main_vbox.addWidget(self.message)
+        self.setLayout(main_vbox)
+
+
+    def add_series(self, series):
+        self.chart.addSeries(series)
+        series.attachAxis(self.x_axis)
+        series.attachAxis(self.y_axis)
+
+
+    def set_message(self, message):
+        # NB the last profiles stay visible, e.g. while a value is being typed
+        self.message.setText(message)
+        self.message.setVisible(message != '')
+
+
+    def set_profiles(self, log_pressure, truth=None, envelope=None, input_profile=None):
+        '''
+        [Args]
+            log_pressure: log10 pressures of the layers
+            truth: temperatures of the truth, or None
+            envelope: array of shape (len(ENVELOPE_PERCENTILES), n_layers), or None
+            input_profile: (log10 pressure, temperature) of the input profile, or None
+        '''
+        temperatures = []
+        for i, (lower, upper, area) in enumerate(self.envelopes):
+            area.setVisible(envelope is not None)
+            if envelope is not None:
+                lower.replaceNp(envelope[i], log_pressure)
+                upper.replaceNp(envelope[-1 - i], log_pressure)
+                temperatures += [envelope[i], envelope[-1 - i]]
+
+        self.median.setVisible(envelope is not None)
+        if envelope is not None:
+            self.median.replaceNp(envelope[len(envelope) // 2], log_pressure)
+
+        self.truth.setVisible(truth is not None)
+        if truth is not None:
+            self.truth.replaceNp(truth, log_pressure)
+            temperatures.append(truth)
+
+        pressures = [log_pressure]
+        self.input_profile.setVisible(input_profile is not None)
+        if input_profile is not None:
+            self.input_profile.replaceNp(input_profile[1], input_profile[0])
+            temperatures.append(input_profile[1])
+            pressures.append(input_profile[0])
+
+        if len(temperatures) != 0:
+            self.x_axis.setRange(min(t.min() for t in temperatures), max(t.max() for t in temperatures))
+        self.y_axis.setRange(min(p.min() for p in pressures), max(p.max() for p in pressures))
+
@@ -1,4 +1,7 @@
-from PySide6.QtCore import Qt
+import os
+import stat as stat_module
+
+from PySide6.QtCore import Qt, Signal, QObject, QRunnable, QThreadPool, QTimer
 from PySide6.QtWidgets import (
     QWidget,
     QLabel,
@@ -14,17 +17,22 @@ from PySide6.QtWidgets import (
     QHBoxLayout,
     QGridLayout,
     QHeaderView,
-    QAbstractItemView
+    QAbstractItemView,
+    QFileDialog
 )
-from PySide6.QtGui import QIntValidator
+from PySide6.QtGui import QIntValidator, QBrush, QColor
 
-from widgets.util_widgets import RangeEdit
-from constants import PT_PARAMETERIZATIONS, UNITS
+from widgets.util_widgets import RangeEdit, FileRequests, path_problem
+from constants import PT_PARAMETERIZATIONS, UNITS, WAVELENGTH_LIMITS
 
 
 
 
 class RunSettingsEditor(QWidget):
+    SECTIONS = ['GROUND TRUTH DATA', 'RUN SETTINGS']
+    # emitted with the name of the config section that was edited
+    changed = Signal(str)
+
     def __init__(self, config=None):
         super().__init__()
 
@@ -33,20 +41,29 @@ class RunSettingsEditor(QWidget):
         outpath_bar.addWidget(QLabel('Output Folder:'))
         self.output_path = QLineEdit()
         outpath_bar.addWidget(self.output_path)
+        self.output_status = QLabel()
+        outpath_bar.addWidget(self.output_status)
         self.output_browse_button = QPushButton('Browse')
-        #self.output_browse_button.clicked.connect(self.browse_output)
+        self.output_browse_button.clicked.connect(self.browse_output_path)
         outpath_bar.addWidget(self.output_browse_button)
-        self.output_browse_button.setEnabled(False)
 
         profile_bar = QHBoxLayout()
 
         profile_bar.addWidget(QLabel('Input Profile:'))
         self.input_profile = QLineEdit()
         profile_bar.addWidget(self.input_profile)
+        self.profile_status = QLabel()
+        profile_bar.addWidget(self.profile_status)
         self.profile_browse_button = QPushButton('Browse')
-        #self.profile_browse_button.clicked.connect(self.browse_profile)
+        self.profile_browse_button.clicked.connect(self.browse_input_profile)
         profile_bar.addWidget(self.profile_browse_button)
-        self.profile_browse_button.setEnabled(False)
+
+        # NB the paths may be on a slow network mount, they are only accessed through the file service
+        self.files = FileRequests()
+        self.path_timer = QTimer(self)
+        self.path_timer.setSingleShot(True)
+        self.path_timer.setInterval(300)
+        self.path_timer.timeout.connect(self.check_paths)
 
         self.data_files = DataFileEditor()
         
@@ -55,6 +72,7 @@ class RunSettingsEditor(QWidget):
 
         self.wl_range = RangeEdit('Wavelength Range:')
         self.wl_range.set_unit('μm')
+        self.wl_range.set_limits(*WAVELENGTH_LIMITS)
         run_settings_bar.addWidget(self.wl_range)
 
         run_settings_bar.addWidget(QLabel('Number of Layers:'))
@@ -78,6 +96,9 @@ class RunSettingsEditor(QWidget):
 
         self.scattering = ScatteringBox()
 
+        # NB the estimate depends on the species as well, so it is computed from the config (see show_estimate)
+        self.estimate_label = QLabel()
+
         main_vbox = QVBoxLayout()
         main_vbox.addLayout(outpath_bar)
         main_vbox.addLayout(profile_bar)
@@ -85,19 +106,43 @@ class RunSettingsEditor(QWidget):
         main_vbox.addWidget(self.data_files)
         main_vbox.addLayout(run_settings_bar)
         main_vbox.addWidget(self.scattering)
+        main_vbox.addWidget(self.estimate_label)
         main_vbox.addStretch()
         self.setLayout(main_vbox)
 
+        self.input_profile.textEdited.connect(lambda: self.changed.emit('GROUND TRUTH DATA'))
+        self.input_profile.textChanged.connect(self.path_timer.start)
+        self.output_path.textChanged.connect(self.path_timer.start)
+        self.data_files.changed.connect(lambda: self.changed.emit('GROUND TRUTH DATA'))
+        for line_edit in (self.output_path, self.n_layers, self.live_points):
+            line_edit.textEdited.connect(lambda: self.changed.emit('RUN SETTINGS'))
+        self.wl_range.changed.connect(lambda *args: self.changed.emit('RUN SETTINGS'))
+        self.wl_range.changed.connect(self.data_files.set_wavelength_range)
+        for check_box in [self.cia, self.moon] + list(self.scattering.types.values()):
+            check_box.toggled.connect(lambda: self.changed.emit('RUN SETTINGS'))
+
         if config is not None:
             self.read_from_config(config)
     
 
+    def show_estimate(self, estimate):
+        '''
+        estimate: CostEstimate of the run (see cost_model.py), None if the settings are incomplete
+        '''
+        if estimate is None:
+            self.estimate_label.setText('Estimate: incomplete run settings')
+        else:
+            from cost_model import summarize
+            self.estimate_label.setText('Estimate: ' + summarize(estimate))
+    
+
     def read_from_config(self, config):
         self.input_profile.setText(config['GROUND TRUTH DATA']['input_profile'])
         self.data_files.read_from_dict(config['GROUND TRUTH DATA']['data_files'])
 
         wl_range = config['RUN SETTINGS']['wavelength_range']
         self.wl_range.set_values(wl_range[0], wl_range[1])
+        self.data_files.set_wavelength_range(wl_range[0], wl_range[1])
 
         self.output_path.setText(config['RUN SETTINGS']['output_folder'])
 
@@ -113,37 +158,63 @@ class RunSettingsEditor(QWidget):
         self.live_points.setText(str(config['RUN SETTINGS']['live_points']))
     
 
-    def write_to_config(self, config):
-        config['GROUND TRUTH DATA']['input_profile'] = self.input_profile.text()
-        config['GROUND TRUTH DATA']['data_files'] = self.data_files.write_dict()
+    def write_to_config(self, config, sections=None):
+        '''
+        sections: sections of the config to write, all sections of the editor by default
+        '''
+        if sections is None:
+            sections = RunSettingsEditor.SECTIONS
 
-        wl_range = [self.wl_range.lb.value(), self.wl_range.ub.value()]
-        config['RUN SETTINGS']['wavelength_range'] = wl_range
+        if 'GROUND TRUTH DATA' in sections:
+            config['GROUND TRUTH DATA']['input_profile'] = self.input_profile.text()
+            config['GROUND TRUTH DATA']['data_files'] = self.data_files.write_dict()
 
-        config['RUN SETTINGS']['output_folder'] = self.output_path.text()
+        if 'RUN SETTINGS' in sections:
+            wl_range = [self.wl_range.lb.value(), self.wl_range.ub.value()]
+            config['RUN SETTINGS']['wavelength_range'] = wl_range
 
-        config['RUN SETTINGS']['include_scattering']['Rayleigh'] = self.scattering['Rayleigh'].isChecked()
-        config['RUN SETTINGS']['include_scattering']['thermal'] = self.scattering['thermal'].isChecked()
-        config['RUN SETTINGS']['include_scattering']['direct_light'] = self.scattering['direct light'].isChecked()
-        config['RUN SETTINGS']['include_scattering']['clouds'] = self.scattering['clouds'].isChecked()
+            config['RUN SETTINGS']['output_folder'] = self.output_path.text()
 
-        config['RUN SETTINGS']['include_CIA'] = self.cia.isChecked()
-        config['RUN SETTINGS']['include_moon'] = self.moon.isChecked()
+            config['RUN SETTINGS']['include_scattering']['Rayleigh'] = self.scattering['Rayleigh'].isChecked()
+            config['RUN SETTINGS']['include_scattering']['thermal'] = self.scattering['thermal'].isChecked()
+            config['RUN SETTINGS']['include_scattering']['direct_light'] = self.scattering['direct light'].isChecked()
+            config['RUN SETTINGS']['include_scattering']['clouds'] = self.scattering['clouds'].isChecked()
 
-        config['RUN SETTINGS']['n_layers'] = int(self.live_points.text())
-        config['RUN SETTINGS']['live_points'] = int(self.live_points.text())
+            config['RUN SETTINGS']['include_CIA'] = self.cia.isChecked()
+            config['RUN SETTINGS']['include_moon'] = self.moon.isChecked()
 
+            config['RUN SETTINGS']['n_layers'] = int(self.n_layers.text())
+            config['RUN SETTINGS']['live_points'] = int(self.live_points.text())
 
-    def browse_input_profile(self):
-        print('Browse input profile')
+
+    def check_paths(self):
+        self.files.stat(self.input_profile.text(), lambda stat, error: self.show_path_status(self.profile_status, stat, error, False))
+        self.files.stat(self.output_path.text(), lambda stat, error: self.show_path_status(self.output_status, stat, error, True))
 
 
-    def browse_input_data(self):
-        print('Browse input data')
+    def show_path_status(self, label, stat, error, folder):
+        if error is None and stat_is_dir(stat) != folder:
+            error = 'not a folder' if folder else 'not a file'
+        label.setText('' if error is None else path_problem(error))
+        label.setToolTip('' if error is None else str(error))
+
+
+    def browse_input_profile(self):
+        def select(start):
+            path = QFileDialog.getOpenFileName(self, 'Input Profile', start)[0]
+            if path != '':
+                self.input_profile.setText(path)
+                self.changed.emit('GROUND TRUTH DATA')
+        browse_from(self.files, os.path.dirname(self.input_profile.text()), select)
 
 
     def browse_output_path(self):
-        print('Browse output path')
+        def select(start):
+            path = QFileDialog.getExistingDirectory(self, 'Output Folder', start)
+            if path != '':
+                self.output_path.setText(path)
+                self.changed.emit('RUN SETTINGS')
+        browse_from(self.files, self.output_path.text(), select)
     
 
     def check_valid(self):
@@ -153,17 +224,37 @@ class RunSettingsEditor(QWidget):
 
 
 class DataFileEditor(QWidget):
+    # emitted when a row is added, removed or edited
+    changed = Signal()
+
     def __init__(self):
         super().__init__()
 
         self.table = DataFileTable()
+        self.table.cellChanged.connect(lambda *args: self.changed.emit())
+        self.table.model().rowsInserted.connect(lambda *args: self.changed.emit())
+        self.table.model().rowsRemoved.connect(lambda *args: self.changed.emit())
+        self.table.unit_changed.connect(self.changed)
+
+        # the files are checked in the background a moment after the table or the wavelength range changed
+        self.wavelength_range = None
+        self.check_timer = QTimer(self)
+        self.check_timer.setSingleShot(True)
+        self.check_timer.setInterval(300)
+        self.check_timer.timeout.connect(self.check_files)
+        self.changed.connect(self.check_timer.start)
+        self.check_signals = DataCheckSignals()
+        self.check_signals.finished.connect(self.show_check)
+        # (path, unit, wavelength range) of the checks that are running
+        self.running_checks = set()
 
         self.add_button = QPushButton('Add')
         self.add_button.clicked.connect(self.add_entry)
         self.remove_button = QPushButton('Remove')
         self.remove_button.clicked.connect(self.remove_current_entry)
         self.browse_button = QPushButton('Browse')
-        self.browse_button.setEnabled(False)
+        self.browse_button.clicked.connect(self.browse_entry)
+        self.files = FileRequests()
 
         grid = QGridLayout()
         grid.addWidget(self.table, 0, 0, 5, 1)
@@ -192,18 +283,120 @@ class DataFileEditor(QWidget):
         return result
     
 
+    def set_wavelength_range(self, lower, upper):
+        self.wavelength_range = (lower, upper)
+        self.check_timer.start()
+    
+
+    def check_key(self, row):
+        unit = ', '.join((self.table.cellWidget(row, 2).currentText(), self.table.cellWidget(row, 3).currentText()))
+        return self.table[row,1], unit, self.wavelength_range
+    
+
+    def check_files(self):
+        if self.wavelength_range is None:
+            return
+        for i in range(self.table.rowCount()):
+            key = self.check_key(i)
+            if self.table.status_key(i) == key:
+                continue
+            self.table.set_status(i, key, 'checking...')
+            if key not in self.running_checks:
+                self.running_checks.add(key)
+                # NB the file is only read once it is known to be reachable, so a dead mount does not hang a check
+                self.files.stat(key[0], lambda stat, error, key=key: self.start_check(key, error))
+    
+
+    def start_check(self, key, error):
+        if error is None:
+            QThreadPool.globalInstance().start(DataCheckTask(key, self.check_signals))
+        else:
+            from data_checks import DataFileCheck
+            self.show_check(key, DataFileCheck(0, 0., None, [path_problem(error)]))
+    
+
+    def show_check(self, key, check):
+        self.running_checks.discard(key)
+        # NB rows may have been edited, added or removed in the meantime
+        for i in range(self.table.rowCount()):
+            if self.table.status_key(i) == key:
+                self.table.set_status(i, key, check)
+    
+
     def add_entry(self):
         self.table.add_row()
     
 
     def remove_current_entry(self):
         self.table.removeRow(self.table.currentRow())
+    
+
+    def browse_entry(self):
+        row = self.table.currentRow()
+        if row < 0:
+            self.add_entry()
+            row = self.table.rowCount() - 1
+        def select(start):
+            path = QFileDialog.getOpenFileName(self, 'Input Spectrum', start)[0]
+            if path != '' and row < self.table.rowCount():
+                self.table[row,1] = path
+                if self.table[row,0] == '':
+                    self.table[row,0] = os.path.splitext(os.path.basename(path))[0]
+        browse_from(self.files, os.path.dirname(self.table[row,1]), select)
+
+
+
+
+def stat_is_dir(stat):
+    return stat_module.S_ISDIR(stat.st_mode)
+
+
+def browse_from(files, folder, open_dialog):
+    '''
+    Call open_dialog with folder once it is known to be a reachable folder, or with the home folder otherwise,
+    so that a file dialog never starts on an unreachable mount.
+    '''
+    home = os.path.expanduser('~')
+    if folder == '':
+        open_dialog(home)
+        return
+    files.stat(folder, lambda stat, error: open_dialog(folder if error is None and stat_is_dir(stat) else home))
+
+
+
+
+class DataCheckSignals(QObject):
+    # emitted with the (path, unit, wavelength range) of a check and its DataFileCheck
+    finished = Signal(object, object)
+
+
+
+
+class DataCheckTask(QRunnable):
+    def __init__(self, key, signals):
+        super().__init__()
+        self.key = key
+        self.signals = signals
+
+
+    def run(self):
+        # NB runs in a thread of the pool, the result is delivered to the editor by a queued signal
+        # NB data_checks (numpy) is imported by the first check, off the UI thread
+        from data_checks import DataFileCheck, check_data_file
+        path, unit, wavelength_range = self.key
+        try:
+            check = check_data_file(path, wavelength_range, unit)
+        except Exception as error:
+            check = DataFileCheck(0, 0., None, ['check failed: %s' % error])
+        self.signals.finished.emit(self.key, check)
 
 
 
 
 class DataFileTable(QTableWidget):
-    COLUMNS = ['Name', 'Path', 'Wavelength Unit', 'Flux Unit']
+    COLUMNS = ['Name', 'Path', 'Wavelength Unit', 'Flux Unit', 'Status']
+    # emitted when a unit combo box is changed, these are cell widgets and do not emit cellChanged
+    unit_changed = Signal()
 
     def __init__(self):
         super().__init__(0, len(DataFileTable.COLUMNS))
@@ -241,6 +434,40 @@ class DataFileTable(QTableWidget):
         self.setCellWidget(i, 3, QComboBox())
         self.cellWidget(i, 3).addItems(UNITS['flux']['options'])
         self.cellWidget(i, 3).setCurrentText(flux_unit)
+        self.cellWidget(i, 2).currentTextChanged.connect(self.unit_changed)
+        self.cellWidget(i, 3).currentTextChanged.connect(self.unit_changed)
+        self.set_status(i, None, '')
+    
+
+    def status_key(self, row):
+        item = self.item(row, 4)
+        return None if item is None else item.data(Qt.UserRole)
+    
+
+    def set_status(self, row, key, check):
+        '''
+        [Args]
+            key: (path, unit, wavelength range) the status belongs to
+            check: DataFileCheck, or a text to show
+        '''
+        item = QTableWidgetItem()
+        item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+        item.setData(Qt.UserRole, key)
+        if not isinstance(check, str):
+            snr = 'unknown' if check.snr is None else '%.3g' % check.snr
+            details = '%d points in the range, %.1f%% coverage, SNR %s' % (check.n_points, 100 * check.coverage, snr)
+            if len(check.problems) == 0:
+                item.setText('OK (%d points, SNR %s)' % (check.n_points, snr))
+            else:
+                item.setText('; '.join(check.problems))
+                item.setForeground(QBrush(QColor(200, 0, 0)))
+            item.setToolTip(details)
+        else:
+            item.setText(check)
+        # NB the status is not part of the config, setting it must not emit cellChanged
+        self.blockSignals(True)
+        self.setItem(row, 4, item)
+        self.blockSignals(False)
     
 
     def remove_all(self):
@@ -1,4 +1,4 @@
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, Signal, QAbstractTableModel, QModelIndex, QSortFilterProxyModel
 from PySide6.QtWidgets import (
     QWidget,
     QDialog,
@@ -9,8 +9,7 @@ from PySide6.QtWidgets import (
     QComboBox,
     QPushButton,
     QDialogButtonBox,
-    QTableWidget,
-    QTableWidgetItem,
+    QTableView,
     QAbstractItemView,
     QHBoxLayout,
     QVBoxLayout,
@@ -20,18 +19,35 @@ from PySide6.QtWidgets import (
 )
 from PySide6.QtGui import QDoubleValidator
 
-from widgets.util_widgets import VPriorBox
+from widgets.util_widgets import VPriorBox, FileRequests
 from config_handler import param_dict
 from constants import SPECIES_NAMES, LINE_SPECS
+from line_catalog import get_catalog, loaded_catalog, line_name, parse_line_name
 
 
 
 
 class SpeciesEditor(QWidget):
+    SECTIONS = ['CHEMICAL COMPOSITION PARAMETERS']
+    # emitted with the name of the config section that was edited
+    changed = Signal(str)
+    # emitted with the section and a dictionary formula -> whether the abundance is free, for the species that changed
+    free_changed = Signal(str, dict)
+
     def __init__(self, config=None):
         super().__init__()
         self.table = SpeciesTable(config)
 
+        species_model = self.table.species_model
+        for model_signal in (species_model.dataChanged, species_model.rowsInserted, species_model.rowsRemoved, species_model.modelReset):
+            model_signal.connect(lambda *args: self.changed.emit('CHEMICAL COMPOSITION PARAMETERS'))
+        # NB only the affected rows are reported
+        species_model.dataChanged.connect(lambda first, last, *args: self.emit_free_changed(first.row(), last.row()))
+        species_model.rowsInserted.connect(lambda parent, first, last: self.emit_free_changed(first, last))
+        species_model.rowsAboutToBeRemoved.connect(lambda parent, first, last: self.emit_free_changed(first, last, removed=True))
+        species_model.modelAboutToBeReset.connect(lambda: self.emit_free_changed(0, species_model.rowCount() - 1, removed=True))
+        species_model.modelReset.connect(lambda: self.emit_free_changed(0, species_model.rowCount() - 1))
+
         self.buttons = {name: QPushButton(name) for name in ['Add', 'Edit', 'Remove', 'Clear']}
         self.buttons['Add'].clicked.connect(self.table.add_entry)
         self.buttons['Edit'].clicked.connect(self.table.edit_current_entry)
@@ -43,67 +59,191 @@ class SpeciesEditor(QWidget):
         for b in self.buttons.values():
             button_column.addWidget(b)
 
+        self.filter = QLineEdit()
+        self.filter.setPlaceholderText('Filter species')
+        self.filter.setClearButtonEnabled(True)
+        self.filter.textChanged.connect(self.table.set_filter)
+
+        table_column = QVBoxLayout()
+        table_column.addWidget(self.filter)
+        table_column.addWidget(self.table)
+
         layout = QHBoxLayout()
-        layout.addWidget(self.table)
+        layout.addLayout(table_column)
         layout.addLayout(button_column)
         self.setLayout(layout)
+
+        # the line catalog is brought up to date once, off the UI thread (OPACITY_DIR may be on a slow mount)
+        # NB the persisted catalog is loaded first, so the dialogs and the refresh share one catalog
+        loaded_catalog()
+        self.files = FileRequests()
+        self.files.watch(self.files.service.submit(get_catalog), self.catalog_refreshed, 'the line data')
+
+
+    def catalog_refreshed(self, catalog, error):
+        # NB a slow scan keeps running after the timeout, the dialogs use the catalog once it is done
+        if error is not None and not isinstance(error, TimeoutError):
+            print('[SpeciesEditor.catalog_refreshed] Could not scan the line data: %s' % error)
+
+
+    def emit_free_changed(self, first, last, removed=False):
+        species_list = self.table.species_list
+        updates = {species_list[row].formula: not removed and species_list[row].prior_name != '(known)' for row in range(first, last + 1)}
+        if len(updates) != 0:
+            self.free_changed.emit('CHEMICAL COMPOSITION PARAMETERS', updates)
     
 
     def read_from_config(self, config):
         self.table.read_from_config(config)
     
 
-    def write_to_config(self, config):
+    def write_to_config(self, config, sections=None):
+        # the editor has a single section
         self.table.write_to_config(config)
 
 
 
 
-class SpeciesTable(QTableWidget):
-    COLUMNS = ['Formula', 'Name', 'Lines', 'Prior', 'Truth'] #{name: i for i, name in enumerate(['Formula', 'Name', 'Lines', 'Prior', 'Truth'])}
+class SpeciesModel(QAbstractTableModel):
+    '''
+    Table model over a list of SpeciesInfo.
+    Changes have to go through add_species, update_species and remove_species, so that views only redraw the affected rows.
+    '''
+    COLUMNS = ['Formula', 'Name', 'Lines', 'Prior', 'Truth']
+    SORT_ROLE = Qt.UserRole
+
+    def __init__(self, species_list=None):
+        super().__init__()
+        self.species_list = [] if species_list is None else species_list
+    
+
+    def rowCount(self, parent=QModelIndex()):
+        # NB Qt asks for the children of items as well, a table has none
+        return 0 if parent.isValid() else len(self.species_list)
+    
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(SpeciesModel.COLUMNS)
+    
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return SpeciesModel.COLUMNS[section]
+        return super().headerData(section, orientation, role)
+    
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        species = self.species_list[index.row()]
+        column = index.column()
+
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return species.formula
+            if column == 1:
+                return SPECIES_NAMES.get(species.formula, '')
+            if column == 2:
+                return '' if species.lines is None else '; '.join(species.lines)
+            if column == 3:
+                if species.prior_name == '(known)':
+                    return ''
+                return '%s(%s)' % (species.prior_name, ', '.join(species.prior_params))
+            if column == 4:
+                return species.truth
+        
+        if role == SpeciesModel.SORT_ROLE:
+            if column == 4: # sort truths numerically, species without truth come first
+                try:
+                    return float(species.truth)
+                except ValueError:
+                    return float('-inf')
+            return self.data(index, Qt.DisplayRole)
+        
+        return None
+    
+
+    def set_species_list(self, species_list):
+        self.beginResetModel()
+        self.species_list = species_list
+        self.endResetModel()
+    
+
+    def add_species(self, species):
+        row = len(self.species_list)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.species_list.append(species)
+        self.endInsertRows()
+    
+
+    def update_species(self, species):
+        row = self.species_list.index(species)
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(SpeciesModel.COLUMNS) - 1))
+    
 
+    def remove_species(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.species_list.pop(row)
+        self.endRemoveRows()
+
+
+
+
+class SpeciesTable(QTableView):
     def __init__(self, config):
-        super().__init__(0, len(SpeciesTable.COLUMNS))
+        super().__init__()
         #self.setDragEnabled(True) # todo?: allow reordering via drag & drop
 
+        self.species_model = SpeciesModel()
+        # sorting and filtering only happen in the proxy, the order of the species list is the order in the config
+        self.proxy = QSortFilterProxyModel()
+        self.proxy.setSourceModel(self.species_model)
+        self.proxy.setSortRole(SpeciesModel.SORT_ROLE)
+        self.proxy.setFilterKeyColumn(-1) # filter on all columns
+        self.proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.setModel(self.proxy)
+
         self.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
         self.setEditTriggers(QAbstractItemView.NoEditTriggers) # diable direct editing
+        self.verticalHeader().setVisible(False)
 
-        self.setHorizontalHeaderLabels(SpeciesTable.COLUMNS)
         header = self.horizontalHeader()
         #header.setStretchLastSection(True)
-        header.setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
-        
-        #self.setSortingEnabled(True) # leads to problems when refreshing the table
+        # NB ResizeToContents measures every row on each change, which is too slow for thousands of species
+        header.setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        header.setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+
+        self.setSortingEnabled(True)
+        self.sortByColumn(-1, Qt.AscendingOrder) # start in config order
         #self.setShowGrid(False)
 
         self.read_from_config(config)
 
 
-    def __getitem__(self, key):
-        # NB don't use itemAt since its coordinates are pixels
-        return self.item(key[0], key[1]).text()
-    
+    @property
+    def species_list(self):
+        return self.species_model.species_list
+
 
-    def __setitem__(self, key, attr):
-        self.setItem(key[0], key[1], QTableWidgetItem(attr))
+    def currentRow(self):
+        # row in the species list (not in the sorted view), -1 if nothing is selected
+        index = self.currentIndex()
+        if not index.isValid():
+            return -1
+        return self.proxy.mapToSource(index).row()
+
+
+    def set_filter(self, text):
+        self.proxy.setFilterFixedString(text)
 
 
     def refresh(self):
-        self.setRowCount(0)
-        #assert(self.species_dict is not None)
-        for i, species in enumerate(self.species_list):
-            self.insertRow(i)
-            self[i,0] = species.formula
-            self[i,1] = SPECIES_NAMES[species.formula]
-            self[i,2] = '' if species.lines is None else '; '.join(species.lines)
-            if species.prior_name != '(known)':
-                self[i,3] = '%s(%s)' % (species.prior_name, ', '.join(species.prior_params))
-            self[i,4] = species.truth
+        self.species_model.set_species_list(self.species_list)
     
 
     def read_from_config(self, config):
-        self.species_list = []
+        species_list = []
         
         for formula, info in config['CHEMICAL COMPOSITION PARAMETERS'].items():
             if formula == 'mmw_inert':
@@ -121,9 +261,10 @@ class SpeciesTable(QTableWidget):
 
             species_info = SpeciesInfo()
             species_info.set_info(formula, prior_name, prior_params, truth, lines)
-            self.species_list.append(species_info)
+            species_list.append(species_info)
         
-        self.refresh()
+        self.species_model.set_species_list(species_list)
+        self.resizeColumnsToContents()
     
 
     def write_to_config(self, config):
@@ -160,13 +301,14 @@ class SpeciesTable(QTableWidget):
 
 
     def remove_all(self):
-        self.species_list.clear()
-        self.setRowCount(0)
+        self.species_model.set_species_list([])
 
 
     def remove_current_entry(self):
-        self.species_list.pop(self.currentRow())
-        self.removeRow(self.currentRow())
+        row = self.currentRow()
+        if row < 0:
+            return
+        self.species_model.remove_species(row)
 
 
 
@@ -210,6 +352,8 @@ class LineSpecGroup(QGroupBox):
         grid = QGridLayout()
         self.labels = [QLabel(spec_name) for spec_name in LINE_SPECS]
         self.specs = {}
+        # spec combinations that can be chosen, None if all can
+        self.available = None
 
         for i, spec_name in enumerate(LINE_SPECS):
             grid.addWidget(self.labels[i], i, 0)
@@ -219,6 +363,7 @@ class LineSpecGroup(QGroupBox):
             default_value = LINE_SPECS[spec_name].get('default')
             if default_value is not None:
                 self[spec_name].setCurrentText(default_value)
+            self[spec_name].currentTextChanged.connect(lambda _, start=i+1: self.update_options(start))
             grid.addWidget(self[spec_name], i, 1)
         
         self['UV'] = QCheckBox('UV')
@@ -239,6 +384,49 @@ class LineSpecGroup(QGroupBox):
         self.specs[key] = value
     
 
+    def set_available(self, specs=None, uv=True):
+        '''
+        Only offer the spec combinations for which line data exists.
+
+        [Args]
+            specs: set of tuples of values of LINE_SPECS (see LineCatalog.available_specs), None offers all options
+            uv: whether UV line data exists
+        '''
+        self.available = specs
+        self['UV'].setEnabled(uv)
+        if not uv:
+            self['UV'].setChecked(False)
+        no_data = specs is not None and len(specs) == 0
+        if no_data:
+            self.noline.setChecked(True)
+        self.noline.setEnabled(not no_data)
+        self.update_options(0)
+    
+
+    def update_options(self, start):
+        # the options of a spec depend on the values chosen for the specs before it
+        spec_names = list(LINE_SPECS)
+        for i in range(start, len(spec_names)):
+            spec_name = spec_names[i]
+            options = LINE_SPECS[spec_name]['options']
+            if self.available is not None:
+                prefix = tuple(self[name].currentText() for name in spec_names[:i])
+                values = {specs[i] for specs in self.available if specs[:i] == prefix}
+                options = [option for option in options if option in values]
+
+            combo = self[spec_name]
+            current = combo.currentText()
+            # NB the following specs are updated by this loop, not by the signal
+            combo.blockSignals(True)
+            combo.clear()
+            combo.addItems(options)
+            if current in options:
+                combo.setCurrentText(current)
+            elif LINE_SPECS[spec_name].get('default') in options:
+                combo.setCurrentText(LINE_SPECS[spec_name]['default'])
+            combo.blockSignals(False)
+    
+
     def adapt_noline(self, state):
         enable = (Qt.CheckState(state) == Qt.CheckState.Unchecked)
         for spec_widget in self.specs.values():
@@ -263,7 +451,11 @@ class SpeciesEditDialog(QDialog):
         self.formula_name = QComboBox()
         editor_grid.addWidget(self.formula_name, 1, 0, 1, 2)
         
+        # None if there is no line data folder (or it was not scanned yet), then all specs are offered
+        # NB the catalog is refreshed in the background by the SpeciesEditor
+        self.catalog = loaded_catalog()
         self.line_specs = LineSpecGroup()
+        self.formula_name.currentTextChanged.connect(self.update_line_specs)
         editor_grid.addWidget(self.line_specs, 0, 2, 6, 4)
 
         self.prior = VPriorBox('Abundance')
@@ -283,6 +475,17 @@ class SpeciesEditDialog(QDialog):
         self.read_target_info()
 
 
+    @property
+    def formula(self):
+        return self.formula_name.currentText().split(' - ')[0]
+    
+
+    def update_line_specs(self):
+        if self.catalog is None or self.formula == '':
+            return
+        self.line_specs.set_available(self.catalog.available_specs(self.formula), self.catalog.has_uv(self.formula))
+
+
     def read_target_info(self):
         # if no target, it means we are introducing a new species
         if self.target is None:
@@ -306,40 +509,37 @@ class SpeciesEditDialog(QDialog):
             param_ledit.setText(param_value)
         
         for file_name in self.target.lines:
-            if 'UV' in file_name:
+            parsed = parse_line_name(file_name)
+            if parsed is None: # NB e.g. a spec that was removed from constants.py, the default specs are shown
+                continue
+            if parsed[1] == 'UV':
                 self.line_specs['UV'].setCheckState(Qt.CheckState.Checked)
             else:
-                specs = file_name.split('_')[1:]
-                for spec_name, spec_value in zip(LINE_SPECS, specs):
+                # in the order of LINE_SPECS, so that the options of the later specs are updated first
+                for spec_name, spec_value in zip(LINE_SPECS, parsed[1]):
                     self.line_specs[spec_name].setCurrentText(spec_value)
         if len(self.target.lines) == 0:
             self.line_specs.noline.setChecked(True)
     
 
     def apply(self):
-        formula = self.formula_name.currentText().split(' - ')[0]
+        formula = self.formula
         prior_name = self.prior.kind.currentText()
         prior_params = [param.text() for param in self.prior.prior_params.values()]
         truth = self.prior.truth.text()
         if self.line_specs.noline.isChecked():
             lines = None
         else:
-            lines = []
-            line_name_tokens = [formula] + [self.line_specs[spec_name].currentText() for spec_name in LINE_SPECS]
-            line_name = '_'.join(line_name_tokens[:-1])
-            if line_name_tokens[-1] != LINE_SPECS['Resolution']['default']:
-                # remove resolution token if it's same as default
-                line_name += '_R_%s' % line_name_tokens[-1]
-            lines.append(line_name)
+            lines = [line_name(formula, [self.line_specs[spec_name].currentText() for spec_name in LINE_SPECS])]
             if self.line_specs['UV'].isChecked():
                 lines.append(formula + '_UV')
 
         if self.target is None:
             new_species = SpeciesInfo()
             new_species.set_info(formula, prior_name, prior_params, truth, lines)
-            self.parent.species_list.append(new_species)
+            self.parent.species_model.add_species(new_species)
         else:
             self.target.set_info(formula, prior_name, prior_params, truth, lines)
+            self.parent.species_model.update_species(self.target)
 
-        self.close()
-        self.parent.refresh()
\ No newline at end of file
+        self.close()
\ No newline at end of file
@@ -1,4 +1,6 @@
-from PySide6.QtCore import Qt
+import math
+
+from PySide6.QtCore import Qt, Signal, QObject, QTimer, QRectF, QPointF
 from PySide6.QtWidgets import (
     QWidget,
     QListWidget,
@@ -7,6 +9,7 @@ from PySide6.QtWidgets import (
     QDoubleSpinBox,
     QComboBox,
     QGroupBox,
+    QStackedWidget,
     QListWidgetItem,
     QTableWidgetItem,
     QAbstractItemView,
@@ -14,12 +17,81 @@ from PySide6.QtWidgets import (
     QGridLayout,
     QSizePolicy
 )
-from PySide6.QtGui import QDoubleValidator
+from PySide6.QtGui import QDoubleValidator, QPainter, QColor, QPen
 
 from abc import abstractmethod
 
 from constants import PRIOR_PARAM_NAMES
 from config_handler import param_dict
+from file_service import FS_TIMEOUT, get_file_service
+
+
+
+
+class FileRequests(QObject):
+    '''
+    Runs filesystem calls on the FileService and calls back on the UI thread, with (result, None) when the call succeeded,
+    (None, error) when it failed and (None, TimeoutError) when it did not finish within the timeout.
+    Every callback is called exactly once, results arriving after the timeout are dropped.
+    '''
+    # emitted from the workers with the request id, result and error, delivered to the UI thread by a queued connection
+    finished = Signal(int, object, object)
+
+    def __init__(self, timeout=FS_TIMEOUT, service=None):
+        super().__init__()
+        self.timeout = timeout
+        self.service = get_file_service() if service is None else service
+        # request id -> callback, until the request is finished or timed out
+        self.callbacks = {}
+        self.next_id = 0
+        self.finished.connect(self.deliver)
+
+
+    def stat(self, path, callback):
+        self.watch(self.service.stat(path), callback, path)
+
+
+    def listdir(self, path, callback):
+        self.watch(self.service.listdir(path), callback, path)
+
+
+    def read(self, path, callback, size=-1):
+        self.watch(self.service.read(path, size), callback, path)
+
+
+    def watch(self, future, callback, path=''):
+        request_id = self.next_id
+        self.next_id += 1
+        self.callbacks[request_id] = callback
+        QTimer.singleShot(int(self.timeout * 1000), lambda: self.deliver(
+            request_id, None, TimeoutError('no response from %s after %g s' % (path, self.timeout))
+        ))
+        # NB a future that is already done (e.g. a cached stat) calls back right away
+        future.add_done_callback(lambda future: self.finished.emit(request_id, *future_outcome(future)))
+
+
+    def deliver(self, request_id, result, error):
+        callback = self.callbacks.pop(request_id, None)
+        if callback is not None:
+            callback(result, error)
+
+
+
+
+def future_outcome(future):
+    error = future.exception()
+    return (None, error) if error is not None else (future.result(), None)
+
+
+def path_problem(error):
+    # short text of a failed filesystem call, for a status
+    if isinstance(error, TimeoutError):
+        return 'no response (unreachable mount?)'
+    if isinstance(error, FileNotFoundError):
+        return 'not found'
+    if isinstance(error, PermissionError):
+        return 'permission denied'
+    return error if isinstance(error, str) else getattr(error, 'strerror', None) or str(error)
 
 
 
@@ -69,7 +141,14 @@ class EditableList(QListWidget):
 class AbstractPriorBox(QGroupBox):
     '''
     Group box widget for editing true value, prior and prior parameters.
+    Each prior kind has its own page of parameter edits, built once and switched with a stacked widget,
+    so values typed for one kind are kept when switching to another kind and back.
     '''
+    # emitted whenever the truth, the prior kind or a prior parameter is changed
+    changed = Signal()
+    # emitted when the parameter becomes free (gets a prior) or fixed ('(known)')
+    free_changed = Signal(bool)
+
     def __init__(self, title):
         super().__init__(title)
         self.setSizePolicy(QSizePolicy.Maximum, QSizePolicy.Maximum)
@@ -86,19 +165,47 @@ class AbstractPriorBox(QGroupBox):
         self.grid.addWidget(QLabel('Prior:'), *self.widget_loc(1, 0))
         self.kind = QComboBox()
         self.kind.addItems(PRIOR_PARAM_NAMES)
-        self.kind.currentTextChanged.connect(self.update_params)
         self.grid.addWidget(self.kind, *self.widget_loc(1, 1))
 
+        # one page of parameters per prior kind
+        self.param_stack = QStackedWidget()
+        self.pages = {}
+        for kind, param_names in PRIOR_PARAM_NAMES.items():
+            self.pages[kind] = self.build_page(param_names)
+        self.grid.addWidget(self.param_stack, *self.widget_loc(2, 0), 1, 2)
+
+        # histogram of prior samples, redrawn only when the prior or the truth changes
+        self.histogram = PriorHistogram()
+        self.histogram_key = None
+        self.grid.addWidget(self.histogram, *self.widget_loc(3, 0), 1, 2)
+
         self.setLayout(self.grid)
 
-        self.prior_params = {}
+        self.is_free = self.free
+        self.kind.currentTextChanged.connect(self.update_params)
         self.update_params()
+
+        self.truth.textEdited.connect(self.emit_changed)
+        self.kind.currentTextChanged.connect(self.emit_changed)
+        self.changed.connect(self.update_histogram)
+        self.update_histogram()
     
 
     def __getitem__(self, key):
         return self.prior_params[key]
     
 
+    @property
+    def prior_params(self):
+        # parameter edits of the current prior kind
+        return self.pages[self.kind.currentText()][1]
+    
+
+    @property
+    def free(self):
+        return self.kind.currentText() != '(known)'
+    
+
     @abstractmethod
     def widget_loc(self, a, b):
         '''
@@ -108,41 +215,82 @@ class AbstractPriorBox(QGroupBox):
         pass
 
 
-    def update_params(self):
-        # remove old parameter widgets
-        # On deleting widgets from layout:
-        # - For unknown reason, deleteLater alone works for MainWindow, but not for Dialogs
-        # - For dialogs, removeWidget (or removeItem) has to be performed as well to make the widget disappear
-        # - Widgets other than MainWindow and Dialog were not tested
-        # - Using only removeWidget seems to move the widget out of the layout, but the widget remains in the window, at the lower left corner
-        # - Using removeWidget before applying the layout (with setLayout) crashes the program ("segmentation fault (core dumped)")
-        # TODO?: use stack layout instead
-        
-        # remove old widgets
-        for i in range(len(self.prior_params)):
-            for j in range(2):
-                item = self.grid.itemAtPosition(*self.widget_loc(i+2, j))
-                item.widget().deleteLater()
-                self.grid.removeItem(item)
-        
-        # remove all old parameters
-        self.prior_params.clear()
-        # create new parameters according to current prior
-        new_prior = self.kind.currentText()
-        for i, param_name in enumerate(PRIOR_PARAM_NAMES[new_prior]):
-            self.grid.addWidget(QLabel(param_name + ':'), *self.widget_loc(i+2, 0))
+    def build_page(self, param_names):
+        page = QWidget()
+        page_grid = QGridLayout()
+        page_grid.setContentsMargins(0, 0, 0, 0)
+
+        param_edits = {}
+        for i, param_name in enumerate(param_names):
+            page_grid.addWidget(QLabel(param_name + ':'), *self.widget_loc(i, 0))
             param_edit = QLineEdit()
             param_edit.setValidator(QDoubleValidator())
-            self.grid.addWidget(param_edit, *self.widget_loc(i+2, 1))
-            self.prior_params[param_name] = param_edit
+            param_edit.textEdited.connect(self.emit_changed)
+            page_grid.addWidget(param_edit, *self.widget_loc(i, 1))
+            param_edits[param_name] = param_edit
+        
+        page.setLayout(page_grid)
+        self.param_stack.addWidget(page)
+        return page, param_edits
+
+
+    def emit_changed(self, *args):
+        self.changed.emit()
+
+
+    def update_params(self):
+        # NB the pages are only switched, no widget is created or deleted here
+        self.param_stack.setCurrentWidget(self.pages[self.kind.currentText()][0])
+        if self.free != self.is_free:
+            self.is_free = self.free
+            self.free_changed.emit(self.is_free)
+    
+
+    def update_histogram(self):
+        kind = self.kind.currentText()
+        try:
+            truth = float(self.truth.text())
+        except ValueError:
+            truth = None
+        try:
+            params = tuple(float(param.text()) for param in self.prior_params.values())
+        except ValueError:
+            params = None
+
+        key = (kind, params, truth)
+        if key == self.histogram_key:
+            return
+        self.histogram_key = key
+
+        if kind == '(known)':
+            self.histogram.clear('fixed')
+            return
+        if params is None:
+            self.histogram.clear('incomplete prior')
+            return
+        # NB imported here, numpy is not needed until the first prior is drawn
+        from prior_sampling import prior_histogram
+        try:
+            edges, counts, log = prior_histogram(kind, params)
+        except ValueError:
+            self.histogram.clear('invalid prior')
+            return
+        if log and truth is not None:
+            truth = math.log10(truth) if truth > 0 else None
+        self.histogram.set_histogram(edges, counts, log, truth)
     
 
     def read_from_dict(self, prior):
-        self.truth.setText(str(prior['truth']))
-        self.kind.setCurrentText(prior['prior']['kind'])
-        prior_params = prior['prior']['prior_specs']
-        for param_name in prior_params.keys():
-            self.prior_params[param_name].setText(str(prior_params[param_name]))
+        self.truth.setText(str(prior.get('truth', '')))
+        if 'prior' not in prior:
+            self.kind.setCurrentText('(known)')
+        else:
+            self.kind.setCurrentText(prior['prior']['kind'])
+            prior_params = prior['prior']['prior_specs']
+            for param_name in prior_params.keys():
+                self.prior_params[param_name].setText(str(prior_params[param_name]))
+        # NB setText does not emit textEdited
+        self.update_histogram()
     
 
     def write_to_dict(self):
@@ -154,6 +302,65 @@ class AbstractPriorBox(QGroupBox):
 
 
 
+class PriorHistogram(QWidget):
+    '''
+    Small plot of the histogram of prior samples (see prior_sampling.prior_histogram), with the truth marked.
+    '''
+    def __init__(self):
+        super().__init__()
+        self.setFixedSize(140, 60)
+        self.edges = None
+        self.counts = None
+        self.log = False
+        self.truth = None
+        self.message = ''
+    
+
+    def set_histogram(self, edges, counts, log=False, truth=None):
+        self.edges, self.counts, self.log, self.truth = edges, counts, log, truth
+        self.message = ''
+        self.update()
+    
+
+    def clear(self, message=''):
+        self.edges = self.counts = self.truth = None
+        self.message = message
+        self.update()
+    
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        width, height = self.width(), self.height()
+        text_height = painter.fontMetrics().height()
+        if self.edges is None:
+            painter.setPen(self.palette().color(self.palette().ColorRole.PlaceholderText))
+            painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, self.message)
+            return
+
+        # bars in the upper part, the range below
+        plot_height = height - text_height
+        lower, upper = float(self.edges[0]), float(self.edges[-1])
+        scale = width / (upper - lower) if upper > lower else 0.
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(QColor(0, 0, 255, 120))
+        for left, right, count in zip(self.edges[:-1], self.edges[1:], self.counts):
+            bar_height = count * plot_height
+            painter.drawRect(QRectF((left - lower) * scale, plot_height - bar_height, (right - left) * scale, bar_height))
+
+        if self.truth is not None and lower <= self.truth <= upper:
+            painter.setPen(QPen(QColor(255, 0, 0), 2))
+            x = (self.truth - lower) * scale
+            painter.drawLine(QPointF(x, 0), QPointF(x, plot_height))
+
+        painter.setPen(self.palette().color(self.palette().ColorRole.Text))
+        label_rect = QRectF(0, plot_height, width, text_height)
+        prefix = 'log ' if self.log else ''
+        painter.drawText(label_rect, Qt.AlignmentFlag.AlignLeft, prefix + '%.3g' % lower)
+        painter.drawText(label_rect, Qt.AlignmentFlag.AlignRight, '%.3g' % upper)
+
+
+
+
 class VPriorBox(AbstractPriorBox):
     def __init__(self, title='Prior'):
         super().__init__(title)
@@ -179,6 +386,9 @@ class HPriorBox(AbstractPriorBox):
 
 
 class RangeEdit(QWidget):
+    # emitted with the new lower and upper bound
+    changed = Signal(float, float)
+
     def __init__(self, name=None):
         super().__init__()
         hbox = QHBoxLayout()
@@ -203,6 +413,9 @@ class RangeEdit(QWidget):
         self.ub.valueChanged.connect(self.check_lower_bound)
         hbox.addWidget(self.ub)
 
+        self.lb.valueChanged.connect(self.emit_changed)
+        self.ub.valueChanged.connect(self.emit_changed)
+
         self.setLayout(hbox)
     
 
@@ -233,6 +446,15 @@ class RangeEdit(QWidget):
             self.lb.setValue(self.ub.value())
     
 
+    def emit_changed(self):
+        self.changed.emit(self.lb.value(), self.ub.value())
+    
+
+    def set_limits(self, minimum, maximum):
+        self.lb.setRange(minimum, maximum)
+        self.ub.setRange(minimum, maximum)
+    
+
     def set_values(self, lb, ub):
         self.lb.setValue(lb)
         self.ub.setValue(ub)
@@ -0,0 +1,100 @@
+'''
+Reading and writing of config files.
+
+The LibYAML based loader and dumper (yaml.CSafeLoader and yaml.CDumper) are used when PyYAML was built with them,
+otherwise the pure Python implementations are used.
+The C dumper folds and quotes some strings differently from the Python dumper,
+so it is only used for data whose output is known to be identical: plain containers and scalars,
+strings of printable ASCII characters and short non-empty keys.
+Everything else is dumped by the Python dumper, so the files do not depend on how PyYAML was installed.
+'''
+import os
+
+import yaml
+
+
+
+
+YAML_HEADER = '# This config file is generated by a GUI.\n# Editting is discouraged unless you know what you are doing.\n'
+
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+FastDumper = getattr(yaml, 'CDumper', None)
+
+# NB longer keys may be written as complex keys ("? key") by one dumper but not the other
+MAX_FAST_KEY_LENGTH = 64
+SCALAR_TYPES = (bool, int, float, type(None))
+
+
+
+
+def load_yaml(stream):
+    '''
+    Same as yaml.safe_load, but using the C loader if available.
+    '''
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def dump_yaml(data, stream=None, header=False):
+    '''
+    Same as yaml.dump(data, stream, sort_keys=False), but using the C dumper where the output is identical.
+
+    [Args]
+        data: data to dump
+        stream: file object, if None the YAML string is returned
+        header: whether to prepend YAML_HEADER
+    '''
+    dumper = FastDumper if FastDumper is not None and fast_dumpable(data) else yaml.Dumper
+    text = yaml.dump(data, Dumper=dumper, sort_keys=False)
+    if header:
+        text = YAML_HEADER + text
+    if stream is None:
+        return text
+    stream.write(text)
+
+
+def write_yaml_file(data, path, header=False, sync=True):
+    '''
+    Dump data to a file atomically (to a temporary file that is then renamed), so that a crash never leaves a half-written file.
+
+    [Args]
+        data: data to dump
+        path: path of the file
+        header: whether to prepend YAML_HEADER
+        sync: whether to flush the file to disk before renaming it, can be skipped for files that are easily regenerated
+    '''
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'w') as yaml_file:
+            dump_yaml(data, yaml_file, header)
+            if sync:
+                yaml_file.flush()
+                os.fsync(yaml_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def fast_dumpable(data):
+    '''
+    Check whether the C dumper writes exactly the same as the Python dumper for data.
+    '''
+    if type(data) is str:
+        return data.isascii() and data.isprintable()
+    if type(data) in SCALAR_TYPES:
+        return True
+    if type(data) is list:
+        return all(fast_dumpable(item) for item in data)
+    if type(data) is dict:
+        for key, value in data.items():
+            if type(key) is str:
+                if len(key) == 0 or len(key) > MAX_FAST_KEY_LENGTH:
+                    return False
+            elif type(key) not in SCALAR_TYPES:
+                return False
+            if not (fast_dumpable(key) and fast_dumpable(value)):
+                return False
+        return True
+    # tuples, numpy scalars, ... are left to the Python dumper
+    return False
\ No newline at end of file